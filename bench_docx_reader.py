@@ -0,0 +1,100 @@
+"""
+Бенчмарк чтения DOCX: python-docx против потокового разбора XML (скорость, память, полнота текста)
+"""
+import argparse
+import random
+import re
+import time
+import tracemalloc
+from pathlib import Path
+from benchmark import build_contract, ORG_NAMES, LEGAL_FORMS, PERSONS, CITIES
+from config import DATA_DIR, OUTPUT_DIR
+from document_reader import DOCX_ENGINES, DocumentReader
+
+
+WORD_RE = re.compile(r'\w+')
+
+
+def build_docx(path: Path, size: int, seed: int):
+    """Синтетический договор: абзацы текста, таблица реквизитов сторон и колонтитулы"""
+    import docx
+    
+    rng = random.Random(seed)
+    document = docx.Document()
+    section = document.sections[0]
+    section.header.paragraphs[0].text = f"{rng.choice(LEGAL_FORMS)} «{rng.choice(ORG_NAMES)}» - договор поставки"
+    section.footer.paragraphs[0].text = f"{rng.choice(CITIES)}, исполнитель {rng.choice(PERSONS)}"
+    for paragraph in build_contract(size, seed).split('\n'):
+        document.add_paragraph(paragraph)
+    
+    table = document.add_table(rows=1, cols=3)
+    for cell, title in zip(table.rows[0].cells, ('Сторона', 'Организация', 'Подписант')):
+        cell.text = title
+    for role in ('Заказчик', 'Поставщик', 'Грузополучатель'):
+        cells = table.add_row().cells
+        cells[0].text = role
+        cells[1].text = f"{rng.choice(LEGAL_FORMS)} «{rng.choice(ORG_NAMES)}{rng.randint(1, 99)}»"
+        cells[2].text = rng.choice(PERSONS)
+    document.save(path)
+
+
+def measure(reader: DocumentReader, paths, repeat: int):
+    """Лучшее время чтения всех файлов, пиковая память на самом большом файле и тексты"""
+    texts = [reader.read_docx(path) for path in paths]
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for path in paths:
+            reader.read_docx(path)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    
+    tracemalloc.start()
+    reader.read_docx(max(paths, key=lambda path: path.stat().st_size))
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, texts
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Скорость, память и полнота чтения DOCX разными способами')
+    parser.add_argument('--dir', type=str, default=str(DATA_DIR), help='Директория с DOCX-файлами')
+    parser.add_argument('--synthetic', type=int, default=0,
+                        help='Число синтетических договоров с таблицей и колонтитулами вместо --dir')
+    parser.add_argument('--size', type=int, default=200000, help='Размер текста синтетического договора в байтах')
+    parser.add_argument('--repeat', type=int, default=3, help='Число повторов замера')
+    args = parser.parse_args()
+    
+    if args.synthetic:
+        corpus_dir = OUTPUT_DIR / ".bench" / f"docx_rich_{args.size}_{args.synthetic}"
+        corpus_dir.mkdir(parents=True, exist_ok=True)
+        paths = []
+        for i in range(args.synthetic):
+            path = corpus_dir / f"contract_{i:06d}.docx"
+            if not path.exists():
+                build_docx(path, args.size, i)
+            paths.append(path)
+    else:
+        paths = sorted(Path(args.dir).glob("*.docx"))
+    if not paths:
+        print(f"DOCX-файлы не найдены: {args.dir}")
+        return
+    
+    total_bytes = sum(path.stat().st_size for path in paths)
+    print(f"Файлов: {len(paths)}, {total_bytes / 1024:.0f} КБ")
+    words = {}
+    for engine in DOCX_ENGINES:
+        elapsed, peak, texts = measure(DocumentReader(docx_engine=engine), paths, args.repeat)
+        words[engine] = [set(WORD_RE.findall(text.lower())) for text in texts]
+        print(f"  {engine:<12} {elapsed:8.3f} с  ({total_bytes / 1024 / 1024 / elapsed:6.1f} МБ/с), "
+              f"пик памяти {peak / 1024 / 1024:6.1f} МБ, символов {sum(len(text) for text in texts)}")
+    
+    base, stream = words['python-docx'], words['stream']
+    missing = sum(len(b - s) for b, s in zip(base, stream))
+    extra = sum(len(s - b) for b, s in zip(base, stream))
+    print(f"Уникальных слов python-docx: {sum(len(b) for b in base)}, потоковое чтение: {sum(len(s) for s in stream)}")
+    print(f"Только потоковое чтение (таблицы, колонтитулы, сноски): {extra}, потеряно потоковым: {missing}")
+
+
+if __name__ == "__main__":
+    main()
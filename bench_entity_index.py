@@ -0,0 +1,74 @@
+"""
+Бенчмарк поиска сущностей: линейный перебор против EntityIndex на синтетическом договоре
+"""
+import argparse
+import random
+import time
+from entity_records import Entity
+from relation_extractor import RelationExtractor
+
+
+ORG_NAMES = ['Ромашка', 'ПромТрансНефть', 'Вектор', 'Альянс', 'СтройИнвест', 'ТехноСервис',
+             'Меридиан', 'Гранит', 'Северсталь', 'Логистик', 'Энергосбыт', 'Капитал']
+LEGAL_FORMS = ['ООО', 'АО', 'ПАО', 'ЗАО']
+VERBS = ['поставляет', 'получает', 'контролирует', 'закупает', 'продает', 'управляет']
+FILLER = ['в', 'соответствии', 'с', 'условиями', 'настоящего', 'договора', 'сторона', 'обязуется',
+          'оплатить', 'товар', 'в', 'срок', 'и', 'надлежащего', 'качества']
+
+
+def build_synthetic_contract(num_entities: int, num_sentences: int, seed: int = 42):
+    """Строит синтетический договор с заданным числом сущностей и предложений"""
+    rng = random.Random(seed)
+    entities = []
+    for i in range(num_entities):
+        name = f"{rng.choice(ORG_NAMES)}{i}"
+        entities.append(Entity(f"{rng.choice(LEGAL_FORMS)} «{name}»", 'ORG', 0, 0))
+    
+    sentences = []
+    for _ in range(num_sentences):
+        source = rng.choice(entities).text.split('«')[1].rstrip('»')
+        target = rng.choice(entities).text.split('«')[1].rstrip('»')
+        filler = ' '.join(rng.choice(FILLER) for _ in range(rng.randint(3, 10)))
+        sentences.append(f"{source} {rng.choice(VERBS)} {target} {filler}.")
+    
+    return ' '.join(sentences), entities
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк EntityIndex против линейного поиска сущностей')
+    parser.add_argument('--entities', type=int, default=500, help='Количество сущностей в документе')
+    parser.add_argument('--sentences', type=int, default=5000, help='Количество предложений в документе')
+    args = parser.parse_args()
+    
+    text, entities = build_synthetic_contract(args.entities, args.sentences)
+    extractor = RelationExtractor()
+    
+    # Запросы - слова из всех совпадений паттернов, как в extract_relations_pattern
+    queries = [
+        word
+        for matches in extractor._match_patterns(text)
+        for source, target, _, _ in matches
+        for word in (source, target)
+    ]
+    print(f"Документ: {len(text)} символов, сущностей: {len(entities)}, запросов: {len(queries)}")
+    
+    start = time.perf_counter()
+    entity_dict = {e.text: e for e in entities}
+    linear = [extractor._find_entity(query, entity_dict) for query in queries]
+    linear_time = time.perf_counter() - start
+    
+    start = time.perf_counter()
+    index = extractor.build_entity_index(entities)
+    build_time = time.perf_counter() - start
+    indexed = [index.find(query) for query in queries]
+    index_time = time.perf_counter() - start
+    
+    assert all(a is b for a, b in zip(linear, indexed)), "Результаты поиска различаются"
+    
+    print(f"Линейный перебор: {linear_time:.3f} с")
+    print(f"EntityIndex:      {index_time:.3f} с (из них построение индекса {build_time:.3f} с)")
+    print(f"Ускорение:        {linear_time / index_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
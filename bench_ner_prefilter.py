@@ -0,0 +1,79 @@
+"""
+Бенчмарк отбора предложений перед NER: полнота сущностей и ускорение относительно полного прогона
+"""
+import argparse
+import time
+from pathlib import Path
+from benchmark import build_contract
+from config import DATA_DIR
+from ner_prefilter import SentencePrefilter
+from pipeline import DocumentPipeline
+
+
+def load_texts(args, pipeline: DocumentPipeline):
+    """Тексты документов из директории или синтетические договоры (--synthetic)"""
+    if args.synthetic:
+        return [build_contract(args.size, seed) for seed in range(args.synthetic)]
+    dir_path = Path(args.dir)
+    paths = sorted(list(dir_path.glob("*.docx")) + list(dir_path.glob("*.pdf")) + list(dir_path.glob("*.txt")))
+    return [pipeline.doc_reader.read_document(path) for path in paths]
+
+
+def run_ner(ner, texts, chunks):
+    """Сущности (тип, начало, конец) каждого документа в координатах документа и время прогона"""
+    start = time.perf_counter()
+    found = []
+    for text, spans in zip(texts, chunks):
+        entities = ner.extract_batch([text[chunk_start:chunk_end] for chunk_start, chunk_end in spans])
+        found.append({
+            (entity.type, chunk_start + entity.start, chunk_start + entity.end)
+            for (chunk_start, _), chunk_entities in zip(spans, entities)
+            for entity in chunk_entities
+        })
+    return found, time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Полнота и скорость NER с отбором предложений-кандидатов')
+    parser.add_argument('--dir', type=str, default=str(DATA_DIR), help='Директория с документами')
+    parser.add_argument('--synthetic', type=int, default=0, help='Число синтетических договоров вместо --dir')
+    parser.add_argument('--size', type=int, default=50000, help='Размер синтетического договора в байтах')
+    parser.add_argument('--context', type=int, default=1, help='Соседних предложений вокруг кандидата')
+    args = parser.parse_args()
+    
+    pipeline = DocumentPipeline(use_cache=False)
+    texts = load_texts(args, pipeline)
+    if not texts:
+        print(f"Документы не найдены: {args.dir}")
+        return
+    chunks = [pipeline._chunk_spans(text) for text in texts]
+    ner = pipeline.ner_extractor
+    prefilter = SentencePrefilter(args.context)
+    ner.extract_batch([texts[0][:1000]])  # Прогрев: загрузка моделей не входит в замер
+    
+    ner.prefilter = None
+    full, full_time = run_ner(ner, texts, chunks)
+    ner.prefilter = prefilter
+    reduced, reduced_time = run_ner(ner, texts, chunks)
+    
+    total = sum(len(entities) for entities in full)
+    kept = sum(len(entities & found) for entities, found in zip(full, reduced))
+    extra = sum(len(found - entities) for entities, found in zip(full, reduced))
+    selected = sum(
+        end - start
+        for text, spans in zip(texts, chunks)
+        for chunk_start, chunk_end in spans
+        for start, end in prefilter.select(text[chunk_start:chunk_end])
+    )
+    length = sum(chunk_end - chunk_start for spans in chunks for chunk_start, chunk_end in spans)
+    
+    print(f"Документов: {len(texts)}, символов в чанках: {length}, сущностей при полном NER: {total}")
+    print(f"Доля текста для NER: {selected / length:.1%}")
+    print(f"Полнота:             {kept / total if total else 1.0:.1%} (новых сущностей: {extra})")
+    print(f"Полный NER:          {full_time:.3f} с")
+    print(f"С отбором:           {reduced_time:.3f} с")
+    print(f"Ускорение:           {full_time / reduced_time:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+"""
+Воспроизводимый бенчмарк пайплайна на синтетических договорах: замер компонентов, базовая линия и сравнение
+"""
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Callable, Dict, List
+from pipeline import DocumentPipeline
+from entity_records import Entity, Relation
+from config import OUTPUT_DIR, DOC_BATCH_SIZE
+
+
+COMPONENTS = ['reader', 'ner', 'relations', 'classifier', 'chains', 'pipeline']
+
+ORG_NAMES = ['Ромашка', 'ПромТрансНефть', 'Вектор', 'Альянс', 'СтройИнвест', 'ТехноСервис',
+             'Меридиан', 'Гранит', 'Северсталь', 'Логистик', 'Энергосбыт', 'Капитал']
+LEGAL_FORMS = ['ООО', 'АО', 'ПАО', 'ЗАО']
+PERSONS = ['Иванова Петра Сергеевича', 'Смирновой Анны Викторовны', 'Кузнецова Олега Игоревича',
+           'Поповой Марии Андреевны', 'Соколова Дмитрия Павловича']
+CITIES = ['г. Москва', 'г. Санкт-Петербург', 'г. Казань', 'г. Екатеринбург', 'г. Новосибирск']
+RELATION_SENTENCES = [
+    '{a} заключил договор с {b} на поставку оборудования.',
+    '{a} поставляет {b} товары надлежащего качества.',
+    '{a} получает от {b} оплату в течение 10 рабочих дней.',
+    '{a} закупает у {b} материалы для строительства.',
+    '{a} контролирует {b} в части соблюдения сроков.',
+    '{a} взаимодействует с {b} по вопросам логистики.',
+    '{a} отчитывается перед {b} о ходе выполнения работ.',
+]
+CLAUSES = [
+    'Поставщик обязуется передать товар в собственность Заказчика, а Заказчик обязуется принять и оплатить товар.',
+    'Оплата производится безналичным путем на расчетный счет Поставщика в соответствии с бюджетом закупки.',
+    'Стороны обязуются соблюдать конфиденциальность финансовой и коммерческой информации.',
+    'Заявки на поставку направляются в электронной системе документооборота.',
+    'Бухгалтерия Заказчика ведет учет и налоговую отчетность по настоящему контракту.',
+    'Обучение персонала и подбор сотрудников осуществляются силами Исполнителя.',
+    'Претензии клиентов рассматриваются в течение 30 календарных дней.',
+]
+
+
+def parse_size(value: str) -> int:
+    """Разбирает размер вида 1KB, 512KB, 5MB или число байт"""
+    units = {'KB': 1024, 'MB': 1024 * 1024, 'B': 1}
+    value = value.strip().upper()
+    for unit, multiplier in units.items():
+        if value.endswith(unit):
+            return int(float(value[:-len(unit)]) * multiplier)
+    return int(value)
+
+
+def build_contract(size: int, seed: int) -> str:
+    """Строит синтетический договор на русском языке размером около size байт (UTF-8)"""
+    rng = random.Random(seed)
+    orgs = [f"{rng.choice(LEGAL_FORMS)} «{rng.choice(ORG_NAMES)}{rng.randint(1, 99)}»" for _ in range(6)]
+    customer, supplier = orgs[0], orgs[1]
+    
+    paragraphs = [
+        f"ДОГОВОР ПОСТАВКИ № {rng.randint(1, 9999)}/{rng.randint(20, 26)}",
+        f"{rng.choice(CITIES)}",
+        f"{customer}, именуемое в дальнейшем «Заказчик», в лице Генерального директора {rng.choice(PERSONS)}, "
+        f"и {supplier}, именуемое в дальнейшем «Поставщик», в лице директора {rng.choice(PERSONS)}, "
+        f"заключили настоящий договор о нижеследующем.",
+    ]
+    length = sum(len(p.encode('utf-8')) + 1 for p in paragraphs)
+    section = 1
+    while length < size:
+        sentences = [f"{section}. Предмет и условия раздела {section}."]
+        for _ in range(rng.randint(3, 8)):
+            if rng.random() < 0.4:
+                a, b = rng.sample(orgs, 2)
+                sentences.append(rng.choice(RELATION_SENTENCES).format(a=a, b=b))
+            else:
+                sentences.append(rng.choice(CLAUSES))
+        paragraph = ' '.join(sentences)
+        paragraphs.append(paragraph)
+        length += len(paragraph.encode('utf-8')) + 1
+        section += 1
+    
+    # Обрезаем до размера в байтах, не разрывая символы UTF-8
+    return '\n'.join(paragraphs).encode('utf-8')[:size].decode('utf-8', errors='ignore')
+
+
+def build_corpus(corpus_dir: Path, files: int, size: int, seed: int, file_format: str = 'txt') -> List[Path]:
+    """Создает корпус синтетических договоров (существующий корпус с теми же параметрами переиспользуется)"""
+    corpus_dir.mkdir(parents=True, exist_ok=True)
+    paths = []
+    for i in range(files):
+        path = corpus_dir / f"contract_{i:06d}.{file_format}"
+        paths.append(path)
+        if path.exists():
+            continue
+        
+        text = build_contract(size, seed + i)
+        if file_format == 'docx':
+            import docx
+            document = docx.Document()
+            for paragraph in text.split('\n'):
+                document.add_paragraph(paragraph)
+            document.save(path)
+        else:
+            path.write_text(text, encoding='utf-8')
+    return paths
+
+
+class Benchmark:
+    """Замер компонентов пайплайна на корпусе документов"""
+    
+    def __init__(self, paths: List[Path], repeat: int = 3, doc_batch: int = DOC_BATCH_SIZE):
+        self.paths = paths
+        self.repeat = repeat
+        self.doc_batch = doc_batch
+        self.pipeline = DocumentPipeline(use_cache=False)
+        self.input_bytes = sum(path.stat().st_size for path in paths)
+        self.results = {}
+        
+        # Входные данные компонентов готовятся один раз и в замер не входят
+        self.texts = None
+        self.chunks = None
+        self.chunk_entities = None
+        self.outputs = None
+        self.graphs = None
+    
+    def _measure(self, name: str, run: Callable[[], None]):
+        """Запускает run repeat раз и запоминает лучшее время"""
+        runs = []
+        for _ in range(self.repeat):
+            started = time.perf_counter()
+            run()
+            runs.append(time.perf_counter() - started)
+        
+        best = min(runs)
+        self.results[name] = {
+            'seconds': best,
+            'runs': runs,
+            'docs_per_s': len(self.paths) / best if best else None,
+            'mb_per_s': self.input_bytes / (1024 * 1024) / best if best else None,
+        }
+        print(f"  {name:<12} {best:10.4f} с  ({self.results[name]['docs_per_s']:.1f} док/с)")
+    
+    def _prepare(self):
+        """Текст, чанки, сущности и результаты документов для замера отдельных компонентов"""
+        if self.texts is not None:
+            return
+        self.texts = [self.pipeline.doc_reader.read_document(path) for path in self.paths]
+        self.chunks = [self.pipeline._chunk_spans(text) for text in self.texts]
+        self.chunk_entities = [
+            self.pipeline.ner_extractor.extract_batch([text[start:end] for start, end in chunks])
+            for text, chunks in zip(self.texts, self.chunks)
+        ]
+        # Связи ищутся в координатах документа (offset чанка и общий индекс ключевых слов),
+        # поэтому сущности переводятся в них так же, как в _build_result
+        for chunks, entities in zip(self.chunks, self.chunk_entities):
+            for (chunk_start, _), found in zip(chunks, entities):
+                for entity in found:
+                    entity.start += chunk_start
+                    entity.end += chunk_start
+        self.outputs = self._run_pipeline()
+        # Сущности и связи результатов для замера построения цепочек (позиции не нужны)
+        self.graphs = [
+            (
+                [Entity(e['text'], e['type'], 0, 0) for e in result['entities']],
+                [
+                    Relation(r['source'], r['target'], r['relation'], r['source_type'], r['target_type'], 0, 0)
+                    for r in result['relations']
+                ]
+            )
+            for result in self.outputs
+            if 'error' not in result
+        ]
+    
+    def _run_pipeline(self) -> List[Dict]:
+        results = []
+        for i in range(0, len(self.paths), self.doc_batch):
+            results.extend(self.pipeline.process_documents(self.paths[i:i + self.doc_batch]))
+        return results
+    
+    def run(self, components: List[str]) -> Dict[str, Dict]:
+        """Замеряет выбранные компоненты; возвращает лучшее время и пропускную способность каждого"""
+        # Прогрев: загрузка моделей и подготовка входных данных не входят в замер
+        print("Подготовка входных данных и прогрев...")
+        self._prepare()
+        
+        reader = self.pipeline.doc_reader
+        ner = self.pipeline.ner_extractor
+        relation_extractor = self.pipeline.relation_extractor
+        classifier = self.pipeline.process_classifier
+        
+        def run_ner():
+            for text, chunks in zip(self.texts, self.chunks):
+                ner.extract_batch([text[start:end] for start, end in chunks])
+        
+        def run_relations():
+            for text, chunks, entities in zip(self.texts, self.chunks, self.chunk_entities):
+                flat = [entity for found in entities for entity in found]
+                entity_index = relation_extractor.build_entity_index(flat)
+                keyword_index = relation_extractor.build_keyword_index(text)
+                for (start, end), found in zip(chunks, entities):
+                    relation_extractor.extract(text[start:end], found, entity_index,
+                                               offset=start, keyword_index=keyword_index)
+        
+        def run_chains():
+            for entities, relations in self.graphs:
+                self.pipeline._build_relation_chains(entities, relations)
+        
+        measured = {
+            'reader': lambda: [reader.read_document(path) for path in self.paths],
+            'ner': run_ner,
+            'relations': run_relations,
+            'classifier': lambda: [classifier.classify(text) for text in self.texts],
+            'chains': run_chains,
+            'pipeline': self._run_pipeline,
+        }
+        print(f"Замер (лучшее из {self.repeat}):")
+        for name in components:
+            self._measure(name, measured[name])
+        return self.results
+
+
+def compare(results: Dict[str, Dict], baseline: Dict[str, Dict], threshold: float) -> List[str]:
+    """Сравнивает замер с базовой линией; возвращает компоненты, замедлившиеся больше чем на threshold"""
+    regressions = []
+    print(f"\nСравнение с базовой линией (порог {threshold:.0%}):")
+    for name, result in results.items():
+        if name not in baseline:
+            print(f"  {name:<12} нет в базовой линии")
+            continue
+        base = baseline[name]['seconds']
+        change = (result['seconds'] - base) / base if base else 0.0
+        flag = ''
+        if change > threshold:
+            flag = '  <-- РЕГРЕССИЯ'
+            regressions.append(name)
+        print(f"  {name:<12} {base:10.4f} с -> {result['seconds']:10.4f} с  ({change:+.1%}){flag}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Бенчмарк компонентов пайплайна на синтетических договорах')
+    parser.add_argument('--files', type=int, default=10, help='Количество документов в корпусе')
+    parser.add_argument('--size', type=str, default='10KB', help='Размер документа: от 1KB до 5MB')
+    parser.add_argument('--format', type=str, default='txt', choices=['txt', 'docx'], help='Формат документов')
+    parser.add_argument('--seed', type=int, default=42, help='Зерно генератора корпуса')
+    parser.add_argument('--repeat', type=int, default=3, help='Число повторов каждого замера')
+    parser.add_argument('--components', type=str, default=','.join(COMPONENTS),
+                        help=f'Компоненты через запятую: {",".join(COMPONENTS)}')
+    parser.add_argument('--corpus-dir', type=str, help='Директория корпуса (по умолчанию: output/.bench/...)')
+    parser.add_argument('--save', type=str, help='Сохранить результаты как базовую линию (JSON)')
+    parser.add_argument('--compare', type=str, help='Сравнить с базовой линией (JSON)')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='Допустимое замедление относительно базовой линии (0.1 = 10%%)')
+    args = parser.parse_args()
+    
+    components = [name.strip() for name in args.components.split(',') if name.strip()]
+    unknown = [name for name in components if name not in COMPONENTS]
+    if unknown:
+        print(f"Ошибка: неизвестные компоненты: {', '.join(unknown)}")
+        sys.exit(2)
+    
+    size = parse_size(args.size)
+    corpus_dir = Path(args.corpus_dir) if args.corpus_dir else \
+        OUTPUT_DIR / '.bench' / f"{args.format}_{size}_{args.files}_{args.seed}"
+    print(f"Корпус: {args.files} док. по {size} байт ({args.format}), {corpus_dir}")
+    paths = build_corpus(corpus_dir, args.files, size, args.seed, args.format)
+    
+    benchmark = Benchmark(paths, repeat=args.repeat)
+    results = benchmark.run(components)
+    
+    report = {
+        'meta': {
+            'created': datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'files': args.files,
+            'size': size,
+            'format': args.format,
+            'seed': args.seed,
+            'repeat': args.repeat,
+            'input_bytes': benchmark.input_bytes,
+        },
+        'results': results,
+    }
+    
+    if args.save:
+        with open(args.save, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\nБазовая линия сохранена: {args.save}")
+    
+    if args.compare:
+        with open(args.compare, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+        if {key: baseline['meta'].get(key) for key in ('files', 'size', 'format', 'seed')} != \
+                {key: report['meta'][key] for key in ('files', 'size', 'format', 'seed')}:
+            print("Внимание: параметры корпуса отличаются от базовой линии")
+        regressions = compare(results, baseline['results'], args.threshold)
+        if regressions:
+            print(f"\nРегрессии: {', '.join(regressions)}")
+            sys.exit(1)
+        print("\nРегрессий нет")
+
+
+if __name__ == "__main__":
+    main()
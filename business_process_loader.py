@@ -3,6 +3,7 @@
 """
 from pathlib import Path
 from typing import Dict, List, Tuple
+import hashlib
 import re
 
 
@@ -13,12 +14,18 @@ class BusinessProcessLoader:
         self.file_path = Path(file_path)
         self.processes = []
         self.process_map = {}  # Маппинг номер -> (категория, подпроцесс)
+        self.revision = None  # Хэш содержимого файла, меняется при изменении списка процессов
         self._load_processes()
     
     def _load_processes(self):
         """Загружает бизнес-процессы из файла"""
-        with open(self.file_path, 'r', encoding='utf-8') as f:
-            lines = f.readlines()
+        with open(self.file_path, 'rb') as f:
+            content = f.read()
+        
+        self.revision = hashlib.sha256(content).hexdigest()
+        self.processes = []
+        self.process_map = {}
+        lines = content.decode('utf-8').splitlines()
         
         current_category = None
         for line in lines:
@@ -47,6 +54,12 @@ class BusinessProcessLoader:
                 
                 self.process_map[number] = (current_category, subprocess)
     
+    def reload(self) -> bool:
+        """Перечитывает файл процессов; возвращает True, если ревизия изменилась"""
+        old_revision = self.revision
+        self._load_processes()
+        return self.revision != old_revision
+    
     def get_all_processes(self) -> List[Dict]:
         """Возвращает список всех бизнес-процессов"""
         return self.processes
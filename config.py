@@ -17,6 +17,10 @@ OUTPUT_DIR.mkdir(exist_ok=True)
 USE_GPU = True  # Использовать MPS (Metal Performance Shaders) на Mac
 NER_MODEL = "natasha"  # "natasha" или "spacy"
 RELATION_MODEL = "llm"  # "llm" или "pattern"
+SHARED_MORPHOLOGY = False  # Связи и классификация по словам и леммам из разметки, полученной при NER
+CLASSIFIER_MODE = "keywords"  # "keywords" или "tfidf" (близость к описаниям всех процессов)
+CLASSIFIER_TOP_K = 3  # Процессов в результате режима "tfidf": лучший и альтернативы
+CLASSIFIER_MATRIX_PATH = OUTPUT_DIR / ".cache" / "process_matrix.npz"  # Кэш матрицы TF-IDF процессов
 
 # Настройки LLM (если используется)
 LLM_MODEL_PATH = None  # Путь к локальной модели, если используется
@@ -26,3 +30,60 @@ LLM_MAX_TOKENS = 2000
 # Настройки обработки
 MAX_TEXT_LENGTH = 10000  # Максимальная длина текста для обработки
 CHUNK_SIZE = 2000  # Размер чанков для обработки длинных документов
+CHUNK_OVERLAP = 200  # Перекрытие соседних чанков (целыми предложениями, в символах)
+STREAM_MIN_FILE_SIZE = 2 * 1024 * 1024  # Файлы от этого размера читаются и обрабатываются потоково
+STREAM_WINDOW_CHUNKS = 8  # Размер буфера потокового чанкинга (в чанках)
+NER_BATCH_SIZE = 32  # Размер батча для инференса NER (nlp.pipe / теггеры Natasha)
+NER_N_PROCESS = 1  # Количество процессов для nlp.pipe (только SpaCy)
+NER_PREFILTER = False  # NER только по предложениям с признаками сущностей (не совместим с SHARED_MORPHOLOGY)
+NER_PREFILTER_CONTEXT = 1  # Соседних предложений с каждой стороны от предложения-кандидата
+DOC_BATCH_SIZE = 8  # Количество документов, чанки которых отправляются в NER одним батчем
+NUM_WORKERS = 1  # Количество процессов для пакетной обработки (main.py --workers)
+DOCX_ENGINE = "python-docx"  # "python-docx" - абзацы основного текста, "stream" - потоковый разбор XML с таблицами, сносками и колонтитулами
+STREAM_DOCX_ENGINE = "stream"  # Чтение DOCX от STREAM_MIN_FILE_SIZE: python-docx строит дерево всего документа в памяти
+PDF_ENGINE = "pdfplumber"  # "pdfplumber" - с разбором макета, "pypdf" - текстовый слой PyPDF2 с откатом на pdfplumber
+PDF_WORKERS = 1  # Процессов для постраничного извлечения текста PDF (при main.py --workers > 1 не используется)
+PDF_PAGE_RANGE = None  # (первая, последняя) страница PDF с 1 включительно, например (1, 3) - первые три
+WATCH_DEBOUNCE = 2.0  # Файл обрабатывается, если не менялся столько секунд (main.py --watch)
+WATCH_POLL_INTERVAL = 1.0  # Интервал опроса директории, если inotify недоступен, с
+WATCH_MANIFEST_NAME = ".manifest.json"  # Манифест обработанных файлов в выходной директории
+METRICS_ENABLED = False  # Замер времени этапов в statistics['stages'] результата (main.py --metrics)
+
+# Настройки цепочек связей
+CHAIN_MAX_DEPTH = 1  # Максимальное число связей в цепочке (1 - цепочка из одной связи)
+CHAIN_MAX_PER_DOCUMENT = 10000  # Максимум цепочек в результате документа (None - без ограничения, только при глубине 1)
+
+# Настройки хранилища сущностей (поиск: python entity_store.py entity "ООО Ромашка")
+ENTITY_STORE_ENABLED = False  # Сохранять сущности, связи и бизнес-процессы всех документов в общее хранилище
+ENTITY_STORE_PATH = OUTPUT_DIR / "entities.sqlite"
+
+# Настройки нормализации сущностей (объединение словоформ: «ООО «Ромашки»» и «ООО «Ромашка»»)
+ENTITY_NORMALIZATION = False  # Удалять дубликаты сущностей по леммам слов, а не только по регистру и пробелам
+ENTITY_NORM_CACHE_SIZE = 100000  # Ключей нормализации в LRU-кэше процесса
+ENTITY_NORM_CACHE_PATH = OUTPUT_DIR / ".cache" / "entity_norm.pkl"  # Кэш нормализации между запусками (None - не сохранять)
+LEMMA_CACHE_SIZE = 200000  # Лемм слов в LRU-кэше разметки SHARED_MORPHOLOGY
+
+# Настройки поиска почти-дубликатов (MinHash + LSH по тексту до NER)
+NEAR_DUPLICATE_MODE = None  # None - выключен, "flag" - отмечать в результате, "reuse" - брать результат похожего документа
+NEAR_DUPLICATE_THRESHOLD = 0.9  # Минимальная оценка коэффициента Жаккара шинглов
+NEAR_DUPLICATE_NUM_PERM = 128  # Длина MinHash-сигнатуры
+NEAR_DUPLICATE_SHINGLE_SIZE = 5  # Слов в шингле
+NEAR_DUPLICATE_PATH = OUTPUT_DIR / ".cache" / "near_duplicates.sqlite"
+
+# Настройки вывода (main.py --format, --compact)
+OUTPUT_FORMAT = "json"  # "json" - файл на документ, "jsonl" - один файл JSON Lines, "parquet" - таблицы Parquet
+OUTPUT_INDENT = 2  # Отступ JSON-файлов результатов; None - компактная запись без форматирования
+OUTPUT_BATCH_DOCUMENTS = 1000  # Документов в одной части (файле) Parquet
+
+# Настройки кэша результатов
+RESULT_CACHE_ENABLED = True  # Пропускать повторную обработку неизмененных документов
+RESULT_CACHE_PATH = OUTPUT_DIR / ".cache" / "results.sqlite"
+RESULT_CACHE_MAX_BYTES = 1024 * 1024 * 1024  # Максимальный размер кэша (LRU-вытеснение)
+
+# Настройки сервиса (service.py)
+SERVICE_HOST = "127.0.0.1"
+SERVICE_PORT = 8080
+SERVICE_QUEUE_SIZE = 64  # Максимум документов в очереди NER; сверх него сервис отвечает 503
+SERVICE_MAX_IN_FLIGHT = 128  # Максимум документов в обработке (чтение, очередь NER, этапы после NER); сверх него - 503
+SERVICE_BATCH_WINDOW_MS = 10  # Максимальное ожидание для набора батча NER
+SERVICE_THREADS = 4  # Потоки для чтения документов и этапов после NER
@@ -1,51 +1,328 @@
 """
 Модуль для чтения документов различных форматов
 """
-import docx
-import pdfplumber
+import math
+import multiprocessing
+import os
+import re
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
 from pathlib import Path
-from typing import Optional
+from typing import IO, Iterator, List, Optional, Tuple
+from xml.etree import ElementTree
+# docx, pdfplumber и PyPDF2 импортируются при первом чтении файла соответствующего формата
+
+
+PDF_ENGINES = ('pdfplumber', 'pypdf')
+DOCX_ENGINES = ('python-docx', 'stream')
+
+# Элементы WordprocessingML, которые разбирает потоковое чтение DOCX
+W = '{http://schemas.openxmlformats.org/wordprocessingml/2006/main}'
+W_P, W_R, W_T, W_TR, W_TC = W + 'p', W + 'r', W + 't', W + 'tr', W + 'tc'
+W_BREAK_TYPE = W + 'type'
+# Текст элементов внутри прогона (как у python-docx: разрыв страницы или колонки текста не дает)
+W_RUN_TEXT = {W + 'tab': '\t', W + 'ptab': '\t', W + 'cr': '\n', W + 'noBreakHyphen': '-'}
+# Части документа, в которые абзацы добавляются по мере разбора (очищаются после каждого блока)
+W_CONTAINERS = {W + 'body', W + 'hdr', W + 'ftr', W + 'footnotes', W + 'endnotes'}
+# Запасной вариант разметки (mc:Fallback) дублирует mc:Choice - например, текст надписей
+MC_FALLBACK = '{http://schemas.openxmlformats.org/markup-compatibility/2006}Fallback'
+# Дополнительные части DOCX после основного текста: сноски, колонтитулы
+DOCX_EXTRA_PART_RE = re.compile(r'word/(footnotes|endnotes|header\d*|footer\d*)\.xml')
+
+
+def _plain_text_ok(text: Optional[str]) -> bool:
+    """Текст слоя PDF пригоден без разбора макета: непустой, без мусорных символов и со словами
+    обычной длины (склеенные в одно "слово" строки означают, что пробелы восстанавливаются по макету)"""
+    if not text or not text.strip():
+        return False
+    garbage = sum(1 for char in text if char == '\ufffd' or not (char.isprintable() or char in '\n\t'))
+    if garbage > len(text) * 0.01:
+        return False
+    words = text.split()
+    return sum(len(word) for word in words) / len(words) <= 25
+
+
+def _open_pdf(file_path: Path, engine: str):
+    if engine == 'pypdf':
+        from PyPDF2 import PdfReader
+        return PdfReader(str(file_path))
+    import pdfplumber
+    return pdfplumber.open(file_path)
+
+
+def pdf_page_count(file_path: Path, engine: str = 'pdfplumber') -> int:
+    """Количество страниц PDF"""
+    pdf = _open_pdf(file_path, engine)
+    try:
+        return len(pdf.pages)
+    finally:
+        if engine != 'pypdf':
+            pdf.close()
+
+
+def iter_pdf_pages(file_path: Path, start: int = 0, stop: Optional[int] = None,
+                   engine: str = 'pdfplumber') -> Iterator[Optional[str]]:
+    """Текст страниц PDF с start по stop (индексы с 0, stop не включается).
+    
+    engine="pypdf" - быстрый путь: текстовый слой через PyPDF2; страница, текст которой
+    не прошел проверку _plain_text_ok, перечитывается через pdfplumber с разбором макета.
+    """
+    fast = _open_pdf(file_path, engine) if engine == 'pypdf' else None
+    plumber = None
+    try:
+        total = len(fast.pages) if fast is not None else None
+        if fast is None:
+            plumber = _open_pdf(file_path, 'pdfplumber')
+            total = len(plumber.pages)
+        for number in range(start, min(total, stop) if stop is not None else total):
+            text = None
+            if fast is not None:
+                try:
+                    text = fast.pages[number].extract_text()
+                except Exception:
+                    text = None
+                if not _plain_text_ok(text):
+                    text = None
+            if text is None:
+                if plumber is None:
+                    plumber = _open_pdf(file_path, 'pdfplumber')
+                page = plumber.pages[number]
+                text = page.extract_text()
+                # Кэш символов и объектов страницы - основной потребитель памяти
+                getattr(page, 'close', page.flush_cache)()
+            yield text
+    finally:
+        if plumber is not None:
+            plumber.close()
+
+
+def iter_docx_part(source: IO[bytes]) -> Iterator[str]:
+    """Текст абзацев и строк таблиц XML-части DOCX в порядке документа.
+    
+    Ячейки строки таблицы разделяются табуляцией, абзацы внутри ячейки - пробелом; абзац надписи,
+    вложенный в другой абзац, выдается отдельной строкой. Разобранные блоки удаляются из дерева,
+    поэтому память ограничена одним абзацем или таблицей верхнего уровня.
+    """
+    paragraphs = []  # Стек текстов открытых абзацев (абзацы надписей вложены в абзацы)
+    cells = []  # Стек открытых ячеек: тексты их абзацев
+    rows = []  # Стек открытых строк таблиц: тексты их ячеек
+    container = None
+    runs = 0  # Глубина вложенности в прогоны w:r (w:tab вне прогона - позиция табуляции)
+    fallback = 0  # Глубина вложенности в mc:Fallback
+    
+    for event, elem in ElementTree.iterparse(source, events=('start', 'end')):
+        tag = elem.tag
+        if event == 'start':
+            if tag == MC_FALLBACK:
+                fallback += 1
+            elif fallback:
+                continue
+            elif tag == W_P:
+                paragraphs.append([])
+            elif tag == W_R:
+                runs += 1
+            elif tag == W_TC:
+                cells.append([])
+            elif tag == W_TR:
+                rows.append([])
+            elif tag in W_CONTAINERS:
+                container = elem
+            continue
+        
+        if tag == MC_FALLBACK:
+            fallback -= 1
+            continue
+        if fallback:
+            continue
+        
+        if tag == W_T:
+            if paragraphs:
+                paragraphs[-1].append(elem.text or '')
+        elif tag == W_R:
+            runs -= 1
+        elif runs and paragraphs and tag in W_RUN_TEXT:
+            paragraphs[-1].append(W_RUN_TEXT[tag])
+        elif runs and paragraphs and tag == W + 'br':
+            if elem.get(W_BREAK_TYPE, 'textWrapping') == 'textWrapping':
+                paragraphs[-1].append('\n')
+        elif tag == W_P:
+            text = ''.join(paragraphs.pop())
+            if paragraphs or not cells:
+                yield text
+            else:
+                cells[-1].append(text)
+        elif tag == W_TC:
+            cell = ' '.join(text for text in cells.pop() if text)
+            if rows:
+                rows[-1].append(cell)
+        elif tag == W_TR:
+            row = '\t'.join(rows.pop())
+            if cells:
+                cells[-1].append(row)  # Строка вложенной таблицы - часть текста внешней ячейки
+            else:
+                yield row
+        else:
+            continue
+        
+        if tag in (W_P, W_TC, W_TR):
+            elem.clear()
+        if container is not None and not paragraphs and not cells and not rows:
+            container.clear()
+
+
+def iter_docx_stream(file_path: Path) -> Iterator[str]:
+    """Строки текста DOCX без объектной модели python-docx: части читаются из zip потоково.
+    
+    Сначала основной текст (абзацы и таблицы), затем непустые строки сносок и колонтитулов
+    (одинаковые колонтитулы разных разделов выдаются один раз).
+    """
+    with zipfile.ZipFile(file_path) as archive:
+        with archive.open('word/document.xml') as part:
+            yield from iter_docx_part(part)
+        
+        seen = set()
+        for name in sorted(name for name in archive.namelist() if DOCX_EXTRA_PART_RE.fullmatch(name)):
+            with archive.open(name) as part:
+                for line in iter_docx_part(part):
+                    if line.strip() and line not in seen:
+                        seen.add(line)
+                        yield line
+
+
+def _extract_pdf_pages(file_path: Path, pages: Tuple[int, int], engine: str) -> List[Optional[str]]:
+    """Текст диапазона страниц (для процессов пула)"""
+    return list(iter_pdf_pages(file_path, pages[0], pages[1], engine))
 
 
 class DocumentReader:
     """Класс для чтения документов разных форматов"""
     
-    @staticmethod
-    def read_docx(file_path: Path) -> str:
-        """Читает DOCX файл и возвращает текст"""
+    VERSION = "1.0"  # Версия логики извлечения текста (входит в ключ кэша результатов)
+    
+    TXT_BLOCK_SIZE = 64 * 1024  # Размер блока при потоковом чтении TXT
+    PDF_PARALLEL_MIN_PAGES = 8  # PDF короче этого читаются в текущем процессе
+    PDF_TASKS_PER_WORKER = 4  # Диапазонов страниц на процесс пула (для выравнивания нагрузки)
+    
+    def __init__(self, pdf_engine: str = 'pdfplumber', pdf_workers: int = 1,
+                 pdf_page_range: Optional[Tuple[int, int]] = None, docx_engine: str = 'python-docx'):
+        """
+        Args:
+            pdf_engine: "pdfplumber" - разбор макета каждой страницы, "pypdf" - текстовый слой PyPDF2
+                с откатом на pdfplumber для страниц, где он не справился
+            pdf_workers: количество процессов для постраничного извлечения текста PDF (не больше числа ядер)
+            pdf_page_range: (первая, последняя) страница PDF с 1 включительно; None - все страницы
+            docx_engine: "python-docx" - абзацы основного текста через python-docx, "stream" - потоковый
+                разбор XML из архива: абзацы, таблицы, сноски и колонтитулы
+        """
+        if pdf_engine not in PDF_ENGINES:
+            raise ValueError(f"Неизвестный способ чтения PDF: {pdf_engine}")
+        if docx_engine not in DOCX_ENGINES:
+            raise ValueError(f"Неизвестный способ чтения DOCX: {docx_engine}")
+        if pdf_page_range is not None and not 1 <= pdf_page_range[0] <= pdf_page_range[1]:
+            raise ValueError(f"Некорректный диапазон страниц PDF: {pdf_page_range} (нужно 1 <= первая <= последняя)")
+        self.docx_engine = docx_engine
+        self.pdf_engine = pdf_engine
+        self.pdf_workers = min(pdf_workers, os.cpu_count() or 1)
+        self.pdf_page_range = pdf_page_range
+        self._pdf_executor = None  # Пул процессов создается при первом большом PDF
+    
+    def close(self):
+        """Останавливает пул процессов извлечения PDF (если он был создан)"""
+        if self._pdf_executor is not None:
+            self._pdf_executor.shutdown(wait=True)
+            self._pdf_executor = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+    
+    def iter_docx(self, file_path: Path, engine: Optional[str] = None) -> Iterator[str]:
+        """Читает DOCX файл по абзацам (engine - способ чтения вместо docx_engine)"""
+        engine = engine or self.docx_engine
+        if engine not in DOCX_ENGINES:
+            raise ValueError(f"Неизвестный способ чтения DOCX: {engine}")
         try:
-            doc = docx.Document(file_path)
-            text = "\n".join([paragraph.text for paragraph in doc.paragraphs])
-            return text
+            if engine == 'stream':
+                lines = iter_docx_stream(file_path)
+            else:
+                import docx
+                lines = (paragraph.text for paragraph in docx.Document(file_path).paragraphs)
+            for i, line in enumerate(lines):
+                yield line if i == 0 else "\n" + line
         except Exception as e:
             raise Exception(f"Ошибка чтения DOCX файла {file_path}: {str(e)}")
     
-    @staticmethod
-    def read_pdf(file_path: Path) -> str:
-        """Читает PDF файл и возвращает текст"""
+    def iter_pdf(self, file_path: Path) -> Iterator[str]:
+        """Читает PDF файл постранично, освобождая разобранную страницу после извлечения текста.
+        
+        При pdf_workers > 1 страницы длинного PDF извлекаются диапазонами в пуле процессов;
+        порядок страниц сохраняется.
+        """
+        start, stop = 0, None
+        if self.pdf_page_range is not None:
+            start, stop = self.pdf_page_range[0] - 1, self.pdf_page_range[1]
         try:
-            text = ""
-            with pdfplumber.open(file_path) as pdf:
-                for page in pdf.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-            return text
+            if self._parallel_pdf():
+                pages = self._iter_pdf_parallel(file_path, start, stop)
+            else:
+                pages = iter_pdf_pages(file_path, start, stop, self.pdf_engine)
+            for page_text in pages:
+                if page_text:
+                    yield page_text + "\n"
         except Exception as e:
             raise Exception(f"Ошибка чтения PDF файла {file_path}: {str(e)}")
     
-    @staticmethod
-    def read_txt(file_path: Path) -> str:
-        """Читает TXT файл и возвращает текст"""
+    def _parallel_pdf(self) -> bool:
+        # Процессы-воркеры multiprocessing.Pool (daemon) не могут запускать свои процессы
+        return self.pdf_workers > 1 and not multiprocessing.current_process().daemon
+    
+    def _iter_pdf_parallel(self, file_path: Path, start: int, stop: Optional[int]) -> Iterator[Optional[str]]:
+        """Текст страниц, извлеченный в пуле процессов диапазонами страниц"""
+        total = pdf_page_count(file_path, self.pdf_engine)
+        stop = total if stop is None else min(stop, total)
+        if stop - start < self.PDF_PARALLEL_MIN_PAGES:
+            yield from iter_pdf_pages(file_path, start, stop, self.pdf_engine)
+            return
+        
+        step = math.ceil((stop - start) / (self.pdf_workers * self.PDF_TASKS_PER_WORKER))
+        ranges = [(first, min(first + step, stop)) for first in range(start, stop, step)]
+        if self._pdf_executor is None:
+            self._pdf_executor = ProcessPoolExecutor(max_workers=self.pdf_workers)
+        # map возвращает диапазоны в исходном порядке по мере готовности
+        for texts in self._pdf_executor.map(_extract_pdf_pages, repeat(file_path), ranges, repeat(self.pdf_engine)):
+            yield from texts
+    
+    @classmethod
+    def iter_txt(cls, file_path: Path) -> Iterator[str]:
+        """Читает TXT файл блоками"""
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
-                return f.read()
+                for block in iter(lambda: f.read(cls.TXT_BLOCK_SIZE), ''):
+                    yield block
         except Exception as e:
             raise Exception(f"Ошибка чтения TXT файла {file_path}: {str(e)}")
     
+    def read_docx(self, file_path: Path) -> str:
+        """Читает DOCX файл и возвращает текст"""
+        return "".join(self.iter_docx(file_path))
+    
+    def read_pdf(self, file_path: Path) -> str:
+        """Читает PDF файл и возвращает текст"""
+        return "".join(self.iter_pdf(file_path))
+    
     @classmethod
-    def read_document(cls, file_path: Path) -> Optional[str]:
-        """Читает документ любого поддерживаемого формата"""
+    def read_txt(cls, file_path: Path) -> str:
+        """Читает TXT файл и возвращает текст"""
+        return "".join(cls.iter_txt(file_path))
+    
+    def iter_document(self, file_path: Path, docx_engine: Optional[str] = None) -> Iterator[str]:
+        """Читает документ любого поддерживаемого формата по сегментам (страницам, абзацам, блокам).
+        
+        Склеенные сегменты совпадают с результатом read_document (при том же способе чтения DOCX).
+        """
         file_path = Path(file_path)
         
         if not file_path.exists():
@@ -54,10 +331,14 @@ class DocumentReader:
         suffix = file_path.suffix.lower()
         
         if suffix == '.docx':
-            return cls.read_docx(file_path)
+            return self.iter_docx(file_path, docx_engine)
         elif suffix == '.pdf':
-            return cls.read_pdf(file_path)
+            return self.iter_pdf(file_path)
         elif suffix == '.txt':
-            return cls.read_txt(file_path)
+            return self.iter_txt(file_path)
         else:
             raise ValueError(f"Неподдерживаемый формат файла: {suffix}")
+    
+    def read_document(self, file_path: Path) -> Optional[str]:
+        """Читает документ любого поддерживаемого формата"""
+        return "".join(self.iter_document(file_path))
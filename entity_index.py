@@ -0,0 +1,123 @@
+"""
+Модуль индекса сущностей для быстрого поиска по частичному совпадению текста
+"""
+from typing import Dict, List, Optional
+from entity_records import Entity
+
+
+class EntityIndex:
+    """Индекс сущностей документа для поиска по вхождению подстроки без учета регистра.
+    
+    Отвечает на тот же запрос, что и линейный перебор: первая (в порядке добавления)
+    сущность, текст которой содержит запрос или содержится в запросе.
+    """
+    
+    def __init__(self, entities: List[Entity]):
+        # Как и в словаре {текст: сущность}: порядок по первому вхождению, значение - последнее
+        entity_dict = {e.text: e for e in entities}
+        self.entities = list(entity_dict.values())
+        lowered = [text.lower() for text in entity_dict]
+        
+        # Текст сущности -> минимальный номер (для случая "сущность внутри запроса")
+        self._by_text: Dict[str, int] = {}
+        for i, text in enumerate(lowered):
+            self._by_text.setdefault(text, i)
+        self._lengths = sorted({len(text) for text in self._by_text})
+        
+        # Обобщенный суффиксный автомат (для случая "запрос внутри сущности")
+        self._next: List[Dict[str, int]] = [{}]
+        self._link: List[int] = [-1]
+        self._len: List[int] = [0]
+        self._min_entity: List[int] = [len(lowered)]
+        for i, text in enumerate(lowered):
+            self._add_string(text, i)
+        self._propagate_min()
+        
+        # Одни и те же слова встречаются в совпадениях паттернов многократно
+        self._cache: Dict[str, Optional[Entity]] = {}
+    
+    def _new_state(self, length: int, transitions: Dict[str, int], link: int, min_entity: int) -> int:
+        self._next.append(transitions)
+        self._link.append(link)
+        self._len.append(length)
+        self._min_entity.append(min_entity)
+        return len(self._next) - 1
+    
+    def _add_string(self, text: str, entity_id: int):
+        """Добавляет строку в обобщенный суффиксный автомат"""
+        nxt, link, length = self._next, self._link, self._len
+        none = len(self.entities)  # Номер-заглушка: "сущность не найдена"
+        last = 0
+        for char in text:
+            if char in nxt[last]:
+                # Переход уже есть: возможно, нужно расщепить состояние
+                q = nxt[last][char]
+                if length[q] == length[last] + 1:
+                    last = q
+                else:
+                    clone = self._new_state(length[last] + 1, dict(nxt[q]), link[q], none)
+                    p = last
+                    while p != -1 and nxt[p].get(char) == q:
+                        nxt[p][char] = clone
+                        p = link[p]
+                    link[q] = clone
+                    last = clone
+            else:
+                cur = self._new_state(length[last] + 1, {}, -1, none)
+                p = last
+                while p != -1 and char not in nxt[p]:
+                    nxt[p][char] = cur
+                    p = link[p]
+                if p == -1:
+                    link[cur] = 0
+                else:
+                    q = nxt[p][char]
+                    if length[p] + 1 == length[q]:
+                        link[cur] = q
+                    else:
+                        clone = self._new_state(length[p] + 1, dict(nxt[q]), link[q], none)
+                        while p != -1 and nxt[p].get(char) == q:
+                            nxt[p][char] = clone
+                            p = link[p]
+                        link[q] = clone
+                        link[cur] = clone
+                last = cur
+            # Префикс строки заканчивается в этом состоянии
+            if entity_id < self._min_entity[last]:
+                self._min_entity[last] = entity_id
+    
+    def _propagate_min(self):
+        """Переносит минимальный номер сущности вверх по суффиксным ссылкам"""
+        for state in sorted(range(1, len(self._len)), key=self._len.__getitem__, reverse=True):
+            parent = self._link[state]
+            if self._min_entity[state] < self._min_entity[parent]:
+                self._min_entity[parent] = self._min_entity[state]
+    
+    def _min_containing(self, query: str) -> int:
+        """Минимальный номер сущности, содержащей запрос"""
+        state = 0
+        for char in query:
+            state = self._next[state].get(char)
+            if state is None:
+                return len(self.entities)
+        return self._min_entity[state]
+    
+    def _min_contained(self, query: str) -> int:
+        """Минимальный номер сущности, содержащейся в запросе"""
+        best = len(self.entities)
+        for size in self._lengths:
+            if size > len(query):
+                break
+            for start in range(len(query) - size + 1):
+                entity_id = self._by_text.get(query[start:start + size])
+                if entity_id is not None and entity_id < best:
+                    best = entity_id
+        return best
+    
+    def find(self, text: str) -> Optional[Entity]:
+        """Находит сущность по тексту (частичное совпадение)"""
+        query = text.lower()
+        if query not in self._cache:
+            best = min(self._min_containing(query), self._min_contained(query))
+            self._cache[query] = self.entities[best] if best < len(self.entities) else None
+        return self._cache[query]
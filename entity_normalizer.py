@@ -0,0 +1,159 @@
+"""
+Модуль нормализации сущностей по леммам с междокументным LRU-кэшем
+"""
+import os
+import pickle
+import re
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Callable, Hashable, Optional
+
+
+WORD_RE = re.compile(r'\w+(?:-\w+)*')
+
+
+class LRUCache:
+    """Ограниченный кэш: при переполнении вытесняются давно не использованные ключи.
+    
+    Потокобезопасен: сервис строит результаты в пуле потоков с общим нормализатором.
+    """
+    
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+    
+    def get(self, key: Hashable):
+        """Значение по ключу или None; попадание делает ключ самым свежим"""
+        with self._lock:
+            value = self.entries.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+    
+    def put(self, key: Hashable, value):
+        with self._lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            if len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+    
+    def items(self) -> list:
+        """Снимок пар (ключ, значение) от давних к свежим"""
+        with self._lock:
+            return list(self.entries.items())
+    
+    @property
+    def hit_rate(self) -> float:
+        total = self.hits + self.misses
+        return self.hits / total if total else 0.0
+    
+    def __len__(self):
+        return len(self.entries)
+
+
+class EntityNormalizer:
+    """Приводит текст сущности к ключу из лемм слов: «ООО «Ромашки»» и «ООО «Ромашка»» -> «ооо ромашка».
+    
+    Лемматизация через MorphVocab Natasha дорогая, а контрагенты повторяются из документа
+    в документ, поэтому ключи запоминаются в LRU-кэше по (текст, тип) на весь процесс
+    и сохраняются между запусками в cache_path.
+    """
+    
+    VERSION = "1.0"  # Версия правил нормализации (входит в ключ кэша результатов и в файл кэша)
+    
+    # Разборы с этими пометками предпочтительнее для сущностей соответствующего типа
+    TYPE_TAGS = {'PER': ('Surn', 'Name', 'Patr'), 'LOC': ('Geox',), 'ORG': ('Orgn',)}
+    
+    def __init__(self, morph_vocab: Callable, max_size: int = 100000, cache_path: Optional[Path] = None):
+        self._morph_vocab = morph_vocab  # Фабрика словаря: он создается только при первом промахе
+        self.cache = LRUCache(max_size)
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.dirty = False  # В кэше есть ключи, которых нет в файле
+        if self.cache_path is not None and self.cache_path.exists():
+            self.load()
+    
+    def normalize(self, text: str, entity_type: str) -> str:
+        key = (text, entity_type)
+        normalized = self.cache.get(key)
+        if normalized is None:
+            normalized = self._lemmatize(text, entity_type)
+            self.cache.put(key, normalized)
+            self.dirty = True
+        return normalized
+    
+    def _lemmatize(self, text: str, entity_type: str) -> str:
+        morph_vocab = self._morph_vocab()
+        preferred = self.TYPE_TAGS.get(entity_type, ())
+        lemmas = []
+        for word in WORD_RE.findall(text):
+            # Аббревиатуры, латиница и числа не склоняются
+            if word.isupper() or not re.search('[а-яё]', word.lower()) or not word.isalpha():
+                lemmas.append(word.lower())
+                continue
+            parses = morph_vocab.parse(word)
+            best = next((p for p in parses if any(tag in p.tag for tag in preferred)), parses[0])
+            lemmas.append(best.normal_form)
+        return ' '.join(lemmas)
+    
+    def _read_saved(self) -> list:
+        """Пары (ключ, нормализованный текст) из файла кэша (файл другой версии правил не читается)"""
+        try:
+            with open(self.cache_path, 'rb') as f:
+                saved = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return []
+        if saved.get('version') != self.VERSION:
+            return []
+        return saved['entries']
+    
+    def load(self):
+        """Загружает сохраненные ключи"""
+        for key, normalized in self._read_saved()[-self.cache.max_size:]:
+            self.cache.put(key, normalized)
+    
+    @contextmanager
+    def _file_lock(self):
+        """Блокировка файла кэша между процессами (воркеры пула сохраняют кэш одновременно)"""
+        try:
+            import fcntl
+        except ImportError:  # Windows: без блокировки, последний записавший побеждает
+            yield
+            return
+        with open(self.cache_path.with_suffix('.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock, fcntl.LOCK_UN)
+    
+    def save(self):
+        """Сохраняет кэш, если в нем появились новые ключи.
+        
+        Вызывается один раз в конце работы (DocumentPipeline.close): под блокировкой файл
+        перечитывается и объединяется с кэшем процесса, поэтому ключи других воркеров не теряются.
+        """
+        if self.cache_path is None or not self.dirty:
+            return
+        # Флаг сбрасывается до снимка: ключи, добавленные другими потоками во время записи, не потеряются
+        self.dirty = False
+        entries = self.cache.items()
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        with self._file_lock():
+            # Ключи из файла старше ключей процесса: при переполнении вытесняются первыми
+            merged = OrderedDict(self._read_saved())
+            for key, normalized in entries:
+                merged.pop(key, None)
+                merged[key] = normalized
+            tmp_path = self.cache_path.with_suffix(f'.{os.getpid()}.tmp')
+            with open(tmp_path, 'wb') as f:
+                pickle.dump({'version': self.VERSION, 'entries': list(merged.items())[-self.cache.max_size:]},
+                            f, protocol=pickle.HIGHEST_PROTOCOL)
+            tmp_path.replace(self.cache_path)
@@ -0,0 +1,59 @@
+"""
+Модуль с компактными представлениями сущностей и связей внутри пайплайна
+"""
+from typing import Dict
+
+
+class Entity:
+    """Именованная сущность: текст, тип и позиция [start, end) в тексте.
+    
+    __slots__ вместо словаря: у каждой сущности нет собственной хэш-таблицы с ключами.
+    """
+    
+    __slots__ = ('text', 'type', 'start', 'end')
+    
+    def __init__(self, text: str, type: str, start: int, end: int):
+        self.text = text
+        self.type = type
+        self.start = start
+        self.end = end
+    
+    def __repr__(self):
+        return f"Entity({self.text!r}, {self.type!r}, {self.start}, {self.end})"
+
+
+class Relation:
+    """Связь между сущностями.
+    
+    Контекст хранится как позиция [context_start, context_end) в тексте документа
+    и превращается в строку только при формировании результата (to_dict).
+    """
+    
+    __slots__ = ('source', 'target', 'relation', 'source_type', 'target_type', 'context_start', 'context_end')
+    
+    def __init__(self, source: str, target: str, relation: str, source_type: str, target_type: str,
+                 context_start: int, context_end: int):
+        self.source = source
+        self.target = target
+        self.relation = relation
+        self.source_type = source_type
+        self.target_type = target_type
+        self.context_start = context_start
+        self.context_end = context_end
+    
+    def context(self, text: str) -> str:
+        return text[self.context_start:self.context_end]
+    
+    def to_dict(self, text: str) -> Dict:
+        """Связь в формате результата; text - текст, в координатах которого задан контекст"""
+        return {
+            'source': self.source,
+            'target': self.target,
+            'relation': self.relation,
+            'source_type': self.source_type,
+            'target_type': self.target_type,
+            'context': self.context(text),
+        }
+    
+    def __repr__(self):
+        return f"Relation({self.source!r}, {self.relation!r}, {self.target!r})"
@@ -0,0 +1,256 @@
+"""
+Модуль междокументного хранилища сущностей, связей и бизнес-процессов (SQLite)
+"""
+import argparse
+import functools
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+from entity_normalizer import EntityNormalizer
+
+
+def entity_key(text: str) -> str:
+    """Ключ сущности без нормализации по леммам: регистр и пробелы (так пайплайн удаляет дубликаты
+    при выключенной ENTITY_NORMALIZATION)"""
+    return ' '.join(text.split()).lower()
+
+
+class EntityStore:
+    """Хранилище результатов всех обработанных документов с индексами для поиска.
+    
+    Сущности и связи индексируются по тому же ключу, по которому пайплайн удаляет дубликаты
+    (entity_key или леммы EntityNormalizer), документы - по номеру бизнес-процесса; для поиска
+    по словам ключа используется полнотекстовый индекс FTS5 (если SQLite собран без FTS5 - поиск
+    подстроки через LIKE). Повторная обработка документа заменяет его прежние записи.
+    """
+    
+    def __init__(self, db_path: Path, normalizer: Optional[EntityNormalizer] = None):
+        self.db_path = Path(db_path)
+        self.normalizer = normalizer
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path), timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        # В режиме WAL отказ от fsync на каждой транзакции не грозит порчей базы
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.executescript(
+            'CREATE TABLE IF NOT EXISTS documents ('
+            'id INTEGER PRIMARY KEY, path TEXT UNIQUE NOT NULL, name TEXT NOT NULL, '
+            'category TEXT, subprocess TEXT, process_number INTEGER, confidence REAL, updated REAL NOT NULL);'
+            'CREATE INDEX IF NOT EXISTS documents_process ON documents (process_number);'
+            'CREATE TABLE IF NOT EXISTS entities ('
+            'id INTEGER PRIMARY KEY, document_id INTEGER NOT NULL, key TEXT NOT NULL, '
+            'text TEXT NOT NULL, type TEXT NOT NULL);'
+            'CREATE INDEX IF NOT EXISTS entities_key ON entities (key, type);'
+            'CREATE INDEX IF NOT EXISTS entities_document ON entities (document_id);'
+            'CREATE TABLE IF NOT EXISTS relations ('
+            'document_id INTEGER NOT NULL, source_key TEXT NOT NULL, target_key TEXT NOT NULL, '
+            'relation TEXT NOT NULL, source TEXT NOT NULL, target TEXT NOT NULL, context TEXT);'
+            'CREATE INDEX IF NOT EXISTS relations_source ON relations (source_key, relation);'
+            'CREATE INDEX IF NOT EXISTS relations_target ON relations (target_key, relation);'
+            'CREATE INDEX IF NOT EXISTS relations_document ON relations (document_id);'
+            'CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value TEXT NOT NULL);'
+        )
+        self.fts = self._create_fts()
+        self._check_key_rule()
+        self.conn.commit()
+    
+    def _check_key_rule(self):
+        """Записывает правило построения ключей; ключи по другому правилу запрос не найдет"""
+        key_rule = f'lemmas {self.normalizer.VERSION}' if self.normalizer is not None else 'text'
+        row = self.conn.execute("SELECT value FROM meta WHERE name = 'key_rule'").fetchone()
+        stored = row[0] if row is not None else 'text'  # Хранилища без таблицы meta строились по тексту
+        if stored != key_rule and self.conn.execute('SELECT 1 FROM entities LIMIT 1').fetchone():
+            raise ValueError(
+                f"Ключи хранилища {self.db_path} построены по правилу '{stored}', а не '{key_rule}': "
+                f"верните прежнее значение ENTITY_NORMALIZATION или удалите хранилище"
+            )
+        self.conn.execute("INSERT OR REPLACE INTO meta (name, value) VALUES ('key_rule', ?)", (key_rule,))
+    
+    def key(self, text: str, entity_type: str) -> str:
+        """Ключ сущности, по которому пайплайн удаляет дубликаты"""
+        if self.normalizer is not None:
+            return self.normalizer.normalize(' '.join(text.split()), entity_type)
+        return entity_key(text)
+    
+    def _query_keys(self, text: str, entity_type: Optional[str] = None) -> List[str]:
+        """Ключи текста запроса: при нормализации без типа - по разборам для каждого типа сущности"""
+        if entity_type is not None or self.normalizer is None:
+            return [self.key(text, entity_type or '')]
+        return list(dict.fromkeys(self.key(text, t) for t in (*EntityNormalizer.TYPE_TAGS, '')))
+    
+    def _create_fts(self) -> bool:
+        """Полнотекстовый индекс ключей сущностей, синхронизируемый триггерами"""
+        try:
+            self.conn.executescript(
+                "CREATE VIRTUAL TABLE IF NOT EXISTS entities_fts USING fts5("
+                "key, content='entities', content_rowid='id');"
+                "CREATE TRIGGER IF NOT EXISTS entities_fts_insert AFTER INSERT ON entities BEGIN "
+                "INSERT INTO entities_fts (rowid, key) VALUES (new.id, new.key); END;"
+                "CREATE TRIGGER IF NOT EXISTS entities_fts_delete AFTER DELETE ON entities BEGIN "
+                "INSERT INTO entities_fts (entities_fts, rowid, key) VALUES ('delete', old.id, old.key); END;"
+            )
+        except sqlite3.OperationalError:
+            return False
+        return True
+    
+    def add_results(self, file_paths: Iterable[Path], results: Iterable[Dict]):
+        """Заменяет записи документов их новыми результатами (одной транзакцией; ошибки пропускаются)"""
+        with self.conn:
+            for file_path, result in zip(file_paths, results):
+                if 'error' not in result:
+                    self._add_result(Path(file_path), result)
+    
+    def _add_result(self, file_path: Path, result: Dict):
+        path = str(file_path.resolve())
+        process = result['business_process']
+        row = self.conn.execute('SELECT id FROM documents WHERE path = ?', (path,)).fetchone()
+        if row is not None:
+            self.conn.execute('DELETE FROM entities WHERE document_id = ?', row)
+            self.conn.execute('DELETE FROM relations WHERE document_id = ?', row)
+        
+        values = (result['document'], process['category'], process['subprocess'],
+                  process['number'], process['confidence'], time.time())
+        if row is None:
+            document_id = self.conn.execute(
+                'INSERT INTO documents (path, name, category, subprocess, process_number, confidence, updated) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?)', (path, *values)
+            ).lastrowid
+        else:
+            document_id = row[0]
+            self.conn.execute(
+                'UPDATE documents SET name = ?, category = ?, subprocess = ?, process_number = ?, '
+                'confidence = ?, updated = ? WHERE id = ?', (*values, document_id)
+            )
+        
+        self.conn.executemany(
+            'INSERT INTO entities (document_id, key, text, type) VALUES (?, ?, ?, ?)',
+            [(document_id, self.key(e['text'], e['type']), e['text'], e['type']) for e in result['entities']]
+        )
+        self.conn.executemany(
+            'INSERT INTO relations (document_id, source_key, target_key, relation, source, target, context) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            [
+                (document_id, self.key(r['source'], r.get('source_type', '')),
+                 self.key(r['target'], r.get('target_type', '')), r['relation'],
+                 r['source'], r['target'], r.get('context'))
+                for r in result['relations']
+            ]
+        )
+    
+    def documents_with_entity(self, text: str, entity_type: Optional[str] = None) -> List[Tuple]:
+        """Документы, в которых встречается сущность: (путь, текст сущности, тип)"""
+        keys = self._query_keys(text, entity_type)
+        query = ('SELECT d.path, e.text, e.type FROM entities e JOIN documents d ON d.id = e.document_id '
+                 f'WHERE e.key IN ({", ".join("?" * len(keys))})')
+        params = list(keys)
+        if entity_type is not None:
+            query += ' AND e.type = ?'
+            params.append(entity_type)
+        return self.conn.execute(query + ' ORDER BY d.path', params).fetchall()
+    
+    def relations_with_entity(self, text: str, relation: Optional[str] = None) -> List[Tuple]:
+        """Связи, в которых сущность - источник или цель: (путь, источник, связь, цель)"""
+        keys = self._query_keys(text)
+        condition = ' AND r.relation = ?' if relation is not None else ''
+        query = (
+            'SELECT d.path, r.source, r.relation, r.target, r.source_key FROM relations r '
+            'JOIN documents d ON d.id = r.document_id '
+            f'WHERE r.{{column}} IN ({", ".join("?" * len(keys))})' + condition
+        )
+        params = keys if relation is None else [*keys, relation]
+        # Две выборки по индексам вместо OR, который SQLite не всегда раскладывает по индексам
+        rows = self.conn.execute(query.format(column='source_key'), params).fetchall()
+        rows += [
+            row for row in self.conn.execute(query.format(column='target_key'), params)
+            if row[4] not in keys
+        ]
+        return [row[:4] for row in rows]
+    
+    def documents_in_process(self, number: int) -> List[Tuple]:
+        """Документы, отнесенные к бизнес-процессу: (путь, категория, подпроцесс, уверенность)"""
+        return self.conn.execute(
+            'SELECT path, category, subprocess, confidence FROM documents WHERE process_number = ? '
+            'ORDER BY confidence DESC', (number,)
+        ).fetchall()
+    
+    def search_entities(self, words: str, limit: int = 50) -> List[Tuple]:
+        """Сущности, ключ которых содержит слова запроса: (ключ, тип, количество документов)"""
+        if self.fts:
+            # Каждое слово - префиксный запрос FTS5 в кавычках (спецсимволы запроса не интерпретируются)
+            match = ' '.join('"{}"*'.format(word.replace('"', '""')) for word in self.key(words, '').split())
+            query = ('SELECT e.key, e.type, COUNT(DISTINCT e.document_id) FROM entities_fts f '
+                     'JOIN entities e ON e.id = f.rowid WHERE entities_fts MATCH ? '
+                     'GROUP BY e.key, e.type ORDER BY 3 DESC LIMIT ?')
+            return self.conn.execute(query, (match, limit)).fetchall()
+        return self.conn.execute(
+            'SELECT key, type, COUNT(DISTINCT document_id) FROM entities WHERE key LIKE ? '
+            'GROUP BY key, type ORDER BY 3 DESC LIMIT ?', (f"%{self.key(words, '')}%", limit)
+        ).fetchall()
+    
+    def stats(self) -> Dict[str, int]:
+        """Количество записей в таблицах"""
+        return {
+            table: self.conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+            for table in ('documents', 'entities', 'relations')
+        }
+    
+    def close(self):
+        self.conn.close()
+
+
+def main():
+    from config import ENTITY_STORE_PATH, ENTITY_NORMALIZATION, ENTITY_NORM_CACHE_SIZE, ENTITY_NORM_CACHE_PATH
+    
+    parser = argparse.ArgumentParser(description='Поиск по хранилищу сущностей и связей обработанных документов')
+    parser.add_argument('--db', type=str, default=str(ENTITY_STORE_PATH), help='Путь к хранилищу')
+    commands = parser.add_subparsers(dest='command', required=True)
+    entity = commands.add_parser('entity', help='Документы, в которых упоминается сущность')
+    entity.add_argument('text')
+    entity.add_argument('--type', help='Тип сущности (PER, ORG, LOC, ...)')
+    relations = commands.add_parser('relations', help='Связи с участием сущности')
+    relations.add_argument('text')
+    relations.add_argument('--relation', help='Тип связи')
+    process = commands.add_parser('process', help='Документы бизнес-процесса')
+    process.add_argument('number', type=int)
+    search = commands.add_parser('search', help='Сущности по словам (префиксный поиск)')
+    search.add_argument('words')
+    commands.add_parser('stats', help='Количество документов, сущностей и связей')
+    args = parser.parse_args()
+    
+    if not Path(args.db).exists():
+        print(f"Ошибка: хранилище не найдено: {args.db}")
+        return
+    # Текст запроса приводится к ключу по тому же правилу, что и при заполнении хранилища
+    normalizer = None
+    if ENTITY_NORMALIZATION:
+        from natasha import MorphVocab
+        normalizer = EntityNormalizer(functools.cache(MorphVocab), ENTITY_NORM_CACHE_SIZE, ENTITY_NORM_CACHE_PATH)
+    try:
+        store = EntityStore(Path(args.db), normalizer)
+    except ValueError as e:
+        print(f"Ошибка: {e}")
+        return
+    started = time.perf_counter()
+    if args.command == 'entity':
+        rows = store.documents_with_entity(args.text, args.type)
+    elif args.command == 'relations':
+        rows = store.relations_with_entity(args.text, args.relation)
+    elif args.command == 'process':
+        rows = store.documents_in_process(args.number)
+    elif args.command == 'search':
+        rows = store.search_entities(args.words)
+    else:
+        rows = list(store.stats().items())
+    elapsed = time.perf_counter() - started
+    store.close()
+    if normalizer is not None:
+        normalizer.save()
+    
+    for row in rows:
+        print('\t'.join('' if value is None else str(value) for value in row))
+    print(f"Найдено: {len(rows)} ({elapsed * 1000:.1f} мс)")
+
+
+if __name__ == "__main__":
+    main()
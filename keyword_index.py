@@ -0,0 +1,124 @@
+"""
+Модуль индекса позиций ключевых слов в тексте для проверки окон бинарным поиском
+"""
+from bisect import bisect_left
+from functools import lru_cache
+from typing import Dict, Iterable, List, Optional, Tuple
+import numpy as np
+from keyword_matcher import KeywordMatcher
+
+
+@lru_cache(maxsize=16)
+def _matcher(words: Tuple[str, ...]) -> KeywordMatcher:
+    """Автомат по словам всех групп (индекс строится на каждый документ, а словари групп постоянны)"""
+    return KeywordMatcher(words)
+
+
+class KeywordIndex:
+    """Позиции вхождений групп ключевых слов в тексте документа (без учета регистра).
+    
+    Вхождения слов всех групп находятся за один проход по тексту (KeywordMatcher.finditer);
+    после этого вопрос «есть ли в окне [start, end) целое вхождение хотя бы одного слова группы»
+    решается одним бинарным поиском - так же, как поиск подстроки в context.lower() для каждой
+    пары сущностей, но без прохода по окну. Позиции собираются при первом запросе. Исключение -
+    короткие слова (предлоги «с», «в», «на»): они встречаются в тексте тысячи раз, поэтому
+    их позиции находятся векторно по кодам символов, а не перебором вхождений.
+    """
+    
+    SHORT_WORD = 3  # Слова до этой длины ищутся векторно, длиннее - автоматом KeywordMatcher
+    
+    def __init__(self, text: str, groups: Dict[str, Iterable[str]], offset: int = 0):
+        # 'İ'.lower() - единственная буква, дающая два символа: заменяем ее, чтобы позиции
+        # в тексте в нижнем регистре совпадали с исходными (на вхождения кириллицы это не влияет)
+        self.text_lower = text.replace('İ', 'i').lower()
+        self.offset = offset
+        self.groups = {name: tuple(dict.fromkeys(word.lower() for word in words)) for name, words in groups.items()}
+        self._positions: Optional[Dict[str, Tuple]] = None
+        self._codes = None  # Коды символов текста (для коротких слов)
+    
+    def _build(self) -> Dict[str, Tuple]:
+        """Позиции каждой группы: начала однобуквенных слов; начала, концы и слова остальных вхождений
+        по возрастанию начала и минимальные концы вхождений, начинающихся не раньше"""
+        offset = self.offset
+        # Длинные слова всех групп - один проход автомата; позиции затем делятся по группам
+        matcher = _matcher(tuple(
+            word for words in self.groups.values() for word in words if len(word) > self.SHORT_WORD
+        ))
+        found = np.array(list(matcher.finditer(self.text_lower)), dtype=np.int64).reshape(-1, 2)
+        found_starts, found_words = found[:, 0], found[:, 1]
+        lookup = {word: index for index, word in enumerate(matcher.keywords)}
+        
+        positions = {}
+        for name, words in self.groups.items():
+            letters = [ord(word) for word in words if len(word) == 1]
+            single = []
+            if letters:
+                single = (np.flatnonzero(np.isin(self.codes, letters)) + offset).tolist()
+            
+            # Индекс слова автомата -> индекс слова в группе (-1 - слово другой группы)
+            group_ids = np.full(len(matcher.keywords), -1, dtype=np.int64)
+            lengths = np.zeros(len(matcher.keywords), dtype=np.int64)
+            starts, ends, word_ids = [], [], []
+            for index, word in enumerate(words):
+                if len(word) > self.SHORT_WORD:
+                    group_ids[lookup[word]] = index
+                    lengths[lookup[word]] = len(word)
+                elif len(word) > 1:
+                    # Короткие слова (предлоги «на», «по») часты: позиции ищутся сравнением сдвигов кодов
+                    short = self._find_short(word)
+                    starts.append(short)
+                    ends.append(short + len(word))
+                    word_ids.append(np.full(len(short), index))
+            group_words = group_ids[found_words]
+            mask = group_words >= 0
+            starts.append(found_starts[mask])
+            ends.append(found_starts[mask] + lengths[found_words[mask]])
+            word_ids.append(group_words[mask])
+            
+            starts, ends, word_ids = np.concatenate(starts), np.concatenate(ends), np.concatenate(word_ids)
+            order = np.lexsort((ends, starts))
+            starts, ends, word_ids = starts[order] + offset, ends[order] + offset, word_ids[order]
+            # Минимальный конец среди вхождений, начинающихся не раньше данного
+            min_ends = np.minimum.accumulate(ends[::-1])[::-1]
+            positions[name] = (single, starts.tolist(), ends.tolist(), min_ends.tolist(), word_ids.tolist())
+        self._positions = positions
+        return positions
+    
+    @property
+    def codes(self) -> np.ndarray:
+        """Коды символов текста в нижнем регистре"""
+        if self._codes is None:
+            self._codes = np.frombuffer(self.text_lower.encode('utf-32-le'), dtype=np.uint32)
+        return self._codes
+    
+    def _find_short(self, word: str) -> np.ndarray:
+        """Все (в том числе перекрывающиеся) вхождения короткого слова"""
+        codes = self.codes
+        count = len(codes) - len(word) + 1
+        if count <= 0:
+            return np.empty(0, dtype=np.int64)
+        mask = codes[:count] == ord(word[0])
+        for k in range(1, len(word)):
+            mask &= codes[k:k + count] == ord(word[k])
+        return np.flatnonzero(mask)
+    
+    def contains(self, name: str, start: int, end: int) -> bool:
+        """Есть ли вхождение слова группы name целиком внутри [start, end)"""
+        single, starts, _, min_ends, _ = (self._positions or self._build())[name]
+        i = bisect_left(single, start)
+        if i < len(single) and single[i] < end:
+            return True
+        i = bisect_left(starts, start)
+        return i < len(starts) and min_ends[i] <= end
+    
+    def found(self, name: str, start: int, end: int) -> List[str]:
+        """Слова группы name из двух и более букв, вхождения которых целиком внутри [start, end)"""
+        _, starts, ends, _, word_ids = (self._positions or self._build())[name]
+        group = self.groups[name]
+        words = []
+        i = bisect_left(starts, start)
+        while i < len(starts) and starts[i] < end:
+            if ends[i] <= end:
+                words.append(group[word_ids[i]])
+            i += 1
+        return words
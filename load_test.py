@@ -0,0 +1,101 @@
+"""
+Нагрузочный тест сервиса обработки документов: задержки p50/p99 и пропускная способность
+"""
+import argparse
+import asyncio
+import json
+import time
+from pathlib import Path
+from typing import List, Optional, Tuple
+from config import SERVICE_HOST, SERVICE_PORT
+
+
+SAMPLE_TEXT = (
+    "Акционерное общество «ВДНХ», именуемое в дальнейшем «Заказчик», в лице Генерального директора "
+    "Иванова Петра Сергеевича, и ООО «ПромТрансНефть», именуемое в дальнейшем «Поставщик», заключили "
+    "настоящий договор. ВДНХ заключил договор с ПромТрансНефть на поставку топлива. "
+)
+
+
+async def send_request(host: str, port: int, unix_socket: Optional[str], payload: bytes) -> Tuple[int, float]:
+    """Отправляет один запрос POST /process; возвращает код ответа и задержку в секундах"""
+    started = time.perf_counter()
+    if unix_socket:
+        reader, writer = await asyncio.open_unix_connection(unix_socket)
+    else:
+        reader, writer = await asyncio.open_connection(host, port)
+    
+    writer.write(
+        f'POST /process HTTP/1.1\r\nHost: {host}\r\n'
+        f'Content-Type: application/json\r\nContent-Length: {len(payload)}\r\n\r\n'.encode('latin-1') + payload
+    )
+    await writer.drain()
+    status_line = await reader.readline()
+    await reader.read()
+    writer.close()
+    
+    status = int(status_line.split()[1]) if status_line else 0
+    return status, time.perf_counter() - started
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Перцентиль по методу ближайшего ранга"""
+    ordered = sorted(values)
+    index = max(0, min(len(ordered) - 1, int(round(q / 100.0 * len(ordered) + 0.5)) - 1))
+    return ordered[index]
+
+
+async def run(args):
+    if args.dir:
+        files = sorted(
+            p for p in Path(args.dir).iterdir()
+            if p.suffix.lower() in ('.docx', '.pdf', '.txt')
+        )
+        payloads = [json.dumps({'path': str(p.resolve())}).encode('utf-8') for p in files]
+    else:
+        text = SAMPLE_TEXT * args.repeat
+        payloads = [json.dumps({'text': text, 'name': 'sample.txt'}, ensure_ascii=False).encode('utf-8')]
+    
+    if not payloads:
+        print("Не найдено файлов для отправки")
+        return
+    
+    latencies = []
+    statuses = {}
+    semaphore = asyncio.Semaphore(args.concurrency)
+    
+    async def worker(i: int):
+        async with semaphore:
+            status, latency = await send_request(args.host, args.port, args.unix, payloads[i % len(payloads)])
+            statuses[status] = statuses.get(status, 0) + 1
+            if status == 200:
+                latencies.append(latency)
+    
+    started = time.perf_counter()
+    await asyncio.gather(*(worker(i) for i in range(args.requests)))
+    elapsed = time.perf_counter() - started
+    
+    print(f"Запросов: {args.requests}, параллельно: {args.concurrency}, время: {elapsed:.2f} с")
+    print(f"Коды ответов: {statuses}")
+    if latencies:
+        print(f"Пропускная способность: {len(latencies) / elapsed:.1f} док/с")
+        print(f"Задержка p50: {percentile(latencies, 50) * 1000:.0f} мс")
+        print(f"Задержка p99: {percentile(latencies, 99) * 1000:.0f} мс")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Нагрузочный тест сервиса обработки документов')
+    parser.add_argument('--host', type=str, default=SERVICE_HOST, help='Адрес сервиса')
+    parser.add_argument('--port', type=int, default=SERVICE_PORT, help='Порт сервиса')
+    parser.add_argument('--unix', type=str, help='Путь к Unix-сокету сервиса')
+    parser.add_argument('--dir', type=str, help='Директория с документами (пути передаются сервису)')
+    parser.add_argument('--repeat', type=int, default=5, help='Размер синтетического документа (повторов образца)')
+    parser.add_argument('--requests', type=int, default=200, help='Общее число запросов')
+    parser.add_argument('--concurrency', type=int, default=16, help='Число одновременных запросов')
+    args = parser.parse_args()
+    
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -2,26 +2,203 @@
 Главный скрипт для запуска пайплайна обработки документов
 """
 import argparse
+import importlib
+import time
+import traceback
+from multiprocessing import Pool, util
 from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+_import_started = time.perf_counter()
 from pipeline import DocumentPipeline
-from config import DATA_DIR, OUTPUT_DIR
+from metrics import MetricsAggregator, add_result_stage
+from output_sink import OUTPUT_FORMATS, create_sink
+from watcher import DirectoryWatcher, Manifest, is_document
+from config import (
+    DATA_DIR, OUTPUT_DIR, NUM_WORKERS, DOC_BATCH_SIZE, RESULT_CACHE_ENABLED, METRICS_ENABLED,
+    WATCH_DEBOUNCE, WATCH_POLL_INTERVAL, WATCH_MANIFEST_NAME, OUTPUT_FORMAT, OUTPUT_INDENT,
+    OUTPUT_BATCH_DOCUMENTS, ENTITY_STORE_ENABLED, ENTITY_STORE_PATH
+)
+_PIPELINE_IMPORT_TIME = time.perf_counter() - _import_started
 
 
-def main():
-    parser = argparse.ArgumentParser(description='Обработка документов для извлечения сущностей, связей и классификации')
-    parser.add_argument('--file', type=str, help='Путь к файлу для обработки')
-    parser.add_argument('--dir', type=str, help='Директория с файлами для обработки')
-    parser.add_argument('--output', type=str, help='Директория для сохранения результатов (по умолчанию: output/)')
+# Пайплайн процесса-воркера (создается один раз в инициализаторе пула)
+_worker_pipeline: Optional[DocumentPipeline] = None
+_worker_save = True  # Сохранять ли результаты воркера в JSON (иначе их пишет основной процесс)
+
+
+def _init_worker(use_cache: bool, collect_metrics: bool, use_store: bool, output_indent: Optional[int], save: bool):
+    """Инициализация воркера: каждый процесс загружает свои модели один раз"""
+    global _worker_pipeline, _worker_save
+    _worker_pipeline = DocumentPipeline(use_cache=use_cache, collect_metrics=collect_metrics, use_store=use_store)
+    _worker_pipeline.output_indent = output_indent
+    _worker_pipeline.ner_extractor.load()
+    _worker_save = save
+    # Кэш нормализации сохраняется при штатном завершении воркера (pool.close() + join())
+    util.Finalize(_worker_pipeline, _worker_pipeline.close, exitpriority=10)
+
+
+def _process_group(pipeline: DocumentPipeline, group: List[Tuple[Path, Path]],
+                   save: bool = True) -> List[Tuple[Path, Path, Optional[Dict], Optional[str]]]:
+    """Обрабатывает группу файлов одним батчем; при ошибке повторяет по одному файлу.
     
-    args = parser.parse_args()
+    При save=False результаты не сохраняются в JSON-файлы (их записывает приемник вызывающего кода).
+    """
+    file_paths = [file_path for file_path, _ in group]
+    output_paths = [output_path for _, output_path in group]
+    counters = [(cache, cache.hits, cache.misses) for cache in _stats_caches(pipeline)]
+    try:
+        if save:
+            results = pipeline.process_and_save_batch(file_paths, output_paths)
+        else:
+            results = pipeline.process_documents(file_paths)
+    except Exception:
+        if len(group) == 1:
+            return [(file_paths[0], output_paths[0], None, traceback.format_exc())]
+        results = None
     
-    # Инициализируем пайплайн
-    print("Инициализация пайплайна...")
-    pipeline = DocumentPipeline()
+    if results is None:
+        # Изолируем сбойный файл, чтобы не терять результаты остальных; обращения к кэшам
+        # из неудавшейся попытки не учитываются, иначе повтор посчитал бы их дважды
+        for cache, hits, misses in counters:
+            cache.hits, cache.misses = hits, misses
+        outcomes = []
+        for task in group:
+            outcomes.extend(_process_group(pipeline, [task], save))
+        return outcomes
     
-    # Определяем выходную директорию
-    output_dir = Path(args.output) if args.output else OUTPUT_DIR
-    output_dir.mkdir(exist_ok=True)
+    return [
+        (file_path, output_path, None, result['error']) if 'error' in result
+        else (file_path, output_path, result, None)
+        for file_path, output_path, result in zip(file_paths, output_paths, results)
+    ]
+
+
+def _stats_caches(pipeline: DocumentPipeline) -> List:
+    """Кэши пайплайна, счетчики попаданий которых выводятся в итогах запуска"""
+    caches = [pipeline.result_cache, pipeline.ner_extractor.lemma_cache]
+    if pipeline.entity_normalizer is not None:
+        caches.append(pipeline.entity_normalizer.cache)
+    return [cache for cache in caches if cache is not None]
+
+
+def _process_group_worker(group: List[Tuple[Path, Path]]) -> List[Tuple[Path, Path, Optional[Dict], Optional[str]]]:
+    """Обрабатывает группу файлов в процессе-воркере, ошибки возвращаются, а не пробрасываются"""
+    return _process_group(_worker_pipeline, group, _worker_save)
+
+
+def _write_to_sink(sink, result: Dict, file_path: Path):
+    """Записывает результат в приемник; время записи попадает в метрики как этап serialize"""
+    started = time.perf_counter(), time.process_time()
+    sink.write(result, file_path)
+    add_result_stage(result, 'serialize', started, len(result['entities']) + len(result['relations']))
+
+
+def _print_startup_profile(pipeline: DocumentPipeline):
+    """Печатает время импорта и инициализации компонентов пайплайна"""
+    # Модели и библиотеки чтения загружаются лениво - загружаем их здесь, чтобы измерить
+    pipeline.ner_extractor.load()
+    reader_imports = {}
+    for module in ('docx', 'pdfplumber'):
+        started = time.perf_counter()
+        importlib.import_module(module)
+        reader_imports[f'import {module}'] = time.perf_counter() - started
+    
+    print("Профиль старта:")
+    print(f"  {'import pipeline':<28} {_PIPELINE_IMPORT_TIME * 1000:8.1f} мс")
+    sections = [
+        ('Инициализация компонентов', pipeline.startup_timings),
+        (f'Загрузка моделей NER ({pipeline.ner_extractor.model_type})', pipeline.ner_extractor.load_timings),
+        ('Библиотеки чтения документов', reader_imports),
+    ]
+    for title, timings in sections:
+        print(f"  {title}:")
+        for name, seconds in timings.items():
+            print(f"    {name:<26} {seconds * 1000:8.1f} мс")
+
+
+def _print_result(result: Dict, output_path: Path):
+    """Печатает краткую сводку по обработанному документу"""
+    print(f"  ✓ Сущностей найдено: {result['statistics']['total_entities']}")
+    print(f"  ✓ Связей найдено: {result['statistics']['total_relations']}")
+    print(f"  ✓ Цепочек построено: {result['statistics']['total_chains']}")
+    print(f"  ✓ Бизнес-процесс: {result['business_process']['category']} - {result['business_process']['subprocess']}")
+    print(f"  ✓ Результат сохранен: {output_path}")
+
+
+def _watch(pipeline: DocumentPipeline, dir_path: Path, output_dir: Path, doc_batch: int, sink=None):
+    """Режим наблюдения: обрабатывает новые и измененные документы, пока не прервут (Ctrl+C)"""
+    manifest = Manifest(output_dir / WATCH_MANIFEST_NAME)
+    watcher = DirectoryWatcher(dir_path, debounce=WATCH_DEBOUNCE, poll_interval=WATCH_POLL_INTERVAL)
+    
+    def process(paths: List[Path]):
+        # Файлы с прежним содержимым (по манифесту) пропускаются
+        changed = []
+        for file_path in paths:
+            digest = manifest.changed_hash(file_path)
+            if digest is not None:
+                changed.append((file_path, digest))
+        
+        for i in range(0, len(changed), doc_batch):
+            group = changed[i:i + doc_batch]
+            tasks = [(file_path, output_dir / f"{file_path.stem}_result.json") for file_path, _ in group]
+            for (file_path, digest), outcome in zip(group, _process_group(pipeline, tasks, sink is None)):
+                _, output_path, result, error = outcome
+                print(f"\nОбработка: {file_path.name}")
+                if error is None:
+                    if sink is not None:
+                        _write_to_sink(sink, result, file_path)
+                        output_path = sink.path
+                    _print_result(result, output_path)
+                    manifest.record(file_path, digest)
+                else:
+                    print(f"  ✗ Ошибка при обработке:\n{error}")
+        # Манифест сохраняется только после записи результатов на диск
+        if sink is not None:
+            sink.flush()
+        manifest.save()
+    
+    try:
+        # Сначала обрабатываем изменения, сделанные, пока наблюдение не работало
+        process(sorted(path for path in dir_path.iterdir() if is_document(path)))
+        print(f"\nНаблюдение за {dir_path} ({watcher.mode}), Ctrl+C - выход")
+        for paths in watcher.changes():
+            process(paths)
+    except KeyboardInterrupt:
+        print("\nНаблюдение остановлено")
+    finally:
+        watcher.close()
+        manifest.save()
+
+
+def _print_lru_stats(name: str, cache):
+    """Доля попаданий LRU-кэша (ничего не выводит, если кэш не использовался)"""
+    if cache is not None and cache.hits + cache.misses:
+        print(f"{name}: попаданий в кэш {cache.hits} из {cache.hits + cache.misses} "
+              f"({cache.hit_rate:.1%}), ключей в кэше: {len(cache)}")
+
+
+def _run(args: argparse.Namespace, output_dir: Path, output_indent: Optional[int], sink,
+         use_cache: bool, collect_metrics: bool):
+    """Обработка документов по аргументам командной строки; результаты - в JSON-файлы или в sink"""
+    use_store = ENTITY_STORE_ENABLED or args.store
+    if args.watch:
+        if args.file:
+            print("Ошибка: --watch работает с директорией, а не с отдельным файлом")
+            return
+        dir_path = Path(args.dir) if args.dir else DATA_DIR
+        if not dir_path.is_dir():
+            print(f"Ошибка: директория не найдена: {dir_path}")
+            return
+        print("Инициализация пайплайна...")
+        pipeline = DocumentPipeline(use_cache=use_cache, collect_metrics=collect_metrics, use_store=use_store)
+        pipeline.output_indent = output_indent
+        pipeline.ner_extractor.load()
+        try:
+            _watch(pipeline, dir_path, output_dir, args.doc_batch, sink)
+        finally:
+            pipeline.close()
+        return
     
     files_to_process = []
     
@@ -53,27 +230,138 @@ def main():
     
     print(f"Найдено файлов для обработки: {len(files_to_process)}")
     
-    # Обрабатываем каждый файл
-    for i, file_path in enumerate(files_to_process, 1):
-        print(f"\n[{i}/{len(files_to_process)}] Обработка: {file_path.name}")
+    tasks = [(file_path, output_dir / f"{file_path.stem}_result.json") for file_path in files_to_process]
+    groups = [tasks[i:i + args.doc_batch] for i in range(0, len(tasks), args.doc_batch)]
+    failed = []
+    aggregator = MetricsAggregator()
+    
+    def report(i: int, outcome: Tuple[Path, Path, Optional[Dict], Optional[str]]):
+        file_path, output_path, result, error = outcome
+        print(f"\n[{i}/{len(tasks)}] Обработка: {file_path.name}")
+        if error is None:
+            if sink is not None:
+                _write_to_sink(sink, result, file_path)
+                output_path = sink.path
+            _print_result(result, output_path)
+            aggregator.add_result(result)
+        else:
+            failed.append(file_path)
+            print(f"  ✗ Ошибка при обработке:\n{error}")
+    
+    if args.workers > 1 and len(groups) > 1:
+        # Параллельная обработка: каждый воркер инициализирует модели один раз
+        # и забирает группы файлов из общей очереди задач
+        workers = min(args.workers, len(groups))
+        if args.profile_startup:
+            print("Профиль старта доступен только при последовательной обработке (--workers 1)")
+        print(f"Инициализация пула из {workers} воркеров...")
+        initargs = (use_cache, collect_metrics, use_store, output_indent, sink is None)
+        with Pool(processes=workers, initializer=_init_worker, initargs=initargs) as pool:
+            processed = 0
+            for outcomes in pool.imap_unordered(_process_group_worker, groups, chunksize=1):
+                for outcome in outcomes:
+                    processed += 1
+                    report(processed, outcome)
+            # Штатное завершение воркеров (а не terminate при выходе из with): они сохраняют свои кэши
+            pool.close()
+            pool.join()
+    else:
+        # Инициализируем пайплайн
+        print("Инициализация пайплайна...")
+        pipeline = DocumentPipeline(use_cache=use_cache, collect_metrics=collect_metrics, use_store=use_store)
+        pipeline.output_indent = output_indent
+        if args.profile_startup:
+            _print_startup_profile(pipeline)
+        
+        # Обрабатываем файлы группами
+        processed = 0
         try:
-            result = pipeline.process_and_save(
-                file_path,
-                output_path=output_dir / f"{file_path.stem}_result.json"
-            )
-            
-            print(f"  ✓ Сущностей найдено: {result['statistics']['total_entities']}")
-            print(f"  ✓ Связей найдено: {result['statistics']['total_relations']}")
-            print(f"  ✓ Цепочек построено: {result['statistics']['total_chains']}")
-            print(f"  ✓ Бизнес-процесс: {result['business_process']['category']} - {result['business_process']['subprocess']}")
-            print(f"  ✓ Результат сохранен: {output_dir / f'{file_path.stem}_result.json'}")
-            
-        except Exception as e:
-            print(f"  ✗ Ошибка при обработке: {str(e)}")
-            import traceback
-            traceback.print_exc()
-    
-    print(f"\nОбработка завершена. Результаты сохранены в: {output_dir}")
+            for group in groups:
+                for outcome in _process_group(pipeline, group, sink is None):
+                    processed += 1
+                    report(processed, outcome)
+        finally:
+            # Пул процессов чтения PDF останавливается и при прерывании обработки
+            pipeline.close()
+        
+        if pipeline.result_cache is not None:
+            print(f"\nВзято из кэша: {pipeline.result_cache.hits}, обработано заново: {pipeline.result_cache.misses}")
+        _print_lru_stats('Нормализация сущностей',
+                         pipeline.entity_normalizer.cache if pipeline.entity_normalizer is not None else None)
+        _print_lru_stats('Леммы слов', pipeline.ner_extractor.lemma_cache)
+    
+    if failed:
+        print(f"\nНе удалось обработать файлов: {len(failed)} из {len(tasks)}")
+        for file_path in failed:
+            print(f"  - {file_path}")
+    
+    if use_store:
+        print(f"\nСущности и связи добавлены в хранилище: {ENTITY_STORE_PATH}")
+    
+    if collect_metrics and aggregator.documents:
+        print(f"\nМетрики этапов (документов без взятых из кэша: {len(aggregator.documents)}):")
+        print(aggregator.summary())
+        if args.metrics:
+            aggregator.save(Path(args.metrics))
+            print(f"Метрики сохранены: {args.metrics}")
+    
+    print(f"\nОбработка завершена. Результаты сохранены в: {sink.path if sink is not None else output_dir}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Обработка документов для извлечения сущностей, связей и классификации')
+    parser.add_argument('--file', type=str, help='Путь к файлу для обработки')
+    parser.add_argument('--dir', type=str, help='Директория с файлами для обработки')
+    parser.add_argument('--output', type=str, help='Директория для сохранения результатов (по умолчанию: output/)')
+    parser.add_argument('--workers', type=int, default=NUM_WORKERS,
+                        help='Количество процессов-воркеров (по умолчанию: 1 - последовательная обработка)')
+    parser.add_argument('--doc-batch', type=int, default=DOC_BATCH_SIZE,
+                        help='Количество документов, обрабатываемых NER одним батчем')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='Обрабатывать все документы заново, не используя кэш результатов')
+    parser.add_argument('--profile-startup', action='store_true',
+                        help='Вывести время импорта и инициализации каждого компонента')
+    parser.add_argument('--watch', action='store_true',
+                        help='Следить за директорией (--dir или validate_data) и обрабатывать новые '
+                             'и измененные файлы')
+    parser.add_argument('--metrics', type=str,
+                        help='Замерять этапы обработки и сохранить метрики в файл '
+                             '(.jsonl - JSON Lines, иначе текстовый формат Prometheus)')
+    parser.add_argument('--format', choices=OUTPUT_FORMATS, default=OUTPUT_FORMAT,
+                        help='Формат результатов: json - файл на документ, jsonl - один файл results.jsonl, '
+                             'parquet - таблицы documents/entities/relations.parquet')
+    parser.add_argument('--compact', action='store_true',
+                        help='Сохранять JSON-файлы результатов без отступов')
+    parser.add_argument('--store', action='store_true',
+                        help='Добавлять сущности, связи и бизнес-процессы документов в хранилище '
+                             'для поиска (python entity_store.py)')
+    
+    args = parser.parse_args()
+    use_cache = RESULT_CACHE_ENABLED and not args.no_cache
+    collect_metrics = METRICS_ENABLED or bool(args.metrics)
+    
+    if args.workers < 1:
+        print(f"Ошибка: количество воркеров должно быть положительным: {args.workers}")
+        return
+    if args.doc_batch < 1:
+        print(f"Ошибка: размер батча документов должен быть положительным: {args.doc_batch}")
+        return
+    
+    # Определяем выходную директорию
+    output_dir = Path(args.output) if args.output else OUTPUT_DIR
+    output_dir.mkdir(exist_ok=True)
+    output_indent = None if args.compact else OUTPUT_INDENT
+    try:
+        sink = create_sink(args.format, output_dir, OUTPUT_BATCH_DOCUMENTS)
+    except ImportError as e:
+        print(f"Ошибка: {e}")
+        return
+    
+    try:
+        _run(args, output_dir, output_indent, sink, use_cache, collect_metrics)
+    finally:
+        if sink is not None:
+            sink.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,239 @@
+"""
+Модуль для замера времени и пропускной способности этапов обработки документов
+"""
+import json
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+
+# Этапы пайплайна в порядке выполнения
+STAGES = ['read', 'fingerprint', 'chunk', 'ner', 'dedup', 'relations', 'classify', 'chains', 'serialize']
+
+
+class _Stage:
+    """Замер одного этапа: контекстный менеджер, items можно задать внутри блока"""
+    
+    __slots__ = ('metrics', 'name', 'size', 'items', 'wall', 'cpu')
+    
+    def __init__(self, metrics: 'DocumentMetrics', name: str, size: int):
+        self.metrics = metrics
+        self.name = name
+        self.size = size
+        self.items = 0
+    
+    def __enter__(self):
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.metrics.add(self.name, time.perf_counter() - self.wall, time.process_time() - self.cpu,
+                         self.size, self.items)
+
+
+class _Laps:
+    """Последовательные замеры: каждый lap() записывает время с предыдущего замера"""
+    
+    __slots__ = ('metrics', 'wall', 'cpu')
+    
+    def __init__(self, metrics: 'DocumentMetrics'):
+        self.metrics = metrics
+        self.wall = time.perf_counter()
+        self.cpu = time.process_time()
+    
+    def lap(self, name: str, size: int = 0, items: int = 0):
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        self.metrics.add(name, wall - self.wall, cpu - self.cpu, size, items)
+        self.wall = wall
+        self.cpu = cpu
+
+
+class DocumentMetrics:
+    """Метрики этапов обработки одного документа.
+    
+    Для каждого этапа копятся wall- и CPU-время (с), объем входа (size) и число результатов (items).
+    """
+    
+    enabled = True
+    
+    def __init__(self):
+        self.stages = {}
+    
+    def stage(self, name: str, size: int = 0) -> _Stage:
+        """Замеряет блок кода как этап name"""
+        return _Stage(self, name, size)
+    
+    def laps(self) -> _Laps:
+        """Запускает последовательные замеры идущих друг за другом этапов"""
+        return _Laps(self)
+    
+    def add(self, name: str, wall: float, cpu: float, size: int = 0, items: int = 0):
+        """Добавляет замер к этапу (повторные замеры одного этапа суммируются)"""
+        record = self.stages.get(name)
+        if record is None:
+            record = self.stages[name] = {'wall': 0.0, 'cpu': 0.0, 'size': 0, 'items': 0}
+        record['wall'] += wall
+        record['cpu'] += cpu
+        record['size'] += size
+        record['items'] += items
+    
+    def iterate(self, name: str, iterable: Iterable, items=len) -> Iterator:
+        """Отдает элементы iterable, замеряя время их получения как этап name (items(элемент) - в items этапа)"""
+        iterator = iter(iterable)
+        while True:
+            wall = time.perf_counter()
+            cpu = time.process_time()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                self.add(name, time.perf_counter() - wall, time.process_time() - cpu)
+                return
+            self.add(name, time.perf_counter() - wall, time.process_time() - cpu, 0, items(item))
+            yield item
+    
+    def exclude(self, name: str, nested: str):
+        """Вычитает из этапа name время вложенного в него этапа nested"""
+        if name in self.stages and nested in self.stages:
+            self.stages[name]['wall'] -= self.stages[nested]['wall']
+            self.stages[name]['cpu'] -= self.stages[nested]['cpu']
+    
+    def to_dict(self) -> Dict[str, Dict]:
+        """Метрики для блока statistics результата"""
+        return {
+            name: {
+                'wall_ms': round(record['wall'] * 1000, 3),
+                'cpu_ms': round(record['cpu'] * 1000, 3),
+                'size': record['size'],
+                'items': record['items'],
+            }
+            for name, record in self.stages.items()
+        }
+
+
+class _NullStage:
+    """Пустой замер: ничего не делает"""
+    
+    __slots__ = ('size', 'items')
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        return None
+    
+    def lap(self, name: str, size: int = 0, items: int = 0):
+        pass
+
+
+class NullMetrics:
+    """Метрики при выключенном замере: все вызовы ничего не делают"""
+    
+    enabled = False
+    _stage = _NullStage()
+    
+    def stage(self, name: str, size: int = 0) -> _NullStage:
+        return self._stage
+    
+    def laps(self) -> _NullStage:
+        return self._stage
+    
+    def add(self, name: str, wall: float, cpu: float, size: int = 0, items: int = 0):
+        pass
+    
+    def iterate(self, name: str, iterable: Iterable, items=len) -> Iterable:
+        return iterable
+    
+    def exclude(self, name: str, nested: str):
+        pass
+
+
+NULL_METRICS = NullMetrics()
+
+
+def add_result_stage(result: Dict, name: str, started: Tuple[float, float], size: int = 0, items: int = 0):
+    """Добавляет в statistics['stages'] результата этап, начатый в started = (perf_counter, process_time).
+    
+    Используется для этапов после формирования результата (сериализация); без замера ничего не делает.
+    """
+    stages = result.get('statistics', {}).get('stages')
+    if stages is None:
+        return
+    stages[name] = {
+        'wall_ms': round((time.perf_counter() - started[0]) * 1000, 3),
+        'cpu_ms': round((time.process_time() - started[1]) * 1000, 3),
+        'size': size,
+        'items': items,
+    }
+
+
+class MetricsAggregator:
+    """Сводные метрики по всем обработанным документам"""
+    
+    def __init__(self):
+        self.documents = []  # (имя документа, метрики этапов из statistics['stages'])
+        self.totals = {}
+    
+    def add_result(self, result: Dict):
+        """Учитывает метрики из результата обработки (результаты из кэша их не содержат)"""
+        stages = result.get('statistics', {}).get('stages')
+        if not stages:
+            return
+        self.documents.append((result['document'], stages))
+        for name, record in stages.items():
+            total = self.totals.setdefault(name, {'wall_ms': 0.0, 'cpu_ms': 0.0, 'size': 0, 'items': 0})
+            for field in total:
+                total[field] += record[field]
+    
+    def _ordered_totals(self) -> List:
+        order = {name: i for i, name in enumerate(STAGES)}
+        return sorted(self.totals.items(), key=lambda item: order.get(item[0], len(order)))
+    
+    def to_prometheus(self) -> str:
+        """Сводные метрики в текстовом формате Prometheus"""
+        metrics = [
+            ('pipeline_stage_wall_seconds_total', 'counter', 'Wall-время этапа, с', lambda r: r['wall_ms'] / 1000),
+            ('pipeline_stage_cpu_seconds_total', 'counter', 'CPU-время этапа, с', lambda r: r['cpu_ms'] / 1000),
+            ('pipeline_stage_input_size_total', 'counter', 'Объем входа этапа', lambda r: r['size']),
+            ('pipeline_stage_items_total', 'counter', 'Число результатов этапа', lambda r: r['items']),
+        ]
+        lines = [
+            '# HELP pipeline_documents_total Документов с замером этапов',
+            '# TYPE pipeline_documents_total counter',
+            f'pipeline_documents_total {len(self.documents)}',
+        ]
+        for metric, kind, help_text, value in metrics:
+            lines.append(f'# HELP {metric} {help_text}')
+            lines.append(f'# TYPE {metric} {kind}')
+            for name, record in self._ordered_totals():
+                lines.append(f'{metric}{{stage="{name}"}} {value(record):.6g}')
+        return '\n'.join(lines) + '\n'
+    
+    def to_json_lines(self) -> str:
+        """Метрики в формате JSON Lines: строка на документ и итоговая строка"""
+        lines = [
+            json.dumps({'document': document, 'stages': stages}, ensure_ascii=False)
+            for document, stages in self.documents
+        ]
+        totals = {
+            name: {**record, 'throughput': record['size'] / (record['wall_ms'] / 1000) if record['wall_ms'] else None}
+            for name, record in self._ordered_totals()
+        }
+        lines.append(json.dumps({'documents': len(self.documents), 'stages': totals}, ensure_ascii=False))
+        return '\n'.join(lines) + '\n'
+    
+    def save(self, output_path: Path):
+        """Сохраняет метрики: .jsonl - JSON Lines, иначе текстовый формат Prometheus"""
+        output_path = Path(output_path)
+        data = self.to_json_lines() if output_path.suffix == '.jsonl' else self.to_prometheus()
+        with open(output_path, 'w', encoding='utf-8') as f:
+            f.write(data)
+    
+    def summary(self) -> str:
+        """Краткая таблица по этапам для вывода в консоль"""
+        lines = [f"{'Этап':<10} {'wall, мс':>10} {'cpu, мс':>10} {'вход':>12} {'результатов':>12}"]
+        for name, record in self._ordered_totals():
+            lines.append(f"{name:<10} {record['wall_ms']:>10.1f} {record['cpu_ms']:>10.1f} "
+                         f"{record['size']:>12} {record['items']:>12}")
+        return '\n'.join(lines)
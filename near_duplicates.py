@@ -0,0 +1,154 @@
+"""
+Модуль для поиска почти-дубликатов документов (MinHash + LSH) до извлечения сущностей
+"""
+import hashlib
+import json
+import re
+import sqlite3
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+
+
+WORD_RE = re.compile(r'\w+')
+MERSENNE_PRIME = (1 << 61) - 1
+
+
+def lsh_bands(num_perm: int, threshold: float) -> Tuple[int, int]:
+    """Разбиение сигнатуры на (полосы, строки в полосе) для порога похожести.
+    
+    Берется разбиение с наибольшим порогом LSH (1/b)^(1/r), не превышающим threshold - 0.1:
+    кандидаты отбираются с запасом, а точная проверка порога идет по сигнатурам.
+    """
+    best = (num_perm, 1)
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        if (1 / bands) ** (1 / rows) <= threshold - 0.1:
+            best = (bands, rows)
+    return best
+
+
+class MinHasher:
+    """MinHash-сигнатуры текстов по шинглам из shingle_size слов"""
+    
+    BLOCK_SIZE = 8192  # Шинглов за один шаг векторного вычисления (ограничивает память)
+    
+    def __init__(self, num_perm: int = 128, shingle_size: int = 5, seed: int = 1):
+        self.num_perm = num_perm
+        self.shingle_size = shingle_size
+        rng = np.random.RandomState(seed)
+        # a < 2^31 и хэши шинглов < 2^32: a * x + b помещается в uint64 без переполнения
+        self.a = rng.randint(1, 1 << 31, size=num_perm, dtype=np.int64).astype(np.uint64)
+        self.b = rng.randint(0, 1 << 31, size=num_perm, dtype=np.int64).astype(np.uint64)
+    
+    def shingle_hashes(self, text: str) -> np.ndarray:
+        words = WORD_RE.findall(text.lower())
+        size = min(self.shingle_size, len(words))
+        shingles = {' '.join(words[i:i + size]) for i in range(len(words) - size + 1)} if words else set()
+        return np.fromiter((zlib.crc32(shingle.encode('utf-8')) for shingle in shingles),
+                           dtype=np.uint64, count=len(shingles))
+    
+    def signature(self, text: str) -> np.ndarray:
+        """Сигнатура: минимум каждой из num_perm хэш-функций по шинглам текста"""
+        signature = np.full(self.num_perm, MERSENNE_PRIME, dtype=np.uint64)
+        hashes = self.shingle_hashes(text)
+        for start in range(0, len(hashes), self.BLOCK_SIZE):
+            block = hashes[start:start + self.BLOCK_SIZE, None]
+            np.minimum(signature, ((block * self.a + self.b) % MERSENNE_PRIME).min(axis=0), out=signature)
+        return signature
+
+
+def similarity(first: np.ndarray, second: np.ndarray) -> float:
+    """Оценка коэффициента Жаккара множеств шинглов по двум сигнатурам"""
+    return float(np.mean(first == second))
+
+
+class NearDuplicateIndex:
+    """Постоянный LSH-индекс обработанных документов с их результатами (SQLite).
+    
+    Сигнатура делится на полосы; документы с совпавшей хотя бы одной полосой - кандидаты,
+    из них выбирается самый похожий с оценкой не ниже threshold. Результаты хранятся вместе
+    с отпечатком конфигурации: после смены настроек старые результаты не переиспользуются.
+    """
+    
+    def __init__(self, db_path: Path, fingerprint: str, threshold: float = 0.9,
+                 num_perm: int = 128, shingle_size: int = 5):
+        self.db_path = Path(db_path)
+        self.fingerprint = fingerprint
+        self.threshold = threshold
+        self.hasher = MinHasher(num_perm, shingle_size)
+        self.bands, self.rows = lsh_bands(num_perm, threshold)
+        self.hits = 0
+        
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path), timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.executescript(
+            'CREATE TABLE IF NOT EXISTS documents ('
+            'id INTEGER PRIMARY KEY, document TEXT NOT NULL, fingerprint TEXT NOT NULL, '
+            'signature BLOB NOT NULL, result TEXT NOT NULL);'
+            'CREATE TABLE IF NOT EXISTS buckets ('
+            'band INTEGER NOT NULL, bucket INTEGER NOT NULL, document_id INTEGER NOT NULL);'
+            'CREATE INDEX IF NOT EXISTS buckets_lookup ON buckets (band, bucket);'
+            'CREATE INDEX IF NOT EXISTS buckets_document ON buckets (document_id);'
+            'CREATE INDEX IF NOT EXISTS documents_document ON documents (document);'
+        )
+        self.conn.commit()
+    
+    def signature(self, text: str) -> np.ndarray:
+        return self.hasher.signature(text)
+    
+    def _buckets(self, signature: np.ndarray) -> List[Tuple[int, int]]:
+        """(полоса, хэш полосы) для каждой полосы сигнатуры"""
+        return [
+            (band, int.from_bytes(
+                hashlib.blake2b(signature[band * self.rows:(band + 1) * self.rows].tobytes(), digest_size=8).digest(),
+                'little', signed=True
+            ))
+            for band in range(self.bands)
+        ]
+    
+    def find(self, signature: np.ndarray, exclude: Optional[str] = None) -> Optional[Tuple[str, float, Dict]]:
+        """Самый похожий ранее обработанный документ, кроме exclude: (имя, похожесть, результат) или None"""
+        candidates = set()
+        for band, bucket in self._buckets(signature):
+            candidates.update(row[0] for row in self.conn.execute(
+                'SELECT document_id FROM buckets WHERE band = ? AND bucket = ?', (band, bucket)
+            ))
+        
+        best = None
+        for document_id in candidates:
+            document, fingerprint, stored, result = self.conn.execute(
+                'SELECT document, fingerprint, signature, result FROM documents WHERE id = ?', (document_id,)
+            ).fetchone()
+            if fingerprint != self.fingerprint or document == exclude:
+                continue
+            score = similarity(signature, np.frombuffer(stored, dtype=np.uint64))
+            if score >= self.threshold and (best is None or score > best[1]):
+                best = (document, score, result)
+        
+        if best is None:
+            return None
+        self.hits += 1
+        return best[0], best[1], json.loads(best[2])
+    
+    def add(self, document: str, signature: np.ndarray, result: Dict):
+        """Добавляет обработанный документ в индекс (прежняя запись того же документа заменяется)"""
+        with self.conn:
+            for (stale,) in self.conn.execute('SELECT id FROM documents WHERE document = ?', (document,)).fetchall():
+                self.conn.execute('DELETE FROM buckets WHERE document_id = ?', (stale,))
+                self.conn.execute('DELETE FROM documents WHERE id = ?', (stale,))
+            document_id = self.conn.execute(
+                'INSERT INTO documents (document, fingerprint, signature, result) VALUES (?, ?, ?, ?)',
+                (document, self.fingerprint, signature.tobytes(), json.dumps(result, ensure_ascii=False))
+            ).lastrowid
+            self.conn.executemany(
+                'INSERT INTO buckets (band, bucket, document_id) VALUES (?, ?, ?)',
+                [(band, bucket, document_id) for band, bucket in self._buckets(signature)]
+            )
+    
+    def close(self):
+        self.conn.close()
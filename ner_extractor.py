@@ -1,77 +1,167 @@
 """
 Модуль для извлечения именованных сущностей (NER)
 """
-from typing import List, Dict, Optional
-import spacy
-from natasha import (
-    Segmenter,
-    MorphVocab,
-    NewsEmbedding,
-    NewsMorphTagger,
-    NewsNERTagger,
-    Doc
-)
+import time
+from typing import List, Optional
+from entity_normalizer import LRUCache
+from entity_records import Entity
+from ner_prefilter import SentencePrefilter
+from text_annotation import TextAnnotation
+# Бэкенды (natasha, spacy) импортируются при первой загрузке моделей:
+# импорт только нужной библиотеки заметно ускоряет старт коротких запусков
 
 
 class NERExtractor:
     """Класс для извлечения именованных сущностей из русского текста"""
     
-    def __init__(self, model_type: str = "natasha", use_gpu: bool = False):
+    VERSION = "1.0"  # Версия логики извлечения сущностей (входит в ключ кэша результатов)
+    
+    def __init__(self, model_type: str = "natasha", use_gpu: bool = False,
+                 batch_size: int = 32, n_process: int = 1,
+                 prefilter: bool = False, prefilter_context: int = 1, lemma_cache_size: int = 200000):
+        if model_type not in ("natasha", "spacy"):
+            raise ValueError(f"Неподдерживаемый тип модели: {model_type}")
+        
         self.model_type = model_type
         self.use_gpu = use_gpu
-        
-        if model_type == "natasha":
+        self.batch_size = batch_size  # Размер батча для инференса моделей
+        self.n_process = n_process  # Количество процессов для nlp.pipe (только SpaCy)
+        # Отбор предложений-кандидатов: тяжелые теггеры видят только их (и соседние предложения)
+        self.prefilter = SentencePrefilter(prefilter_context) if prefilter else None
+        # Леммы (слово, часть речи, признаки) общие для всех документов процесса
+        self.lemma_cache = LRUCache(lemma_cache_size)
+        self.load_timings = {}  # Время импорта и загрузки моделей по шагам, с
+        self._loaded = False
+        self._morph_vocab = None
+    
+    def load(self):
+        """Загружает модели, если они еще не загружены (вызывается при первом извлечении)"""
+        if self._loaded:
+            return
+        if self.model_type == "natasha":
             self._init_natasha()
-        elif model_type == "spacy":
-            self._init_spacy()
         else:
-            raise ValueError(f"Неподдерживаемый тип модели: {model_type}")
+            self._init_spacy()
+        self._loaded = True
+    
+    def _timed(self, name: str, factory):
+        """Выполняет шаг загрузки и запоминает его время"""
+        started = time.perf_counter()
+        result = factory()
+        self.load_timings[name] = time.perf_counter() - started
+        return result
     
     def _init_natasha(self):
         """Инициализация Natasha"""
-        self.segmenter = Segmenter()
-        self.morph_vocab = MorphVocab()
-        self.emb = NewsEmbedding()
-        self.morph_tagger = NewsMorphTagger(self.emb)
-        self.ner_tagger = NewsNERTagger(self.emb)
+        natasha = self._timed('import natasha', lambda: __import__('natasha'))
+        self.segmenter = natasha.Segmenter()
+        
+        self.emb = self._timed('NewsEmbedding', natasha.NewsEmbedding)
+        self.morph_tagger = self._timed('NewsMorphTagger', lambda: natasha.NewsMorphTagger(self.emb))
+        self.ner_tagger = self._timed('NewsNERTagger', lambda: natasha.NewsNERTagger(self.emb))
+        
+        # Теггеры slovnet сами нарезают вход на батчи этого размера
+        self.morph_tagger.batch_size = self.batch_size
+        self.ner_tagger.batch_size = self.batch_size
+    
+    @property
+    def morph_vocab(self):
+        """Словарь для лемматизации Natasha (создается при первом обращении)"""
+        if self._morph_vocab is None:
+            from natasha import MorphVocab
+            self._morph_vocab = self._timed('MorphVocab', MorphVocab)
+        return self._morph_vocab
     
     def _init_spacy(self):
         """Инициализация SpaCy"""
+        spacy = self._timed('import spacy', lambda: __import__('spacy'))
         try:
-            self.nlp = spacy.load("ru_core_news_md")
+            self.nlp = self._timed('ru_core_news_md', lambda: spacy.load("ru_core_news_md"))
         except OSError:
             raise OSError(
                 "Модель ru_core_news_md не установлена. "
                 "Установите: python -m spacy download ru_core_news_md"
             )
     
-    def extract_entities_natasha(self, text: str) -> List[Dict]:
+    def extract_entities_natasha(self, text: str) -> List[Entity]:
         """Извлечение сущностей с помощью Natasha"""
-        doc = Doc(text)
-        doc.segment(self.segmenter)
-        doc.tag_morph(self.morph_tagger)
-        doc.tag_ner(self.ner_tagger)
+        return self.extract_entities_natasha_batch([text])[0]
+    
+    def extract_entities_natasha_batch(self, texts: List[str],
+                                       annotations: Optional[List[TextAnnotation]] = None) -> List[List[Entity]]:
+        """Извлечение сущностей с помощью Natasha для набора текстов за один проход.
+        
+        Если передан annotations, в него добавляется разметка (слова и леммы) каждого текста.
+        """
+        from natasha import Doc
+        from natasha.doc import DocSpan
+        
+        self.load()
+        docs = [Doc(text) for text in texts]
+        for doc in docs:
+            doc.segment(self.segmenter)
+        
+        # Морфология: предложения всех текстов идут в теггер одним потоком
+        sents = [sent for doc in docs for sent in doc.sents]
+        markups = self.morph_tagger.map([[token.text for token in sent.tokens] for sent in sents])
+        for sent, markup in zip(sents, markups):
+            for token, morph_token in zip(sent.tokens, markup.tokens):
+                token.pos = morph_token.pos
+                token.feats = morph_token.feats
+        
+        # NER: все непустые тексты размечаются батчами
+        tagged_docs = [doc for doc in docs if doc.text.strip()]
+        markups = self.ner_tagger.map([doc.text for doc in tagged_docs])
+        for doc, markup in zip(tagged_docs, markups):
+            doc.spans = [
+                DocSpan(span.start, span.stop, span.type, doc.text[span.start:span.stop])
+                for span in markup.spans
+            ]
+            doc.envelop_span_tokens()
+            doc.envelop_sent_spans()
         
+        if annotations is not None:
+            annotations.extend(self._annotate_natasha(docs))
+        
+        # Пустые тексты не размечаются (doc.spans остается None) - сущностей в них нет
+        return [
+            self._collect_entities(
+                (span.text, span.type, span.start, span.stop) for span in doc.spans or ()
+            )
+            for doc in docs
+        ]
+    
+    def _annotate_natasha(self, docs) -> List[TextAnnotation]:
+        """Разметка текстов по токенам Natasha: леммы по уже найденной морфологии"""
+        annotations = []
+        for doc in docs:
+            tokens = []
+            for token in doc.tokens:
+                key = (token.text, token.pos, tuple(sorted((token.feats or {}).items())))
+                lemma = self.lemma_cache.get(key)
+                if lemma is None:
+                    lemma = self.morph_vocab.lemmatize(token.text, token.pos, token.feats)
+                    self.lemma_cache.put(key, lemma)
+                tokens.append((token.start, token.stop, token.text, lemma))
+            annotations.append(TextAnnotation.from_tokens(tokens))
+        return annotations
+    
+    def _collect_entities(self, spans, allowed_types=('PER', 'ORG', 'LOC')) -> List[Entity]:
+        """Фильтрует найденные спаны и приводит их к общему формату сущностей"""
         entities = []
-        for span in doc.spans:
-            if span.type in ['PER', 'ORG', 'LOC']:
-                entity_text = span.text.strip()
+        for text, entity_type, start, end in spans:
+            if entity_type in allowed_types:
+                entity_text = text.strip()
                 
                 # Фильтрация: пропускаем слишком короткие или некорректные сущности
                 if len(entity_text) < 2:
                     continue
                 
                 # Фильтрация очевидно неправильных сущностей
-                if self._is_invalid_entity(entity_text, span.type):
+                if self._is_invalid_entity(entity_text, entity_type):
                     continue
                 
-                entities.append({
-                    'text': entity_text,
-                    'type': span.type,
-                    'start': span.start,
-                    'end': span.stop,
-                    'confidence': 1.0  # Natasha не предоставляет confidence
-                })
+                entities.append(Entity(entity_text, entity_type, start, end))
         
         return entities
     
@@ -105,35 +195,33 @@ class NERExtractor:
         
         return False
     
-    def extract_entities_spacy(self, text: str) -> List[Dict]:
+    def extract_entities_spacy(self, text: str) -> List[Entity]:
         """Извлечение сущностей с помощью SpaCy"""
-        doc = self.nlp(text)
-        entities = []
-        
-        for ent in doc.ents:
-            # Маппинг типов SpaCy на стандартные
-            entity_type = ent.label_
-            if entity_type in ['PER', 'ORG', 'LOC', 'MISC']:
-                entity_text = ent.text.strip()
-                
-                # Фильтрация
-                if len(entity_text) < 2:
-                    continue
-                
-                if self._is_invalid_entity(entity_text, entity_type):
-                    continue
-                
-                entities.append({
-                    'text': entity_text,
-                    'type': entity_type,
-                    'start': ent.start_char,
-                    'end': ent.end_char,
-                    'confidence': 1.0  # SpaCy не всегда предоставляет confidence
-                })
-        
-        return entities
+        return self.extract_entities_spacy_batch([text])[0]
     
-    def extract(self, text: str) -> List[Dict]:
+    def extract_entities_spacy_batch(self, texts: List[str],
+                                     annotations: Optional[List[TextAnnotation]] = None) -> List[List[Entity]]:
+        """Извлечение сущностей с помощью SpaCy через nlp.pipe (annotations - как у Natasha)"""
+        self.load()
+        docs = self.nlp.pipe(texts, batch_size=self.batch_size, n_process=self.n_process)
+        if annotations is not None:
+            docs = list(docs)
+            annotations.extend(
+                TextAnnotation.from_tokens(
+                    (token.idx, token.idx + len(token.text), token.text, token.lemma_) for token in doc
+                )
+                for doc in docs
+            )
+        # Маппинг типов SpaCy на стандартные
+        return [
+            self._collect_entities(
+                ((ent.text, ent.label_, ent.start_char, ent.end_char) for ent in doc.ents),
+                allowed_types=('PER', 'ORG', 'LOC', 'MISC')
+            )
+            for doc in docs
+        ]
+    
+    def extract(self, text: str) -> List[Entity]:
         """Основной метод извлечения сущностей"""
         if self.model_type == "natasha":
             return self.extract_entities_natasha(text)
@@ -141,3 +229,45 @@ class NERExtractor:
             return self.extract_entities_spacy(text)
         else:
             raise ValueError(f"Неподдерживаемый тип модели: {self.model_type}")
+    
+    def extract_batch(self, texts: List[str],
+                      annotations: Optional[List[TextAnnotation]] = None) -> List[List[Entity]]:
+        """Извлечение сущностей из набора текстов; возвращает список сущностей для каждого текста.
+        
+        Если передан annotations, в него добавляется морфологическая разметка каждого текста
+        (токенизация и морфология уже выполнены для NER, повторно текст не разбирается).
+        Разметка нужна для всего текста, поэтому отбор предложений с annotations не применяется.
+        """
+        if not texts:
+            return []
+        if self.prefilter is not None and annotations is None:
+            return self._extract_prefiltered(texts)
+        return self._extract_batch(texts, annotations)
+    
+    def _extract_prefiltered(self, texts: List[str]) -> List[List[Entity]]:
+        """NER только по предложениям-кандидатам; позиции сущностей переводятся в исходный текст"""
+        reduced = [self.prefilter.reduce(text) for text in texts]
+        # Чанки без предложений-кандидатов (одни цифры, служебный текст) в NER не отправляются
+        selected = [i for i, (reduced_text, _) in enumerate(reduced) if reduced_text.strip()]
+        found = [[] for _ in texts]
+        for i, entities in zip(selected, self._extract_batch([reduced[i][0] for i in selected])):
+            found[i] = entities
+        results = []
+        for entities, (_, offsets) in zip(found, reduced):
+            mapped = []
+            for entity in entities:
+                span = offsets.span(entity.start, entity.end)
+                if span is not None:
+                    entity.start, entity.end = span
+                    mapped.append(entity)
+            results.append(mapped)
+        return results
+    
+    def _extract_batch(self, texts: List[str],
+                       annotations: Optional[List[TextAnnotation]] = None) -> List[List[Entity]]:
+        if self.model_type == "natasha":
+            return self.extract_entities_natasha_batch(texts, annotations)
+        elif self.model_type == "spacy":
+            return self.extract_entities_spacy_batch(texts, annotations)
+        else:
+            raise ValueError(f"Неподдерживаемый тип модели: {self.model_type}")
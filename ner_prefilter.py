@@ -0,0 +1,124 @@
+"""
+Модуль предварительного отбора предложений, в которых могут быть именованные сущности
+"""
+import re
+from bisect import bisect_right
+from typing import List, Optional, Tuple
+
+
+# Конец предложения: знак препинания с пробелами после него или перевод строки (как в чанкинге)
+SENTENCE_END_RE = re.compile(r'[.!?…]+\s+|\n\s*')
+
+# Роли сторон, которые в договорах пишутся с заглавной буквы, но сущностями не являются
+ROLE_WORDS = (r'(?:Заказчик|Исполнител|Поставщик|Покупател|Продав|Подрядчик|Субподрядчик|Сторон|'
+              r'Арендатор|Арендодател|Заемщик|Займодав|Кредитор|Должник|Агент|Принципал|Договор|Контракт)')
+
+# Признаки возможной сущности PER/ORG/LOC в предложении
+CANDIDATE_RE = re.compile(
+    r'(?<!\w)(?:ООО|ОАО|ЗАО|ПАО|АО|ИП|НКО|ФГУП|ГУП|МУП|АНО|ТОО|LLC|Ltd|Inc|GmbH)(?!\w)'  # Организационно-правовые формы
+    r'|[«»"“”„]'  # Кавычки вокруг названий
+    r'|(?<!\w)[А-ЯЁA-Z]\.\s?[А-ЯЁA-Z]\.'  # Инициалы
+    r'|(?<!\w)[А-ЯЁA-Z]{2,5}(?!\w)'  # Аббревиатуры (длинные слова прописными - заголовки разделов)
+    r'|(?<=[^.!?…\s]\s)(?!' + ROLE_WORDS + r')[А-ЯЁA-Z][а-яёa-z]'  # Слово с заглавной буквы не в начале предложения
+)
+# Первое слово предложения с заглавной буквы - кандидат, если это не частое служебное слово
+FIRST_WORD_RE = re.compile(r'\s*[«"]?([А-ЯЁA-Z][а-яёa-z]+)')
+COMMON_FIRST_WORDS = frozenset({
+    'в', 'во', 'на', 'по', 'при', 'для', 'с', 'со', 'к', 'от', 'до', 'из', 'за', 'о', 'об', 'не', 'и', 'а',
+    'но', 'или', 'если', 'после', 'настоящий', 'настоящее', 'настоящая', 'настоящим', 'стороны', 'сторона',
+    'договор', 'срок', 'оплата', 'цена', 'стоимость', 'все', 'любые', 'каждая', 'указанные', 'таблица',
+    'итого', 'всего', 'приложение', 'пункт', 'товар', 'работы', 'услуги', 'подпись', 'дата', 'место',
+})
+
+
+class SentencePrefilter:
+    """Отбирает предложения, в которых могут быть PER/ORG/LOC, и собирает из них сокращенный текст.
+    
+    Признаки кандидата: организационно-правовая форма (ООО, АО, ИП...), кавычки, инициалы,
+    аббревиатура или слово с заглавной буквы. Предложение берется вместе с context соседними
+    предложениями с каждой стороны. Позиции в сокращенном тексте переводятся обратно в позиции
+    исходного текста через таблицу фрагментов.
+    """
+    
+    SEPARATOR = "\n"  # Разделитель фрагментов сокращенного текста (граница предложения для NER)
+    
+    def __init__(self, context: int = 1):
+        self.context = context
+    
+    @staticmethod
+    def sentences(text: str) -> List[Tuple[int, int]]:
+        """Границы предложений [start, end) текста"""
+        spans = []
+        start = 0
+        for match in SENTENCE_END_RE.finditer(text):
+            if match.end() > start:
+                spans.append((start, match.end()))
+                start = match.end()
+        if start < len(text):
+            spans.append((start, len(text)))
+        return spans
+    
+    @staticmethod
+    def is_candidate(sentence: str) -> bool:
+        if CANDIDATE_RE.search(sentence):
+            return True
+        match = FIRST_WORD_RE.match(sentence)
+        return match is not None and match.group(1).lower() not in COMMON_FIRST_WORDS
+    
+    def select(self, text: str) -> List[Tuple[int, int]]:
+        """Фрагменты [start, end) текста для NER: предложения-кандидаты с контекстом, соседние слиты"""
+        sentences = self.sentences(text)
+        selected = [False] * len(sentences)
+        for i, (start, end) in enumerate(sentences):
+            if self.is_candidate(text[start:end]):
+                for j in range(max(0, i - self.context), min(len(sentences), i + self.context + 1)):
+                    selected[j] = True
+        
+        spans = []
+        for (start, end), keep in zip(sentences, selected):
+            if not keep:
+                continue
+            if spans and spans[-1][1] == start:
+                spans[-1] = (spans[-1][0], end)
+            else:
+                spans.append((start, end))
+        return spans
+    
+    def reduce(self, text: str) -> Tuple[str, 'OffsetMap']:
+        """Сокращенный текст из отобранных фрагментов и таблица перевода позиций в исходный текст"""
+        parts = []
+        reduced_starts = []
+        original_starts = []
+        position = 0
+        for start, end in self.select(text):
+            if parts:
+                parts.append(self.SEPARATOR)
+                position += len(self.SEPARATOR)
+            reduced_starts.append(position)
+            original_starts.append(start)
+            parts.append(text[start:end])
+            position += end - start
+        return ''.join(parts), OffsetMap(reduced_starts, original_starts, position)
+
+
+class OffsetMap:
+    """Перевод позиций сокращенного текста в позиции исходного"""
+    
+    __slots__ = ('reduced_starts', 'original_starts', 'length')
+    
+    def __init__(self, reduced_starts: List[int], original_starts: List[int], length: int):
+        self.reduced_starts = reduced_starts
+        self.original_starts = original_starts
+        self.length = length
+    
+    def span(self, start: int, end: int) -> Optional[Tuple[int, int]]:
+        """Позиция [start, end) в исходном тексте; None, если спан пересекает границу фрагментов"""
+        piece = bisect_right(self.reduced_starts, start) - 1
+        if piece < 0:
+            return None
+        piece_end = self.reduced_starts[piece + 1] - len(SentencePrefilter.SEPARATOR) \
+            if piece + 1 < len(self.reduced_starts) else self.length
+        if end > piece_end:
+            return None
+        shift = self.original_starts[piece] - self.reduced_starts[piece]
+        return start + shift, end + shift
@@ -0,0 +1,166 @@
+"""
+Модуль для пакетной записи результатов: JSON Lines и колоночный формат Parquet
+"""
+import hashlib
+import json
+from pathlib import Path
+from typing import Dict, List
+# pyarrow импортируется только при записи в Parquet (необязательная зависимость)
+
+
+OUTPUT_FORMATS = ('json', 'jsonl', 'parquet')
+
+
+def document_id(file_path: Path) -> str:
+    """Идентификатор документа: стабильный хэш полного пути исходного файла"""
+    return hashlib.sha256(str(Path(file_path).resolve()).encode('utf-8')).hexdigest()[:16]
+
+
+class JsonLinesSink:
+    """Результаты всех документов в одном файле JSON Lines: строка на документ, дозапись в конец"""
+    
+    def __init__(self, path: Path, buffer_size: int = 1 << 20):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        # Буферизованная запись: на диск уходят блоки по buffer_size, а не строка на документ
+        self.file = open(self.path, 'a', encoding='utf-8', buffering=buffer_size)
+    
+    def write(self, result: Dict, file_path: Path):
+        record = {'document_id': document_id(file_path), **result}
+        self.file.write(json.dumps(record, ensure_ascii=False, separators=(',', ':')))
+        self.file.write('\n')
+    
+    def flush(self):
+        self.file.flush()
+    
+    def close(self):
+        self.file.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class ParquetSink:
+    """Колоночная выгрузка в Parquet: таблицы documents, entities, relations и chains, связанные по document_id.
+    
+    Каждая таблица - каталог output_dir/<таблица>/ из файлов part-NNNNN.parquet. Строки копятся
+    в памяти и при flush (каждые batch_documents документов) записываются новым законченным файлом:
+    записанное читается сразу, не теряется при аварийном завершении и не перезаписывается
+    следующими запусками (номера частей продолжаются).
+    """
+    
+    def __init__(self, output_dir: Path, batch_documents: int = 1000):
+        try:
+            import pyarrow
+            import pyarrow.parquet
+        except ImportError:
+            raise ImportError(
+                "Для записи в Parquet нужен pyarrow. "
+                "Установите: pip install pyarrow"
+            )
+        self.pa = pyarrow
+        self.pq = pyarrow.parquet
+        self.path = self.output_dir = Path(output_dir)
+        self.output_dir.mkdir(parents=True, exist_ok=True)
+        self.batch_documents = batch_documents
+        
+        string, int64, float64 = pyarrow.string(), pyarrow.int64(), pyarrow.float64()
+        alternative = pyarrow.struct([
+            ('number', int64), ('category', string), ('subprocess', string), ('score', float64),
+        ])
+        self.schemas = {
+            'documents': pyarrow.schema([
+                ('document_id', string), ('document', string), ('category', string),
+                ('subprocess', string), ('number', int64), ('confidence', float64),
+                ('alternatives', pyarrow.list_(alternative)),
+                ('total_entities', int64), ('total_relations', int64), ('total_chains', int64),
+                ('text_length', int64),
+            ]),
+            'entities': pyarrow.schema([
+                ('document_id', string), ('entity_id', int64), ('text', string), ('type', string),
+            ]),
+            'relations': pyarrow.schema([
+                ('document_id', string), ('source', string), ('target', string), ('relation', string),
+                ('source_type', string), ('target_type', string), ('context', string),
+            ]),
+            # Цепочка: сущность, связь, сущность, связь, ... (как relation_chains в JSON)
+            'chains': pyarrow.schema([
+                ('document_id', string), ('chain_id', int64), ('chain', pyarrow.list_(string)),
+            ]),
+        }
+        self.rows: Dict[str, List[Dict]] = {name: [] for name in self.schemas}
+        self.next_part = {name: self._next_part(name) for name in self.schemas}
+        self.pending_documents = 0
+    
+    def _next_part(self, name: str) -> int:
+        """Номер следующей части таблицы: после частей, записанных прошлыми запусками"""
+        numbers = [int(part.stem.split('-')[1]) for part in (self.output_dir / name).glob('part-*.parquet')]
+        return max(numbers, default=-1) + 1
+    
+    def write(self, result: Dict, file_path: Path):
+        doc_id = document_id(file_path)
+        process = result['business_process']
+        statistics = result['statistics']
+        self.rows['documents'].append({
+            'document_id': doc_id,
+            'document': result['document'],
+            'category': process['category'],
+            'subprocess': process['subprocess'],
+            'number': process['number'],
+            'confidence': process['confidence'],
+            'alternatives': process.get('alternatives', []),
+            'total_entities': statistics['total_entities'],
+            'total_relations': statistics['total_relations'],
+            'total_chains': statistics['total_chains'],
+            'text_length': statistics['text_length'],
+        })
+        self.rows['entities'].extend(
+            {'document_id': doc_id, 'entity_id': e['id'], 'text': e['text'], 'type': e['type']}
+            for e in result['entities']
+        )
+        self.rows['relations'].extend({'document_id': doc_id, **r} for r in result['relations'])
+        self.rows['chains'].extend(
+            {'document_id': doc_id, 'chain_id': i, 'chain': chain}
+            for i, chain in enumerate(result.get('relation_chains', []))
+        )
+        
+        self.pending_documents += 1
+        if self.pending_documents >= self.batch_documents:
+            self.flush()
+    
+    def flush(self):
+        """Записывает накопленные строки каждой таблицы новой частью"""
+        for name, rows in self.rows.items():
+            if not rows:
+                continue
+            table_dir = self.output_dir / name
+            table_dir.mkdir(exist_ok=True)
+            # Режим 'xb': существующая часть (например, от параллельного запуска) не перезаписывается
+            with open(table_dir / f"part-{self.next_part[name]:05d}.parquet", 'xb') as f:
+                self.pq.write_table(self.pa.Table.from_pylist(rows, schema=self.schemas[name]), f)
+            self.next_part[name] += 1
+            rows.clear()
+        self.pending_documents = 0
+    
+    def close(self):
+        self.flush()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def create_sink(output_format: str, output_dir: Path, batch_documents: int = 1000):
+    """Приемник результатов для формата jsonl или parquet (для json - None: файл на документ)"""
+    if output_format == 'jsonl':
+        return JsonLinesSink(Path(output_dir) / 'results.jsonl')
+    if output_format == 'parquet':
+        return ParquetSink(output_dir, batch_documents)
+    if output_format == 'json':
+        return None
+    raise ValueError(f"Неподдерживаемый формат вывода: {output_format}")
@@ -1,110 +1,510 @@
 """
 Основной пайплайн для извлечения информации из документов
 """
+import copy
 import json
+import re
+import time
+from itertools import islice
 from pathlib import Path
-from typing import Dict, List, Optional
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 from document_reader import DocumentReader
 from ner_extractor import NERExtractor
 from relation_extractor import RelationExtractor
 from process_classifier import ProcessClassifier
 from business_process_loader import BusinessProcessLoader
-from config import USE_GPU, NER_MODEL, MAX_TEXT_LENGTH, CHUNK_SIZE
+from result_cache import ResultCache, config_fingerprint
+from metrics import DocumentMetrics, NULL_METRICS, add_result_stage
+from text_annotation import TextAnnotation
+from relation_graph import RelationGraph
+from entity_records import Entity, Relation
+from entity_store import EntityStore, entity_key
+from entity_normalizer import EntityNormalizer
+from near_duplicates import NearDuplicateIndex, similarity
+from config import (
+    USE_GPU, NER_MODEL, MAX_TEXT_LENGTH, CHUNK_SIZE, CHUNK_OVERLAP, NER_BATCH_SIZE, NER_N_PROCESS,
+    RESULT_CACHE_ENABLED, RESULT_CACHE_PATH, RESULT_CACHE_MAX_BYTES,
+    STREAM_MIN_FILE_SIZE, STREAM_WINDOW_CHUNKS, STREAM_DOCX_ENGINE, METRICS_ENABLED,
+    CLASSIFIER_MODE, CLASSIFIER_TOP_K, CLASSIFIER_MATRIX_PATH, SHARED_MORPHOLOGY, OUTPUT_INDENT,
+    PDF_ENGINE, PDF_WORKERS, DOCX_ENGINE, PDF_PAGE_RANGE, CHAIN_MAX_DEPTH, CHAIN_MAX_PER_DOCUMENT,
+    ENTITY_STORE_ENABLED, ENTITY_STORE_PATH, NEAR_DUPLICATE_MODE, NEAR_DUPLICATE_PATH,
+    NEAR_DUPLICATE_THRESHOLD, NEAR_DUPLICATE_NUM_PERM, NEAR_DUPLICATE_SHINGLE_SIZE,
+    NER_PREFILTER, NER_PREFILTER_CONTEXT, ENTITY_NORMALIZATION, ENTITY_NORM_CACHE_SIZE,
+    ENTITY_NORM_CACHE_PATH, LEMMA_CACHE_SIZE
+)
+
+
+# Конец предложения: знак препинания с пробелами после него или перевод строки
+SENTENCE_END_RE = re.compile(r'[.!?…]+\s+|\n\s*')
 
 
 class DocumentPipeline:
     """Основной пайплайн обработки документов"""
     
-    def __init__(self):
-        # Инициализация компонентов
-        self.doc_reader = DocumentReader()
-        self.ner_extractor = NERExtractor(model_type=NER_MODEL, use_gpu=USE_GPU)
-        self.relation_extractor = RelationExtractor(use_gpu=USE_GPU)
+    VERSION = "1.1"  # Версия чанкинга, дедупликации и построения цепочек (входит в ключ кэша результатов)
+    
+    def __init__(self, use_cache: bool = RESULT_CACHE_ENABLED, collect_metrics: bool = METRICS_ENABLED,
+                 use_store: bool = ENTITY_STORE_ENABLED):
+        if CHAIN_MAX_DEPTH > 1 and CHAIN_MAX_PER_DOCUMENT is None:
+            # Число путей глубже одной связи растет экспоненциально на плотных графах связей
+            raise ValueError("При CHAIN_MAX_DEPTH > 1 нужно ограничение CHAIN_MAX_PER_DOCUMENT")
+        self.startup_timings = {}  # Время инициализации компонентов, с
+        self.collect_metrics = collect_metrics  # Замер этапов в statistics['stages'] результата
+        self.output_indent = OUTPUT_INDENT  # Отступ JSON в save_result (None - без форматирования)
+        
+        # Инициализация компонентов (модели NER загружаются при первом извлечении)
+        self.doc_reader = self._timed('DocumentReader', lambda: DocumentReader(
+            pdf_engine=PDF_ENGINE,
+            pdf_workers=PDF_WORKERS,
+            pdf_page_range=PDF_PAGE_RANGE,
+            docx_engine=DOCX_ENGINE
+        ))
+        self.ner_extractor = self._timed('NERExtractor', lambda: NERExtractor(
+            model_type=NER_MODEL,
+            use_gpu=USE_GPU,
+            batch_size=NER_BATCH_SIZE,
+            n_process=NER_N_PROCESS,
+            prefilter=NER_PREFILTER,
+            prefilter_context=NER_PREFILTER_CONTEXT,
+            lemma_cache_size=LEMMA_CACHE_SIZE
+        ))
+        self.relation_extractor = self._timed('RelationExtractor', lambda: RelationExtractor(use_gpu=USE_GPU))
         
         # Загружаем бизнес-процессы
         from config import BUSINESS_PROCESSES_FILE
-        self.bp_loader = BusinessProcessLoader(BUSINESS_PROCESSES_FILE)
-        self.process_classifier = ProcessClassifier(self.bp_loader, use_gpu=USE_GPU)
+        self.bp_loader = self._timed('BusinessProcessLoader', lambda: BusinessProcessLoader(BUSINESS_PROCESSES_FILE))
+        self.process_classifier = self._timed(
+            'ProcessClassifier', lambda: ProcessClassifier(
+                self.bp_loader, use_gpu=USE_GPU, mode=CLASSIFIER_MODE,
+                top_k=CLASSIFIER_TOP_K, matrix_path=CLASSIFIER_MATRIX_PATH
+            )
+        )
+        
+        # Нормализация сущностей по леммам (словарь MorphVocab общий с NER)
+        self.entity_normalizer = None
+        if ENTITY_NORMALIZATION:
+            self.entity_normalizer = self._timed('EntityNormalizer', lambda: EntityNormalizer(
+                lambda: self.ner_extractor.morph_vocab, ENTITY_NORM_CACHE_SIZE, ENTITY_NORM_CACHE_PATH
+            ))
+        
+        fingerprint = None
+        if use_cache or NEAR_DUPLICATE_MODE:
+            components = [self, self.doc_reader, self.ner_extractor, self.relation_extractor, self.process_classifier]
+            if self.entity_normalizer is not None:
+                components.append(self.entity_normalizer)
+            fingerprint = config_fingerprint(components)
+        
+        # Кэш результатов по содержимому документа и конфигурации пайплайна
+        self.result_cache = None
+        if use_cache:
+            self.result_cache = self._timed(
+                'ResultCache', lambda: ResultCache(RESULT_CACHE_PATH, fingerprint, RESULT_CACHE_MAX_BYTES)
+            )
+        
+        # Междокументное хранилище сущностей и связей для поиска (entity_store.py);
+        # ключи сущностей в нем строятся так же, как при удалении дубликатов
+        self.entity_store = None
+        if use_store:
+            self.entity_store = self._timed(
+                'EntityStore', lambda: EntityStore(ENTITY_STORE_PATH, self.entity_normalizer)
+            )
+        
+        # Индекс почти-дубликатов: похожие на обработанные документы не проходят NER повторно
+        self.near_duplicates = None
+        if NEAR_DUPLICATE_MODE:
+            self.near_duplicates = self._timed('NearDuplicateIndex', lambda: NearDuplicateIndex(
+                NEAR_DUPLICATE_PATH, fingerprint, threshold=NEAR_DUPLICATE_THRESHOLD,
+                num_perm=NEAR_DUPLICATE_NUM_PERM, shingle_size=NEAR_DUPLICATE_SHINGLE_SIZE
+            ))
     
-    def _chunk_text(self, text: str) -> List[str]:
-        """Разбивает текст на чанки для обработки"""
+    def _timed(self, name: str, factory):
+        """Создает компонент и запоминает время его инициализации"""
+        started = time.perf_counter()
+        component = factory()
+        self.startup_timings[name] = time.perf_counter() - started
+        return component
+    
+    def _chunk_spans(self, text: str) -> List[Tuple[int, int]]:
+        """Разбивает текст на чанки по границам предложений.
+        
+        Возвращает (start, end) чанков в координатах исходного текста; соседние чанки
+        перекрываются не более чем на CHUNK_OVERLAP символов целыми предложениями.
+        """
         if len(text) <= MAX_TEXT_LENGTH:
-            return [text]
+            return [(0, len(text))]
+        return self._split_spans(text)
+    
+    def _split_spans(self, text: str) -> List[Tuple[int, int]]:
+        """Разбивает текст на перекрывающиеся чанки по границам предложений (без порога длины)"""
+        # Предложения; слишком длинные режем по пробелам, как раньше резали весь текст
+        sentences = []
+        start = 0
+        for end in [match.end() for match in SENTENCE_END_RE.finditer(text)] + [len(text)]:
+            if end <= start:
+                continue
+            while end - start > CHUNK_SIZE:
+                cut = text.rfind(' ', start + 1, start + CHUNK_SIZE)
+                cut = cut + 1 if cut > start else start + CHUNK_SIZE
+                sentences.append((start, cut))
+                start = cut
+            sentences.append((start, end))
+            start = end
         
         chunks = []
-        words = text.split()
-        current_chunk = []
-        current_length = 0
-        
-        for word in words:
-            word_length = len(word) + 1  # +1 для пробела
-            if current_length + word_length > CHUNK_SIZE:
-                if current_chunk:
-                    chunks.append(' '.join(current_chunk))
-                current_chunk = [word]
-                current_length = word_length
-            else:
-                current_chunk.append(word)
-                current_length += word_length
-        
-        if current_chunk:
-            chunks.append(' '.join(current_chunk))
+        i = 0
+        while i < len(sentences):
+            chunk_start = sentences[i][0]
+            j = i
+            while j + 1 < len(sentences) and sentences[j + 1][1] - chunk_start <= CHUNK_SIZE:
+                j += 1
+            chunk_end = sentences[j][1]
+            chunks.append((chunk_start, chunk_end))
+            if j + 1 >= len(sentences):
+                break
+            
+            # Следующий чанк начинается с последних предложений текущего (перекрытие),
+            # но так, чтобы в него поместилось следующее новое предложение
+            next_i = j + 1
+            while next_i - 1 > i and \
+                    chunk_end - sentences[next_i - 1][0] <= CHUNK_OVERLAP and \
+                    sentences[j + 1][1] - sentences[next_i - 1][0] <= CHUNK_SIZE:
+                next_i -= 1
+            i = next_i
         
         return chunks
     
-    def _build_relation_chains(self, entities: List[Dict], relations: List[Dict]) -> List[List[str]]:
-        """Строит цепочки связей между сущностями"""
-        chains = []
-        
-        # Создаем граф связей
-        entity_map = {e['text']: e for e in entities}
-        relation_map = {}
-        
-        for rel in relations:
-            source = rel['source']
-            if source not in relation_map:
-                relation_map[source] = []
-            relation_map[source].append(rel)
-        
-        # Строим цепочки от каждой сущности
-        for entity in entities:
-            entity_text = entity['text']
-            if entity_text in relation_map:
-                for rel in relation_map[entity_text]:
-                    chain = [
-                        entity_text,
-                        rel['relation'],
-                        rel['target']
-                    ]
-                    chains.append(chain)
-        
-        return chains
+    def _chunk_text(self, text: str) -> List[str]:
+        """Разбивает текст на чанки для обработки"""
+        return [text[start:end] for start, end in self._chunk_spans(text)]
+    
+    def _iter_chunk_spans(self, segments: Iterable[str], parts: List[str]) -> Iterator[Tuple[int, int, str]]:
+        """Потоковый чанкинг: выдает (start, end, текст чанка) по мере поступления сегментов.
+        
+        Дает те же границы, что и _chunk_spans для склеенного текста, но держит в буфере
+        только несколько чанков. Прочитанные сегменты добавляются в parts.
+        """
+        buffer = ''
+        buffer_start = 0  # Позиция начала буфера в документе
+        total_length = 0
+        window = STREAM_WINDOW_CHUNKS * CHUNK_SIZE
+        
+        for segment in segments:
+            parts.append(segment)
+            buffer += segment
+            total_length += len(segment)
+            if total_length <= MAX_TEXT_LENGTH or len(buffer) < window:
+                continue
+            
+            # Чанки у конца буфера могут измениться с приходом следующих сегментов,
+            # поэтому выдаем только те, что заканчиваются не ближе 2 * CHUNK_SIZE к концу
+            spans = self._split_spans(buffer)
+            stable_end = len(buffer) - 2 * CHUNK_SIZE
+            emitted = 0
+            for start, end in spans:
+                if end > stable_end:
+                    break
+                yield buffer_start + start, buffer_start + end, buffer[start:end]
+                emitted += 1
+            
+            if emitted:
+                next_start = spans[emitted][0]
+                buffer = buffer[next_start:]
+                buffer_start += next_start
+        
+        if not buffer.strip():
+            return
+        spans = [(0, len(buffer))] if total_length <= MAX_TEXT_LENGTH else self._split_spans(buffer)
+        for start, end in spans:
+            yield buffer_start + start, buffer_start + end, buffer[start:end]
+    
+    def _build_relation_chains(self, entities: List[Entity], relations: List[Relation]) -> List[List[str]]:
+        """Строит цепочки связей от каждой сущности (до CHAIN_MAX_DEPTH связей, не больше CHAIN_MAX_PER_DOCUMENT)"""
+        chains = RelationGraph(relations).iter_chains((e.text for e in entities), CHAIN_MAX_DEPTH)
+        return list(islice(chains, CHAIN_MAX_PER_DOCUMENT))
     
     def process_document(self, file_path: Path) -> Dict:
         """Обрабатывает документ и возвращает структурированную информацию"""
-        # 1. Читаем документ
-        text = self.doc_reader.read_document(file_path)
+        return self.process_documents([file_path])[0]
+    
+    def process_documents(self, file_paths: List[Path]) -> List[Dict]:
+        """Обрабатывает группу документов, пропуская неизмененные документы из кэша"""
+        if self.result_cache is None:
+            metrics = self._new_metrics(len(file_paths))
+            results = self._process_uncached(file_paths, metrics)
+            for result, document_metrics in zip(results, metrics):
+                self._attach_metrics(result, document_metrics)
+        else:
+            results = self._process_cached(file_paths)
+        
+        if self.entity_store is not None:
+            self.entity_store.add_results(file_paths, results)
+        return results
+    
+    def close(self):
+        """Завершает работу: останавливает пул процессов чтения PDF и сохраняет кэш нормализации
+        сущностей (один раз за запуск)"""
+        self.doc_reader.close()
+        if self.entity_normalizer is not None:
+            self.entity_normalizer.save()
+    
+    def _process_cached(self, file_paths: List[Path]) -> List[Dict]:
+        """Берет результаты неизмененных документов из кэша, остальные обрабатывает и кэширует"""
+        keys = [self.result_cache.make_key(file_path) for file_path in file_paths]
+        results = [self.result_cache.get(key) for key in keys]
+        
+        pending = [i for i, result in enumerate(results) if result is None]
+        for i, result in enumerate(results):
+            if result is not None:
+                # Одинаковое содержимое могло прийти под другим именем файла
+                result['document'] = str(Path(file_paths[i]).name)
+        
+        if pending:
+            metrics = self._new_metrics(len(pending))
+            processed = self._process_uncached([file_paths[i] for i in pending], metrics)
+            for i, result, document_metrics in zip(pending, processed, metrics):
+                results[i] = result
+                if 'error' not in result:
+                    # Метрики этапов не кэшируются: они относятся к конкретному прогону
+                    self.result_cache.put(keys[i], result)
+                self._attach_metrics(result, document_metrics)
+        
+        return results
+    
+    def _new_metrics(self, count: int) -> List:
+        """Метрики этапов для группы документов (пустые, если замер выключен)"""
+        if not self.collect_metrics:
+            return [NULL_METRICS] * count
+        return [DocumentMetrics() for _ in range(count)]
+    
+    @staticmethod
+    def _attach_metrics(result: Dict, metrics):
+        """Добавляет метрики этапов в statistics результата"""
+        if metrics.enabled and 'error' not in result:
+            result['statistics']['stages'] = metrics.to_dict()
+    
+    def _process_uncached(self, file_paths: List[Path], metrics: Optional[List] = None) -> List[Dict]:
+        """Обрабатывает группу документов; большие файлы обрабатываются потоково"""
+        if metrics is None:
+            metrics = [NULL_METRICS] * len(file_paths)
+        results = [None] * len(file_paths)
+        batched = []
+        for i, file_path in enumerate(file_paths):
+            if Path(file_path).stat().st_size >= STREAM_MIN_FILE_SIZE:
+                results[i] = self.process_document_stream(file_path, metrics[i])
+            else:
+                batched.append(i)
+        
+        if batched:
+            processed = self._process_batch([file_paths[i] for i in batched], [metrics[i] for i in batched])
+            for i, result in zip(batched, processed):
+                results[i] = result
+        
+        return results
+    
+    def process_document_stream(self, file_path: Path, metrics=NULL_METRICS) -> Dict:
+        """Обрабатывает документ потоково: сегменты из DocumentReader сразу идут в чанкинг и NER.
+        
+        Разобранные страницы (и DOCX: читается способом STREAM_DOCX_ENGINE, без дерева python-docx)
+        и состояние NER занимают не больше одного батча чанков. Сам текст документа держится
+        целиком: по нему ищутся связи и классифицируется документ, поэтому память остается
+        пропорциональной длине текста, но не размеру разобранного файла.
+        """
+        parts = []
+        chunks = []
+        chunk_entities = []
+        annotations = [] if SHARED_MORPHOLOGY else None
+        pending = []
+        
+        def flush():
+            with metrics.stage('ner', sum(len(chunk) for _, _, chunk in pending)) as stage:
+                entities = self.ner_extractor.extract_batch([chunk for _, _, chunk in pending], annotations)
+                stage.items = sum(len(found) for found in entities)
+            chunk_entities.extend(entities)
+            chunks.extend((start, end) for start, end, _ in pending)
+            pending.clear()
+        
+        # Чтение идет внутри чанкинга: время чтения вычитается из этапа chunk
+        segments = metrics.iterate('read', self.doc_reader.iter_document(file_path, STREAM_DOCX_ENGINE))
+        for chunk in metrics.iterate('chunk', self._iter_chunk_spans(segments, parts), items=lambda chunk: 1):
+            pending.append(chunk)
+            if len(pending) >= self.ner_extractor.batch_size:
+                flush()
+        flush()
+        metrics.exclude('chunk', 'read')
         
-        if not text or len(text.strip()) == 0:
+        text = ''.join(parts)
+        del parts
+        if metrics.enabled:
+            metrics.add('read', 0.0, 0.0, Path(file_path).stat().st_size)
+            metrics.add('chunk', 0.0, 0.0, len(text))
+        if not chunks:
             return {
                 'error': 'Документ пуст или не удалось извлечь текст'
             }
         
-        # 2. Разбиваем на чанки если нужно
-        chunks = self._chunk_text(text)
+        return self._build_result(file_path, text, chunks, chunk_entities, metrics, annotations)
+    
+    def _process_batch(self, file_paths: List[Path], metrics: Optional[List] = None) -> List[Dict]:
+        """Обрабатывает группу документов: чанки всех документов проходят NER одним батчем"""
+        if metrics is None:
+            metrics = [NULL_METRICS] * len(file_paths)
+        
+        # 1. Читаем документы
+        texts = []
+        for file_path, document_metrics in zip(file_paths, metrics):
+            with document_metrics.stage('read', Path(file_path).stat().st_size) as stage:
+                text = self.doc_reader.read_document(file_path)
+                stage.items = len(text) if text else 0
+            texts.append(text)
+        
+        # Почти-дубликаты ранее обработанных документов в режиме "reuse" не проходят NER
+        signatures, duplicates = self._find_near_duplicates(file_paths, texts, metrics)
+        reused = [match is not None and NEAR_DUPLICATE_MODE == 'reuse' for match in duplicates]
+        
+        # 2. Разбиваем на чанки если нужно (границы чанков в координатах документа)
+        doc_chunks = []
+        for text, skip, document_metrics in zip(texts, reused, metrics):
+            with document_metrics.stage('chunk', len(text) if text else 0) as stage:
+                chunks = self._chunk_spans(text) if text and len(text.strip()) > 0 and not skip else []
+                stage.items = len(chunks)
+            doc_chunks.append(chunks)
+        
+        # 3. Извлекаем сущности сразу из всех чанков всех документов
+        flat_chunks = [
+            text[start:end]
+            for text, chunks in zip(texts, doc_chunks)
+            for start, end in chunks
+        ]
+        # Разметка (слова и леммы) собирается при NER и используется связями и классификацией
+        annotations = [] if SHARED_MORPHOLOGY else None
+        ner_wall, ner_cpu = time.perf_counter(), time.process_time()
+        chunk_entities = self.ner_extractor.extract_batch(flat_chunks, annotations)
+        ner_wall, ner_cpu = time.perf_counter() - ner_wall, time.process_time() - ner_cpu
+        ner_size = sum(len(chunk) for chunk in flat_chunks) if self.collect_metrics else 0
+        del flat_chunks
+        
+        # В режиме "tfidf" документы группы классифицируются одним матричным произведением
+        classifications = {}
+        if self.process_classifier.mode == "tfidf":
+            classified = [i for i, (chunks, skip) in enumerate(zip(doc_chunks, reused)) if chunks and not skip]
+            classify_wall, classify_cpu = time.perf_counter(), time.process_time()
+            found = self.process_classifier.classify_batch([texts[i] for i in classified])
+            classify_wall, classify_cpu = time.perf_counter() - classify_wall, time.process_time() - classify_cpu
+            classifications = dict(zip(classified, found))
+            classify_size = sum(len(texts[i]) for i in classified)
+            for i in classified:
+                # Время общего произведения делится между документами пропорционально длине текста
+                share = len(texts[i]) / classify_size if classify_size else 0.0
+                metrics[i].add('classify', classify_wall * share, classify_cpu * share)
+        
+        results = []
+        offset = 0
+        for i, (file_path, text, chunks, skip, document_metrics) in enumerate(
+                zip(file_paths, texts, doc_chunks, reused, metrics)):
+            if skip:
+                results.append(None)  # Результат берется у найденного документа ниже
+                continue
+            if not chunks:
+                results.append({
+                    'error': 'Документ пуст или не удалось извлечь текст'
+                })
+                continue
+            
+            entities = chunk_entities[offset:offset + len(chunks)]
+            document_annotations = annotations[offset:offset + len(chunks)] if annotations is not None else None
+            offset += len(chunks)
+            if document_metrics.enabled:
+                # Время общего батча NER делится между документами пропорционально объему их чанков
+                size = sum(end - start for start, end in chunks)
+                share = size / ner_size if ner_size else 0.0
+                document_metrics.add('ner', ner_wall * share, ner_cpu * share, size,
+                                     sum(len(found) for found in entities))
+            results.append(self._build_result(
+                file_path, text, chunks, entities, document_metrics, document_annotations,
+                classifications.get(i)
+            ))
+        
+        if self.near_duplicates is not None:
+            self._apply_near_duplicates(file_paths, results, signatures, duplicates)
+        return results
+    
+    def _find_near_duplicates(self, file_paths: List[Path], texts: List[Optional[str]],
+                              metrics: List) -> Tuple[List, List[Optional[Tuple[str, float, object]]]]:
+        """MinHash-сигнатуры текстов группы и найденные для них почти-дубликаты.
+        
+        Почти-дубликат - (имя документа, похожесть, результат из индекса или номер документа
+        в этой же группе, результат которого еще не готов).
+        """
+        signatures = [None] * len(texts)
+        duplicates = [None] * len(texts)
+        if self.near_duplicates is None:
+            return signatures, duplicates
+        
+        for i, (text, document_metrics) in enumerate(zip(texts, metrics)):
+            if not text or not text.strip():
+                continue
+            with document_metrics.stage('fingerprint', len(text)) as stage:
+                signatures[i] = self.near_duplicates.signature(text)
+                best = self.near_duplicates.find(signatures[i], exclude=str(file_paths[i]))
+                # Документы этой же группы еще не в индексе: сравниваем с ними напрямую
+                for j in range(i):
+                    if signatures[j] is None or duplicates[j] is not None:
+                        continue
+                    score = similarity(signatures[i], signatures[j])
+                    if score >= self.near_duplicates.threshold and (best is None or score > best[1]):
+                        best = (str(file_paths[j]), score, j)
+                duplicates[i] = best
+                stage.items = int(best is not None)
+        return signatures, duplicates
+    
+    def _apply_near_duplicates(self, file_paths: List[Path], results: List[Optional[Dict]],
+                               signatures: List, duplicates: List):
+        """Подставляет результаты почти-дубликатов, отмечает их и добавляет новые документы в индекс"""
+        for i, (file_path, duplicate) in enumerate(zip(file_paths, duplicates)):
+            if duplicate is None:
+                if signatures[i] is not None and 'error' not in results[i]:
+                    self.near_duplicates.add(str(file_path), signatures[i], results[i])
+                continue
+            
+            document, score, source = duplicate
+            if results[i] is None:
+                results[i] = copy.deepcopy(results[source]) if isinstance(source, int) else source
+                results[i]['document'] = str(Path(file_path).name)
+            results[i]['near_duplicate'] = {'document': Path(document).name, 'similarity': round(score, 3)}
+    
+    def _build_result(self, file_path: Path, text: str, chunks: List[Tuple[int, int]],
+                      chunk_entities: List[List[Entity]], metrics=NULL_METRICS,
+                      annotations: Optional[List[TextAnnotation]] = None,
+                      classification: Optional[Dict] = None) -> Dict:
+        """Обрабатывает документ после NER: дедупликация, связи, классификация, цепочки.
         
-        # 3. Извлекаем сущности
+        annotations - морфологическая разметка чанков, полученная при NER (SHARED_MORPHOLOGY);
+        classification - бизнес-процесс, уже найденный для группы документов (classify_batch).
+        """
+        laps = metrics.laps()
+        
+        # Переводим позиции сущностей в координаты документа; упоминания из области
+        # перекрытия соседних чанков находятся дважды - оставляем одно
         all_entities = []
-        for chunk in chunks:
-            entities = self.ner_extractor.extract(chunk)
-            all_entities.extend(entities)
+        seen_spans = set()
+        for (chunk_start, _), entities in zip(chunks, chunk_entities):
+            for entity in entities:
+                entity.start += chunk_start
+                entity.end += chunk_start
+                span = (entity.start, entity.end, entity.type)
+                if span not in seen_spans:
+                    seen_spans.add(span)
+                    all_entities.append(entity)
         
         # Удаляем дубликаты сущностей и нормализуем
         unique_entities = {}
         for entity in all_entities:
             # Нормализуем текст (убираем лишние пробелы, переносы строк)
-            normalized_text = ' '.join(entity['text'].split())
-            key = normalized_text.lower().strip()
+            normalized_text = ' '.join(entity.text.split())
+            if self.entity_normalizer is not None:
+                key = self.entity_normalizer.normalize(normalized_text, entity.type)
+            else:
+                key = entity_key(normalized_text)
             
             # Пропускаем слишком короткие после нормализации
             if len(key) < 2:
@@ -112,59 +512,65 @@ class DocumentPipeline:
             
             # Если сущность уже есть, выбираем более полную версию
             if key not in unique_entities:
-                entity['text'] = normalized_text
+                entity.text = normalized_text
                 unique_entities[key] = entity
             else:
                 # Если новая версия длиннее, заменяем
-                if len(normalized_text) > len(unique_entities[key]['text']):
-                    entity['text'] = normalized_text
+                if len(normalized_text) > len(unique_entities[key].text):
+                    entity.text = normalized_text
                     unique_entities[key] = entity
         
         entities_list = list(unique_entities.values())
+        laps.lap('dedup', sum(len(entities) for entities in chunk_entities), len(entities_list))
         
-        # 4. Извлекаем связи
+        # 4. Извлекаем связи (индекс сущностей строится один раз на документ)
+        entity_index = self.relation_extractor.build_entity_index(entities_list)
+        keyword_index = self.relation_extractor.build_keyword_index(text)
         all_relations = []
-        for chunk in chunks:
-            relations = self.relation_extractor.extract(chunk, entities_list)
+        for k, (chunk_start, chunk_end) in enumerate(chunks):
+            # Связи по близости ищем только между сущностями внутри чанка
+            chunk_entities_local = [e for e in entities_list if chunk_start <= e.start and e.end <= chunk_end]
+            relations = self.relation_extractor.extract(
+                text[chunk_start:chunk_end], chunk_entities_local, entity_index,
+                annotations[k] if annotations is not None else None, offset=chunk_start,
+                keyword_index=keyword_index
+            )
             all_relations.extend(relations)
         
         # Удаляем дубликаты связей
         unique_relations = {}
         for rel in all_relations:
-            key = f"{rel['source']}_{rel['relation']}_{rel['target']}"
+            key = f"{rel.source}_{rel.relation}_{rel.target}"
             if key.lower() not in unique_relations:
                 unique_relations[key.lower()] = rel
         
         relations_list = list(unique_relations.values())
+        laps.lap('relations', len(text), len(relations_list))
         
         # 5. Классифицируем в бизнес-процессы
-        classification = self.process_classifier.classify(text)
+        if classification is None:
+            classification = self.process_classifier.classify(
+                text, TextAnnotation.merge(chunks, annotations) if annotations is not None else None
+            )
+        laps.lap('classify', len(text), 1)
         
         # 6. Строим цепочки связей
         chains = self._build_relation_chains(entities_list, relations_list)
+        laps.lap('chains', len(relations_list), len(chains))
         
         # 7. Формируем результат
         result = {
             'document': str(file_path.name),
             'entities': [
                 {
-                    'text': e['text'],
-                    'type': e['type'],
+                    'text': e.text,
+                    'type': e.type,
                     'id': i
                 }
                 for i, e in enumerate(entities_list)
             ],
-            'relations': [
-                {
-                    'source': r['source'],
-                    'target': r['target'],
-                    'relation': r['relation'],
-                    'source_type': r.get('source_type', 'UNK'),
-                    'target_type': r.get('target_type', 'UNK'),
-                    'context': r.get('context', '')
-                }
-                for r in relations_list
-            ],
+            # Контексты связей - позиции в тексте документа, строки создаются только здесь
+            'relations': [r.to_dict(text) for r in relations_list],
             'relation_chains': chains,
             'business_process': {
                 'category': classification['category'],
@@ -186,12 +592,36 @@ class DocumentPipeline:
     def process_and_save(self, file_path: Path, output_path: Optional[Path] = None) -> Dict:
         """Обрабатывает документ и сохраняет результат в JSON"""
         result = self.process_document(file_path)
+        self.save_result(result, file_path, output_path)
+        return result
+    
+    def process_and_save_batch(self, file_paths: List[Path],
+                               output_paths: Optional[List[Optional[Path]]] = None) -> List[Dict]:
+        """Обрабатывает группу документов и сохраняет результат каждого в JSON"""
+        results = self.process_documents(file_paths)
+        if output_paths is None:
+            output_paths = [None] * len(file_paths)
         
+        for result, file_path, output_path in zip(results, file_paths, output_paths):
+            self.save_result(result, file_path, output_path)
+        
+        return results
+    
+    def save_result(self, result: Dict, file_path: Path, output_path: Optional[Path] = None):
+        """Сохраняет результат обработки документа в JSON"""
         if output_path is None:
             from config import OUTPUT_DIR
             output_path = OUTPUT_DIR / f"{Path(file_path).stem}_result.json"
         
+        started = time.perf_counter(), time.process_time()
         with open(output_path, 'w', encoding='utf-8') as f:
-            json.dump(result, f, ensure_ascii=False, indent=2)
+            if self.output_indent is None:
+                json.dump(result, f, ensure_ascii=False, separators=(',', ':'))
+            else:
+                json.dump(result, f, ensure_ascii=False, indent=self.output_indent)
         
-        return result
+        # Время сериализации попадает только в метрики, возвращаемые вызывающему коду
+        # (у результатов-ошибок нет ни сущностей, ни замеров этапов)
+        if 'error' not in result:
+            add_result_stage(result, 'serialize', started, len(result['entities']) + len(result['relations']),
+                             Path(output_path).stat().st_size)
@@ -2,20 +2,35 @@
 Модуль для классификации текста в бизнес-процессы
 """
 import re
+from pathlib import Path
 from typing import List, Dict, Tuple, Optional
 # from transformers import AutoTokenizer, AutoModelForSequenceClassification, pipeline
 # import torch
 from business_process_loader import BusinessProcessLoader
+from keyword_matcher import KeywordMatcher
+from process_matrix import ProcessMatrix
+from text_annotation import TextAnnotation
 
 
 class ProcessClassifier:
     """Класс для классификации текста в бизнес-процессы"""
     
-    def __init__(self, business_process_loader: BusinessProcessLoader, use_gpu: bool = False):
+    VERSION = "1.1"  # Версия логики классификации (входит в ключ кэша результатов)
+    
+    def __init__(self, business_process_loader: BusinessProcessLoader, use_gpu: bool = False,
+                 mode: str = "keywords", top_k: int = 3, matrix_path: Optional[Path] = None):
+        if mode not in ("keywords", "tfidf"):
+            raise ValueError(f"Неизвестный режим классификации: {mode}")
+        
         self.bp_loader = business_process_loader
         self.use_gpu = use_gpu
+        self.mode = mode
+        self.top_k = top_k
         # self.device = "mps" if use_gpu and torch.backends.mps.is_available() else "cpu"
         self._init_keywords()
+        self._matcher = None  # Автомат ключевых слов, строится при первой классификации
+        # Матрица TF-IDF процессов (режим "tfidf"), строится при первой классификации
+        self.process_matrix = ProcessMatrix(self.bp_loader, matrix_path) if mode == "tfidf" else None
     
     def _init_keywords(self):
         """Инициализация ключевых слов для каждого бизнес-процесса"""
@@ -70,13 +85,48 @@ class ProcessClassifier:
         
         self.keyword_map = keyword_mappings
     
-    def classify_by_keywords(self, text: str) -> List[Tuple[int, float]]:
+    def _get_matcher(self) -> KeywordMatcher:
+        """Возвращает автомат ключевых слов (keyword_map задан в коде и не зависит
+        от business_processes.txt, поэтому автомат строится один раз)"""
+        if self._matcher is None:
+            self._matcher = KeywordMatcher(self.keyword_map)
+        return self._matcher
+    
+    def keyword_counts(self, text: str, annotation: Optional[TextAnnotation] = None) -> Dict[str, int]:
+        """Количество вхождений каждого ключевого слова в тексте (один проход).
+        
+        С разметкой annotation ключевое слово засчитывается, если с него начинается лемма слова
+        ("закупк" - "закупка", "закупками"); сам текст при этом не сканируется.
+        """
+        if annotation is not None:
+            return self._lemma_keyword_counts(annotation)
+        return self._get_matcher().count(text.lower())
+    
+    def _lemma_keyword_counts(self, annotation: TextAnnotation) -> Dict[str, int]:
+        """Подсчет ключевых слов по префиксам лемм: каждая различная лемма проверяется один раз"""
+        lengths = sorted({len(keyword) for keyword in self.keyword_map})
+        lemma_counts = {}
+        for lemma in annotation.lemmas:
+            lemma_counts[lemma] = lemma_counts.get(lemma, 0) + 1
+        
+        counts = {}
+        for lemma, count in lemma_counts.items():
+            for length in lengths:
+                if length > len(lemma):
+                    break
+                prefix = lemma[:length]
+                if prefix in self.keyword_map:
+                    counts[prefix] = counts.get(prefix, 0) + count
+        return counts
+    
+    def classify_by_keywords(self, text: str, annotation: Optional[TextAnnotation] = None) -> List[Tuple[int, float]]:
         """Классификация на основе ключевых слов"""
-        text_lower = text.lower()
+        counts = self.keyword_counts(text, annotation)
         scores = {}
         
+        # Score процесса - число различных найденных ключевых слов
         for keyword, process_numbers in self.keyword_map.items():
-            if keyword in text_lower:
+            if counts.get(keyword):
                 for proc_num in process_numbers:
                     scores[proc_num] = scores.get(proc_num, 0) + 1
         
@@ -84,11 +134,30 @@ class ProcessClassifier:
         sorted_scores = sorted(scores.items(), key=lambda x: x[1], reverse=True)
         return sorted_scores[:5]  # Топ-5 процессов
     
-    def classify(self, text: str) -> Dict:
-        """Основной метод классификации"""
+    def classify_batch(self, texts: List[str]) -> List[Dict]:
+        """Классифицирует группу документов (в режиме "tfidf" - одним матричным произведением)"""
+        if self.mode != "tfidf":
+            return [self.classify(text) for text in texts]
+        
+        return [
+            self._format_result(top_processes, top_processes[0][1] if top_processes else 0.0)
+            for top_processes in self.process_matrix.top_k(texts, self.top_k)
+        ]
+    
+    def classify(self, text: str, annotation: Optional[TextAnnotation] = None) -> Dict:
+        """Основной метод классификации (annotation - общая разметка текста для режима "keywords")"""
+        if self.mode == "tfidf":
+            return self.classify_batch([text])[0]
+        
         # Используем keyword-based классификацию
-        top_processes = self.classify_by_keywords(text)
+        top_processes = self.classify_by_keywords(text, annotation)
         
+        # Нормализуем confidence (максимальный score = 5)
+        confidence = min(top_processes[0][1] / 5.0, 1.0) if top_processes else 0.0
+        return self._format_result(top_processes[:3], confidence)
+    
+    def _format_result(self, top_processes: List[Tuple[int, float]], confidence: float) -> Dict:
+        """Формирует результат классификации: топ-1 процесс и альтернативы"""
         if not top_processes:
             # Если не найдено, возвращаем общий процесс
             return {
@@ -99,12 +168,9 @@ class ProcessClassifier:
             }
         
         # Берем топ-1 процесс
-        top_number, score = top_processes[0]
+        top_number, _ = top_processes[0]
         category, subprocess = self.bp_loader.get_process_by_number(top_number)
         
-        # Нормализуем confidence (максимальный score = 5)
-        confidence = min(score / 5.0, 1.0)
-        
         return {
             'category': category or 'Не определен',
             'subprocess': subprocess or 'Не определен',
@@ -117,6 +183,6 @@ class ProcessClassifier:
                     'subprocess': self.bp_loader.get_process_by_number(num)[1],
                     'score': sc
                 }
-                for num, sc in top_processes[1:3]  # Следующие 2 альтернативы
+                for num, sc in top_processes[1:]  # Следующие альтернативы
             ]
         }
@@ -0,0 +1,161 @@
+"""
+Модуль для векторной классификации текста в бизнес-процессы (TF-IDF)
+"""
+import math
+import re
+from pathlib import Path
+from typing import List, Optional, Tuple
+import numpy as np
+from business_process_loader import BusinessProcessLoader
+
+
+WORD_RE = re.compile(r'[а-яёa-z]+')
+
+
+def stem(word: str, length: int = 5) -> Optional[str]:
+    """Грубая основа слова: первые length букв; короткие служебные слова отбрасываются"""
+    if len(word) < 4:
+        return None
+    return word[:length]
+
+
+class ProcessMatrix:
+    """Матрица TF-IDF описаний бизнес-процессов.
+    
+    Строка матрицы - нормированный вектор процесса (категория + подпроцесс) в словаре основ
+    из business_processes.txt. Оценка документов - одно матричное произведение с их векторами
+    (косинусная близость). Матрица сохраняется на диск и перестраивается при смене ревизии файла процессов.
+    """
+    
+    VERSION = "1.0"  # Версия токенизации и взвешивания (при смене кэш матрицы перестраивается)
+    SCORE_DIGITS = 6  # Знаков после запятой в оценках
+    
+    def __init__(self, bp_loader: BusinessProcessLoader, cache_path: Optional[Path] = None):
+        self.bp_loader = bp_loader
+        self.cache_path = Path(cache_path) if cache_path else None
+        self.revision = None
+        self.numbers = np.zeros(0, dtype=np.int64)  # Номер процесса для каждой строки матрицы
+        self.vocabulary = {}  # Основа -> столбец
+        self.idf = np.zeros(0, dtype=np.float32)
+        self.matrix = np.zeros((0, 0), dtype=np.float32)
+    
+    @staticmethod
+    def _terms(text: str) -> List[str]:
+        terms = []
+        for word in WORD_RE.findall(text.lower()):
+            term = stem(word)
+            if term:
+                terms.append(term)
+        return terms
+    
+    def _cache_revision(self) -> str:
+        return f"{self.bp_loader.revision}:{self.VERSION}"
+    
+    def ensure_current(self):
+        """Перестраивает матрицу, если файл процессов изменился с момента построения"""
+        revision = self._cache_revision()
+        if self.revision == revision:
+            return
+        if not self._load(revision):
+            self._build()
+            self._save(revision)
+        self.revision = revision
+    
+    def _build(self):
+        """Строит матрицу TF-IDF по описаниям процессов"""
+        processes = self.bp_loader.get_all_processes()
+        documents = [self._terms(f"{p['category'] or ''} {p['subprocess']}") for p in processes]
+        
+        document_frequency = {}
+        for terms in documents:
+            for term in set(terms):
+                document_frequency[term] = document_frequency.get(term, 0) + 1
+        
+        self.vocabulary = {term: i for i, term in enumerate(sorted(document_frequency))}
+        # Сглаженный IDF: основы, общие для многих процессов ("управление"), почти не влияют на оценку
+        self.idf = np.array([
+            math.log((1 + len(documents)) / (1 + document_frequency[term])) + 1
+            for term in sorted(document_frequency)
+        ], dtype=np.float32)
+        self.numbers = np.array([p['number'] for p in processes], dtype=np.int64)
+        
+        self.matrix = np.zeros((len(documents), len(self.vocabulary)), dtype=np.float32)
+        for row, terms in enumerate(documents):
+            for term in terms:
+                self.matrix[row, self.vocabulary[term]] += 1
+        self.matrix = self._normalize(self._weigh(self.matrix))
+    
+    def _weigh(self, counts: np.ndarray) -> np.ndarray:
+        """Сублинейный TF (1 + log) с весами IDF"""
+        weights = np.zeros_like(counts)
+        np.log(counts, out=weights, where=counts > 0)
+        weights += counts > 0
+        return weights * self.idf
+    
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms > 0, norms, 1)
+    
+    def _load(self, revision: str) -> bool:
+        """Загружает матрицу из кэша; False, если кэша нет или он построен для другой ревизии"""
+        if self.cache_path is None or not self.cache_path.exists():
+            return False
+        try:
+            with np.load(self.cache_path, allow_pickle=False) as data:
+                if str(data['revision']) != revision:
+                    return False
+                self.numbers = data['numbers']
+                self.idf = data['idf']
+                self.matrix = data['matrix']
+                self.vocabulary = {str(term): i for i, term in enumerate(data['terms'])}
+        except (OSError, KeyError, ValueError):
+            return False
+        return True
+    
+    def _save(self, revision: str):
+        """Сохраняет матрицу в кэш"""
+        if self.cache_path is None:
+            return
+        self.cache_path.parent.mkdir(parents=True, exist_ok=True)
+        terms = sorted(self.vocabulary, key=self.vocabulary.get)
+        tmp_path = self.cache_path.with_suffix('.tmp.npz')
+        np.savez(tmp_path, revision=np.array(revision), numbers=self.numbers, idf=self.idf,
+                 matrix=self.matrix, terms=np.array(terms, dtype=str))
+        tmp_path.replace(self.cache_path)
+    
+    def vectorize(self, texts: List[str]) -> np.ndarray:
+        """Нормированные векторы TF-IDF документов (строка на документ)"""
+        self.ensure_current()
+        counts = np.zeros((len(texts), len(self.vocabulary)), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for term in self._terms(text):
+                column = self.vocabulary.get(term)
+                if column is not None:
+                    counts[row, column] += 1
+        return self._normalize(self._weigh(counts))
+    
+    def score(self, texts: List[str]) -> np.ndarray:
+        """Косинусная близость документов к процессам: матрица (документы x процессы)"""
+        return self.vectorize(texts) @ self.matrix.T
+    
+    def top_k(self, texts: List[str], k: int) -> List[List[Tuple[int, float]]]:
+        """Топ-k процессов (номер, оценка) для каждого документа; процессы с нулевой оценкой отбрасываются"""
+        scores = self.score(texts)
+        if scores.shape[1] == 0:
+            return [[] for _ in texts]
+        
+        k = min(k, scores.shape[1])
+        # argpartition выбирает k лучших за O(n), сортируются только они
+        best = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        # Порядок суммирования в произведении матриц зависит от числа строк, и оценка документа
+        # в батче отличается от одиночной в последних знаках float32 - оценки округляются
+        results = []
+        for row, columns in enumerate(best):
+            columns = columns[np.argsort(-scores[row, columns], kind='stable')]
+            results.append([
+                (int(self.numbers[column]), round(float(scores[row, column]), self.SCORE_DIGITS))
+                for column in columns
+                if scores[row, column] > 0
+            ])
+        return results
@@ -3,13 +3,46 @@
 """
 import re
 from typing import List, Dict, Tuple, Optional
+from entity_index import EntityIndex
+from entity_records import Entity, Relation
+from keyword_index import KeywordIndex
+from text_annotation import TextAnnotation
 # from transformers import AutoTokenizer, AutoModelForSequenceClassification, pipeline
 # import torch
 
 
+WORD_RE = re.compile(r'\w+')
+
+
 class RelationExtractor:
     """Класс для извлечения связей между сущностями"""
     
+    VERSION = "1.0"  # Версия логики извлечения связей (входит в ключ кэша результатов)
+    
+    # Глаголы действия: связь по близости валидна, если один из них есть в контексте
+    ACTION_VERBS = ('заключил', 'заключить', 'подписал', 'подписать', 'поставил',
+                    'поставить', 'получил', 'получить', 'управляет', 'управлять',
+                    'работает', 'работать', 'закупает', 'закупить', 'продает',
+                    'продать', 'отчитывается', 'контролирует', 'контролировать',
+                    'взаимодействует', 'взаимодействовать', 'сотрудничает')
+    # Предлоги/союзы: без глагола действия связь валидна при достаточно длинном контексте
+    CONNECTING_WORDS = ('с', 'для', 'от', 'к', 'в', 'на', 'по', 'и', 'или')
+    # Ключевые слова типов связей по близости (проверяются по порядку, первый найденный - тип связи)
+    RELATION_KEYWORDS = {
+        'заключить_договор': ('договор', 'контракт', 'соглашение', 'подписать'),
+        'поставить': ('поставка', 'поставить', 'доставить', 'отгрузить'),
+        'закупить': ('закупка', 'закупить', 'приобрести', 'купить'),
+        'управлять': ('управление', 'управлять', 'руководить', 'контролировать'),
+        'работать_с': ('работа', 'сотрудничество', 'взаимодействие'),
+        'отчитаться': ('отчет', 'отчитаться', 'предоставить отчет'),
+    }
+    # Группы индекса позиций ключевых слов связей по близости
+    PROXIMITY_KEYWORDS = {
+        'действие': ACTION_VERBS,
+        'связка': CONNECTING_WORDS,
+        'тип': [word for words in RELATION_KEYWORDS.values() for word in words],
+    }
+    
     def __init__(self, use_gpu: bool = False):
         self.use_gpu = use_gpu
         # self.device = "mps" if use_gpu and torch.backends.mps.is_available() else "cpu"
@@ -18,162 +51,253 @@ class RelationExtractor:
     
     def _init_patterns(self):
         """Инициализация паттернов для извлечения связей"""
-        # Паттерны для типичных бизнес-связей
-        self.relation_patterns = [
-            (r'(\w+)\s+(?:заключил|заключить|подписал|подписать)\s+(?:договор|контракт|соглашение)\s+(?:с|на)\s+(\w+)', 'заключить_договор'),
-            (r'(\w+)\s+(?:поставил|поставить|поставляет|поставка)\s+(\w+)', 'поставить'),
-            (r'(\w+)\s+(?:получил|получить|получает)\s+(\w+)', 'получить'),
-            (r'(\w+)\s+(?:управляет|управлять|управление)\s+(\w+)', 'управлять'),
-            (r'(\w+)\s+(?:работает|работать)\s+(?:с|в)\s+(\w+)', 'работать_с'),
-            (r'(\w+)\s+(?:взаимодействует|взаимодействовать)\s+(?:с)\s+(\w+)', 'взаимодействовать_с'),
-            (r'(\w+)\s+(?:закупает|закупить|закупка)\s+(\w+)', 'закупить'),
-            (r'(\w+)\s+(?:продает|продать|продажа)\s+(\w+)', 'продать'),
-            (r'(\w+)\s+(?:отчитывается|отчитаться)\s+(?:перед|в)\s+(\w+)', 'отчитаться'),
-            (r'(\w+)\s+(?:контролирует|контролировать)\s+(\w+)', 'контролировать'),
+        # Паттерны для типичных бизнес-связей:
+        # <источник> <глагол-триггер> [<слово-связка> ...] <цель>
+        # (слова разделены только пробельными символами, сравнение без учета регистра)
+        self.relation_patterns = []
+        self._trigger_index = {}  # Триггер -> список (номер паттерна, связки)
+        
+        self.register_pattern('заключить_договор', ['заключил', 'заключить', 'подписал', 'подписать'],
+                              [['договор', 'контракт', 'соглашение'], ['с', 'на']])
+        self.register_pattern('поставить', ['поставил', 'поставить', 'поставляет', 'поставка'])
+        self.register_pattern('получить', ['получил', 'получить', 'получает'])
+        self.register_pattern('управлять', ['управляет', 'управлять', 'управление'])
+        self.register_pattern('работать_с', ['работает', 'работать'], [['с', 'в']])
+        self.register_pattern('взаимодействовать_с', ['взаимодействует', 'взаимодействовать'], [['с']])
+        self.register_pattern('закупить', ['закупает', 'закупить', 'закупка'])
+        self.register_pattern('продать', ['продает', 'продать', 'продажа'])
+        self.register_pattern('отчитаться', ['отчитывается', 'отчитаться'], [['перед', 'в']])
+        self.register_pattern('контролировать', ['контролирует', 'контролировать'])
+    
+    def register_pattern(self, relation_type: str, triggers: List[str],
+                         connectors: Optional[List[List[str]]] = None):
+        """Регистрирует паттерн связи; новый паттерн не добавляет отдельного прохода по тексту"""
+        if not triggers:
+            raise ValueError(f"Паттерн связи {relation_type} должен содержать хотя бы один триггер")
+        
+        connectors = tuple(frozenset(word.lower() for word in words) for words in (connectors or []))
+        pattern_id = len(self.relation_patterns)
+        self.relation_patterns.append((relation_type, tuple(triggers), connectors))
+        
+        for trigger in dict.fromkeys(trigger.lower() for trigger in triggers):
+            self._trigger_index.setdefault(trigger, []).append((pattern_id, connectors))
+    
+    def _match_patterns(self, text: str,
+                        annotation: Optional[TextAnnotation] = None) -> List[List[Tuple[str, str, int, int]]]:
+        """Находит совпадения всех паттернов за один проход по словам текста.
+        
+        Возвращает для каждого паттерна список (источник, цель, начало и конец контекста) в порядке текста;
+        совпадения одного паттерна не перекрываются, как при re.finditer.
+        С разметкой annotation триггеры и связки сравниваются и со словом, и с его леммой
+        ("заключили" совпадает с триггером "заключить"), а текст повторно не токенизируется.
+        """
+        if annotation is not None:
+            tokens, words, lemmas = annotation.spans, annotation.words, annotation.lemmas
+        else:
+            tokens = [(match.start(), match.end()) for match in WORD_RE.finditer(text)]
+            words = [text[start:end].lower() for start, end in tokens]
+            lemmas = None
+        
+        matches = [[] for _ in self.relation_patterns]
+        if len(tokens) < 3:
+            return matches
+        
+        # spaced[i] - слова i-1 и i разделены только пробельными символами
+        spaced = [False] + [
+            text[tokens[i - 1][1]:tokens[i][0]].isspace()
+            for i in range(1, len(tokens))
         ]
+        last_end = [0] * len(self.relation_patterns)
+        
+        for i in range(1, len(tokens) - 1):
+            if not spaced[i]:
+                continue
+            candidates = self._trigger_index.get(words[i])
+            if not candidates and lemmas is not None:
+                candidates = self._trigger_index.get(lemmas[i])
+            if not candidates:
+                continue
+            
+            source_start, source_end = tokens[i - 1]
+            for pattern_id, connectors in candidates:
+                if source_start < last_end[pattern_id]:
+                    continue
+                
+                j = i
+                for allowed in connectors:
+                    j += 1
+                    if j >= len(tokens) or not spaced[j] or \
+                            (words[j] not in allowed and (lemmas is None or lemmas[j] not in allowed)):
+                        break
+                else:
+                    j += 1
+                    if j < len(tokens) and spaced[j]:
+                        target_start, target_end = tokens[j]
+                        last_end[pattern_id] = target_end
+                        matches[pattern_id].append((
+                            text[source_start:source_end],
+                            text[target_start:target_end],
+                            source_start,
+                            target_end
+                        ))
+        
+        return matches
     
-    def extract_relations_pattern(self, text: str, entities: List[Dict]) -> List[Dict]:
-        """Извлечение связей на основе паттернов"""
+    @staticmethod
+    def build_entity_index(entities: List[Entity]) -> EntityIndex:
+        """Строит индекс сущностей документа (один раз на документ)"""
+        return EntityIndex(entities)
+    
+    def build_keyword_index(self, text: str, offset: int = 0) -> KeywordIndex:
+        """Строит индекс позиций ключевых слов связей по близости (один раз на документ)"""
+        return KeywordIndex(text, self.PROXIMITY_KEYWORDS, offset)
+    
+    def extract_relations_pattern(self, text: str, entities: List[Entity],
+                                  entity_index: Optional[EntityIndex] = None,
+                                  annotation: Optional[TextAnnotation] = None,
+                                  offset: int = 0,
+                                  keyword_index: Optional[KeywordIndex] = None) -> List[Relation]:
+        """Извлечение связей на основе паттернов.
+        
+        text - фрагмент документа, начинающийся с позиции offset; позиции сущностей и контекстов
+        связей заданы в координатах документа. keyword_index - индекс ключевых слов всего документа
+        (если не передан, строится по фрагменту).
+        """
         relations = []
-        entity_texts = {e['text']: e for e in entities}
+        if entity_index is None:
+            entity_index = self.build_entity_index(entities)
         seen_relations = set()  # Для избежания дубликатов
         
-        # Ищем связи между сущностями в тексте
-        for pattern, relation_type in self.relation_patterns:
-            matches = re.finditer(pattern, text, re.IGNORECASE)
-            for match in matches:
-                source_text = match.group(1)
-                target_text = match.group(2)
-                
+        # Ищем связи между сущностями в тексте (все паттерны за один проход)
+        pattern_matches = self._match_patterns(text, annotation)
+        for (relation_type, _, _), matches in zip(self.relation_patterns, pattern_matches):
+            for source_text, target_text, context_start, context_end in matches:
                 # Проверяем, являются ли найденные слова сущностями
-                source_entity = self._find_entity(source_text, entity_texts)
-                target_entity = self._find_entity(target_text, entity_texts)
+                source_entity = entity_index.find(source_text)
+                target_entity = entity_index.find(target_text)
                 
                 if source_entity and target_entity:
                     # Пропускаем связи между одинаковыми сущностями
-                    if source_entity['text'].lower() == target_entity['text'].lower():
+                    if source_entity.text.lower() == target_entity.text.lower():
                         continue
                     
                     # Создаем ключ для проверки дубликатов
-                    relation_key = (source_entity['text'].lower(), relation_type, target_entity['text'].lower())
+                    relation_key = (source_entity.text.lower(), relation_type, target_entity.text.lower())
                     if relation_key not in seen_relations:
                         seen_relations.add(relation_key)
-                        relations.append({
-                            'source': source_entity['text'],
-                            'target': target_entity['text'],
-                            'relation': relation_type,
-                            'source_type': source_entity['type'],
-                            'target_type': target_entity['type'],
-                            'context': match.group(0)
-                        })
+                        relations.append(Relation(
+                            source_entity.text, target_entity.text, relation_type,
+                            source_entity.type, target_entity.type,
+                            offset + context_start, offset + context_end
+                        ))
         
         # Дополнительно ищем связи через близость сущностей в тексте
-        proximity_relations = self._extract_proximity_relations(text, entities)
+        proximity_relations = self._extract_proximity_relations(
+            text, entities, offset=offset, keyword_index=keyword_index
+        )
         
         # Фильтруем дубликаты из proximity relations
         for rel in proximity_relations:
-            relation_key = (rel['source'].lower(), rel['relation'], rel['target'].lower())
+            relation_key = (rel.source.lower(), rel.relation, rel.target.lower())
             if relation_key not in seen_relations:
                 seen_relations.add(relation_key)
                 relations.append(rel)
         
         return relations
     
-    def _find_entity(self, text: str, entity_dict: Dict) -> Optional[Dict]:
-        """Находит сущность по тексту (частичное совпадение)"""
+    def _find_entity(self, text: str, entity_dict: Dict[str, Entity]) -> Optional[Entity]:
+        """Находит сущность по тексту (частичное совпадение) линейным перебором.
+        
+        Эталон для EntityIndex.find, который отвечает на тот же запрос через индекс.
+        """
         text_lower = text.lower()
         for entity_text, entity in entity_dict.items():
             if text_lower in entity_text.lower() or entity_text.lower() in text_lower:
                 return entity
         return None
     
-    def _extract_proximity_relations(self, text: str, entities: List[Dict], max_distance: int = 100) -> List[Dict]:
-        """Извлечение связей на основе близости сущностей в тексте"""
+    def _extract_proximity_relations(self, text: str, entities: List[Entity], max_distance: int = 100,
+                                     offset: int = 0,
+                                     keyword_index: Optional[KeywordIndex] = None) -> List[Relation]:
+        """Извлечение связей на основе близости сущностей в тексте (text начинается с позиции offset).
+        
+        Ключевые слова в контексте пары ищутся бинарным поиском по индексу позиций, а не
+        сканированием строки контекста.
+        """
         relations = []
+        if keyword_index is None:
+            keyword_index = self.build_keyword_index(text, offset)
         
         # Сортируем сущности по позиции в тексте
-        sorted_entities = sorted(entities, key=lambda x: x.get('start', 0))
+        sorted_entities = sorted(entities, key=lambda x: x.start)
         
         for i in range(len(sorted_entities) - 1):
             source = sorted_entities[i]
             target = sorted_entities[i + 1]
             
             # Пропускаем связи между одинаковыми сущностями
-            if source['text'].lower() == target['text'].lower():
+            if source.text.lower() == target.text.lower():
                 continue
             
             # Проверяем расстояние между сущностями
-            source_end = source.get('end', 0)
-            target_start = target.get('start', 0)
+            source_end = source.end - offset
+            target_start = target.start - offset
             
             if 0 < target_start - source_end < max_distance:
                 # Извлекаем контекст между сущностями
                 context_start = max(0, source_end)
                 context_end = min(len(text), target_start + 100)
-                context = text[context_start:context_end].strip()
+                raw_context = text[context_start:context_end]
+                context = raw_context.strip()
+                context_start += len(raw_context) - len(raw_context.lstrip())
                 
                 # Пропускаем слишком короткий контекст
                 if len(context) < 10:
                     continue
                 
+                # Контекст в координатах документа
+                window = (offset + context_start, offset + context_start + len(context))
+                
                 # Определяем тип связи по контексту
-                relation_type = self._infer_relation_type(context)
+                relation_type = self._infer_relation_type(keyword_index, *window)
                 
                 # Пропускаем общие связи, если нет четкого контекста
                 if relation_type == 'связан_с' and len(context) < 30:
                     continue
                 
                 # Проверяем, что связь имеет смысл
-                if self._is_valid_relation(source, target, context):
-                    relations.append({
-                        'source': source['text'],
-                        'target': target['text'],
-                        'relation': relation_type,
-                        'source_type': source['type'],
-                        'target_type': target['type'],
-                        'context': context[:200]  # Ограничиваем длину контекста
-                    })
+                if self._is_valid_relation(keyword_index, *window):
+                    relations.append(Relation(
+                        source.text, target.text, relation_type, source.type, target.type,
+                        # Контекст - позиция в документе; длина ограничена 200 символами
+                        window[0], window[0] + min(len(context), 200)
+                    ))
         
         return relations
     
-    def _is_valid_relation(self, source: Dict, target: Dict, context: str) -> bool:
-        """Проверяет, является ли связь валидной"""
-        context_lower = context.lower()
-        
+    def _is_valid_relation(self, keyword_index: KeywordIndex, start: int, end: int) -> bool:
+        """Проверяет, является ли связь валидной (контекст - [start, end) в координатах документа)"""
         # Пропускаем связи, где в контексте нет глаголов действия
-        action_verbs = ['заключил', 'заключить', 'подписал', 'подписать', 'поставил', 
-                        'поставить', 'получил', 'получить', 'управляет', 'управлять',
-                        'работает', 'работать', 'закупает', 'закупить', 'продает',
-                        'продать', 'отчитывается', 'контролирует', 'контролировать',
-                        'взаимодействует', 'взаимодействовать', 'сотрудничает']
-        
-        has_action = any(verb in context_lower for verb in action_verbs)
+        if keyword_index.contains('действие', start, end):
+            return True
         
         # Если нет глагола действия, но есть предлоги/союзы, это может быть валидная связь
-        connecting_words = ['с', 'для', 'от', 'к', 'в', 'на', 'по', 'и', 'или']
-        has_connection = any(word in context_lower for word in connecting_words)
-        
-        return has_action or (has_connection and len(context) > 20)
+        return end - start > 20 and keyword_index.contains('связка', start, end)
     
-    def _infer_relation_type(self, context: str) -> Optional[str]:
-        """Определяет тип связи по контексту"""
-        context_lower = context.lower()
-        
-        relation_keywords = {
-            'заключить_договор': ['договор', 'контракт', 'соглашение', 'подписать'],
-            'поставить': ['поставка', 'поставить', 'доставить', 'отгрузить'],
-            'закупить': ['закупка', 'закупить', 'приобрести', 'купить'],
-            'управлять': ['управление', 'управлять', 'руководить', 'контролировать'],
-            'работать_с': ['работа', 'сотрудничество', 'взаимодействие'],
-            'отчитаться': ['отчет', 'отчитаться', 'предоставить отчет'],
-        }
-        
-        for relation_type, keywords in relation_keywords.items():
-            if any(keyword in context_lower for keyword in keywords):
-                return relation_type
+    def _infer_relation_type(self, keyword_index: KeywordIndex, start: int, end: int) -> Optional[str]:
+        """Определяет тип связи по контексту [start, end)"""
+        found = set(keyword_index.found('тип', start, end))
+        if found:
+            for relation_type, keywords in self.RELATION_KEYWORDS.items():
+                if not found.isdisjoint(keywords):
+                    return relation_type
         
         return 'связан_с'  # Общая связь по умолчанию
     
-    def extract(self, text: str, entities: List[Dict]) -> List[Dict]:
+    def extract(self, text: str, entities: List[Entity],
+                entity_index: Optional[EntityIndex] = None,
+                annotation: Optional[TextAnnotation] = None,
+                offset: int = 0,
+                keyword_index: Optional[KeywordIndex] = None) -> List[Relation]:
         """Основной метод извлечения связей"""
-        return self.extract_relations_pattern(text, entities)
+        return self.extract_relations_pattern(text, entities, entity_index, annotation, offset, keyword_index)
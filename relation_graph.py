@@ -0,0 +1,55 @@
+"""
+Модуль для построения цепочек связей по графу сущностей
+"""
+from typing import Dict, Iterable, Iterator, List, Tuple
+from entity_records import Relation
+
+
+class RelationGraph:
+    """Ориентированный граф связей на списках смежности: сущность -> [(связь, сущность)].
+    
+    Цепочка - путь в графе в виде [сущность, связь, сущность, связь, ...]. Пути выдаются лениво,
+    поэтому при ограничении числа цепочек лишние пути не строятся и не занимают память.
+    """
+    
+    def __init__(self, relations: Iterable[Relation]):
+        self.adjacency: Dict[str, List[Tuple[str, str]]] = {}
+        for rel in relations:
+            self.adjacency.setdefault(rel.source, []).append((rel.relation, rel.target))
+    
+    def iter_chains(self, starts: Iterable[str], max_depth: int = 1) -> Iterator[List[str]]:
+        """Выдает максимальные пути длиной до max_depth связей из каждой начальной сущности.
+        
+        Путь заканчивается, когда достигнута глубина, у сущности нет исходящих связей или связь
+        ведет в сущность, уже входящую в путь (цикл: последняя сущность цепочки повторяет одну из
+        предыдущих). Каждое расширение пути завершается выдачей цепочки, поэтому работа
+        пропорциональна суммарной длине выданных цепочек. Само число простых путей при глубине
+        больше 1 на плотном графе растет экспоненциально с глубиной - вызывающий код ограничивает
+        число забираемых цепочек.
+        """
+        for start in starts:
+            edges = self.adjacency.get(start)
+            if not edges:
+                continue
+            
+            path = [start]
+            on_path = {start}
+            stack = [iter(edges)]  # Итераторы по исходящим связям сущностей пути
+            while stack:
+                edge = next(stack[-1], None)
+                if edge is None:
+                    stack.pop()
+                    if stack:
+                        on_path.discard(path.pop())
+                        path.pop()
+                    continue
+                
+                relation, target = edge
+                path.append(relation)
+                path.append(target)
+                if target in on_path or len(stack) >= max_depth or not self.adjacency.get(target):
+                    yield list(path)
+                    del path[-2:]
+                    continue
+                on_path.add(target)
+                stack.append(iter(self.adjacency[target]))
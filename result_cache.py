@@ -0,0 +1,145 @@
+"""
+Модуль для кэширования результатов обработки документов на диске
+"""
+import hashlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+from typing import Dict, Iterable, Optional
+import config
+
+
+# Настройки config.py, которые не влияют на результат обработки и не входят в отпечаток
+NON_RESULT_SETTINGS = {
+    'PROJECT_ROOT', 'DATA_DIR', 'BUSINESS_PROCESSES_FILE', 'OUTPUT_DIR',
+    'NER_BATCH_SIZE', 'NER_N_PROCESS', 'DOC_BATCH_SIZE', 'NUM_WORKERS',
+    'RESULT_CACHE_ENABLED', 'RESULT_CACHE_PATH', 'RESULT_CACHE_MAX_BYTES',
+    'STREAM_MIN_FILE_SIZE', 'STREAM_WINDOW_CHUNKS', 'METRICS_ENABLED',
+    'CLASSIFIER_MATRIX_PATH', 'WATCH_DEBOUNCE', 'WATCH_POLL_INTERVAL', 'WATCH_MANIFEST_NAME',
+    'OUTPUT_FORMAT', 'OUTPUT_INDENT', 'OUTPUT_BATCH_DOCUMENTS', 'PDF_WORKERS',
+    'ENTITY_STORE_ENABLED', 'ENTITY_STORE_PATH', 'NEAR_DUPLICATE_PATH',
+    'ENTITY_NORM_CACHE_SIZE', 'ENTITY_NORM_CACHE_PATH', 'LEMMA_CACHE_SIZE',
+    'SERVICE_HOST', 'SERVICE_PORT', 'SERVICE_QUEUE_SIZE', 'SERVICE_BATCH_WINDOW_MS', 'SERVICE_THREADS',
+}
+
+
+def file_hash(file_path: Path, block_size: int = 1 << 20) -> str:
+    """Возвращает SHA-256 содержимого файла"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(block_size), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def config_fingerprint(components: Iterable[object]) -> str:
+    """Отпечаток конфигурации: настройки config.py, бизнес-процессы и версии компонентов"""
+    settings = {
+        name: repr(getattr(config, name))
+        for name in dir(config)
+        if name.isupper() and name not in NON_RESULT_SETTINGS
+    }
+    versions = {
+        type(component).__name__: getattr(component, 'VERSION', None)
+        for component in components
+    }
+    payload = {
+        'settings': settings,
+        'business_processes': file_hash(config.BUSINESS_PROCESSES_FILE),
+        'versions': versions,
+    }
+    return hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """Кэш результатов в SQLite с ключом по содержимому документа и отпечатку конфигурации.
+    
+    Общий размер записей хранится в таблице stats и поддерживается триггерами, поэтому проверка
+    лимита при каждом put не суммирует всю таблицу (и верна при записи из нескольких процессов).
+    """
+    
+    def __init__(self, db_path: Path, fingerprint: str, max_bytes: int = 1 << 30):
+        self.db_path = Path(db_path)
+        self.fingerprint = fingerprint
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.conn = sqlite3.connect(str(self.db_path), timeout=30)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute(
+            'CREATE TABLE IF NOT EXISTS results ('
+            'key TEXT PRIMARY KEY, result TEXT NOT NULL, '
+            'size INTEGER NOT NULL, last_access REAL NOT NULL)'
+        )
+        self.conn.execute('CREATE INDEX IF NOT EXISTS results_last_access ON results (last_access)')
+        self.conn.executescript(
+            'CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL);'
+            # Кэш, созданный до появления stats, суммируется один раз
+            "INSERT OR IGNORE INTO stats (name, value) "
+            "SELECT 'total_bytes', COALESCE(SUM(size), 0) FROM results;"
+            'CREATE TRIGGER IF NOT EXISTS results_size_insert AFTER INSERT ON results BEGIN '
+            "UPDATE stats SET value = value + new.size WHERE name = 'total_bytes'; END;"
+            'CREATE TRIGGER IF NOT EXISTS results_size_delete AFTER DELETE ON results BEGIN '
+            "UPDATE stats SET value = value - old.size WHERE name = 'total_bytes'; END;"
+        )
+        self.conn.commit()
+    
+    def make_key(self, file_path: Path) -> str:
+        """Ключ кэша: хэш содержимого файла + отпечаток конфигурации"""
+        return f"{file_hash(file_path)}:{self.fingerprint}"
+    
+    def get(self, key: str) -> Optional[Dict]:
+        """Возвращает закэшированный результат или None"""
+        row = self.conn.execute('SELECT result FROM results WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        
+        self.hits += 1
+        self.conn.execute('UPDATE results SET last_access = ? WHERE key = ?', (time.time(), key))
+        self.conn.commit()
+        return json.loads(row[0])
+    
+    def put(self, key: str, result: Dict):
+        """Сохраняет результат и вытесняет давно не использованные записи при превышении размера"""
+        data = json.dumps(result, ensure_ascii=False)
+        # DELETE + INSERT вместо INSERT OR REPLACE: замена строки не запускает триггер удаления
+        self.conn.execute('DELETE FROM results WHERE key = ?', (key,))
+        self.conn.execute(
+            'INSERT INTO results (key, result, size, last_access) VALUES (?, ?, ?, ?)',
+            (key, data, len(data.encode('utf-8')), time.time())
+        )
+        self.conn.commit()
+        self._evict()
+    
+    @property
+    def total_bytes(self) -> int:
+        """Общий размер закэшированных результатов"""
+        return self.conn.execute("SELECT value FROM stats WHERE name = 'total_bytes'").fetchone()[0]
+    
+    def _evict(self):
+        """LRU-вытеснение: удаляет записи с самым старым доступом, пока кэш больше лимита"""
+        total = self.total_bytes
+        if total <= self.max_bytes:
+            return
+        
+        stale = []
+        for key, size in self.conn.execute('SELECT key, size FROM results ORDER BY last_access'):
+            if total <= self.max_bytes:
+                break
+            stale.append((key,))
+            total -= size
+        
+        self.conn.executemany('DELETE FROM results WHERE key = ?', stale)
+        self.conn.commit()
+    
+    def clear(self):
+        """Удаляет все записи кэша"""
+        self.conn.execute('DELETE FROM results')
+        self.conn.commit()
+    
+    def close(self):
+        self.conn.close()
@@ -0,0 +1,238 @@
+"""
+Долгоживущий asyncio-сервис обработки документов с микробатчингом NER
+"""
+import argparse
+import asyncio
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from pipeline import DocumentPipeline
+from config import (
+    NER_BATCH_SIZE, SERVICE_HOST, SERVICE_PORT, SERVICE_QUEUE_SIZE, SERVICE_MAX_IN_FLIGHT,
+    SERVICE_BATCH_WINDOW_MS, SERVICE_THREADS
+)
+
+
+class DocumentService:
+    """Сервис вокруг DocumentPipeline: модели загружаются один раз на процесс.
+    
+    Чтение документов, чанкинг и этапы после NER выполняются в пуле потоков,
+    а чанки одновременных запросов объединяются в общие батчи NER.
+    """
+    
+    def __init__(self, queue_size: int = SERVICE_QUEUE_SIZE, batch_size: int = NER_BATCH_SIZE,
+                 batch_window_ms: float = SERVICE_BATCH_WINDOW_MS, threads: int = SERVICE_THREADS,
+                 max_in_flight: int = SERVICE_MAX_IN_FLIGHT):
+        self.pipeline = DocumentPipeline(use_cache=False)
+        # Модели NER загружаются лениво: загружаем их сразу, чтобы первый запрос не ждал загрузки
+        # и не задерживал батч NER остальных запросов
+        self.pipeline.ner_extractor.load()
+        self.batch_size = batch_size
+        self.batch_window = batch_window_ms / 1000.0
+        self.queue: Optional[asyncio.Queue] = None
+        self.queue_size = queue_size
+        self.max_in_flight = max_in_flight
+        self.admission: Optional[asyncio.Semaphore] = None
+        self.executor = ThreadPoolExecutor(max_workers=threads)
+        # Модели NER не потокобезопасны: инференс идет в одном выделенном потоке
+        self.ner_executor = ThreadPoolExecutor(max_workers=1)
+        self.stats = {'processed': 0, 'rejected': 0, 'failed': 0, 'ner_batches': 0, 'ner_chunks': 0}
+    
+    async def start(self):
+        """Создает очередь и запускает фоновый микробатчер"""
+        self.queue = asyncio.Queue(maxsize=self.queue_size)
+        self.admission = asyncio.Semaphore(self.max_in_flight)
+        self._batcher = asyncio.create_task(self._batch_loop())
+    
+    def close(self):
+        """Останавливает пулы потоков и сохраняет кэш нормализации сущностей между запусками"""
+        self.executor.shutdown(wait=True)
+        self.ner_executor.shutdown(wait=True)
+        self.pipeline.close()
+    
+    def _prepare(self, name: str, path: Optional[str], text: Optional[str]) -> Tuple[Path, str, List[Tuple[int, int]]]:
+        """Читает документ и разбивает его на чанки (выполняется в пуле потоков)"""
+        if text is None:
+            file_path = Path(path)
+            text = self.pipeline.doc_reader.read_document(file_path)
+        else:
+            file_path = Path(name)
+        
+        chunks = self.pipeline._chunk_spans(text) if text and len(text.strip()) > 0 else []
+        return file_path, text, chunks
+    
+    async def process(self, name: str, path: Optional[str] = None, text: Optional[str] = None) -> Dict:
+        """Обрабатывает документ; бросает asyncio.QueueFull, если очередь NER переполнена"""
+        loop = asyncio.get_running_loop()
+        file_path, text, chunks = await loop.run_in_executor(self.executor, self._prepare, name, path, text)
+        if not chunks:
+            return {
+                'error': 'Документ пуст или не удалось извлечь текст'
+            }
+        
+        future = loop.create_future()
+        self.queue.put_nowait(([text[start:end] for start, end in chunks], future))
+        chunk_entities = await future
+        
+        return await loop.run_in_executor(
+            self.executor, self.pipeline._build_result, file_path, text, chunks, chunk_entities
+        )
+    
+    async def _batch_loop(self):
+        """Собирает чанки запросов в батчи: до batch_size чанков или до истечения окна ожидания"""
+        loop = asyncio.get_running_loop()
+        while True:
+            jobs = [await self.queue.get()]
+            size = len(jobs[0][0])
+            deadline = loop.time() + self.batch_window
+            while size < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    job = await asyncio.wait_for(self.queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                jobs.append(job)
+                size += len(job[0])
+            
+            texts = [chunk for chunks, _ in jobs for chunk in chunks]
+            try:
+                entities = await loop.run_in_executor(
+                    self.ner_executor, self.pipeline.ner_extractor.extract_batch, texts
+                )
+            except Exception as e:
+                for _, future in jobs:
+                    if not future.done():
+                        future.set_exception(e)
+                continue
+            
+            self.stats['ner_batches'] += 1
+            self.stats['ner_chunks'] += len(texts)
+            offset = 0
+            for chunks, future in jobs:
+                if not future.done():
+                    future.set_result(entities[offset:offset + len(chunks)])
+                offset += len(chunks)
+    
+    async def handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Обрабатывает HTTP/1.1 запрос (одно соединение - один запрос)"""
+        try:
+            request_line = await reader.readline()
+            if not request_line:
+                return
+            method, target, _ = request_line.decode('latin-1').split(' ', 2)
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                key, _, value = line.decode('latin-1').partition(':')
+                headers[key.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+            
+            status, payload = await self._route(method, target, body)
+        except Exception as e:
+            status, payload = 400, {'error': f'Некорректный запрос: {str(e)}'}
+        
+        data = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found',
+                  422: 'Unprocessable Entity', 503: 'Service Unavailable'}.get(status, 'OK')
+        extra = 'Retry-After: 1\r\n' if status == 503 else ''
+        writer.write(
+            f'HTTP/1.1 {status} {reason}\r\n'
+            f'Content-Type: application/json; charset=utf-8\r\n'
+            f'Content-Length: {len(data)}\r\n{extra}'
+            f'Connection: close\r\n\r\n'.encode('latin-1') + data
+        )
+        try:
+            await writer.drain()
+        finally:
+            writer.close()
+    
+    async def _route(self, method: str, target: str, body: bytes) -> Tuple[int, Dict]:
+        """Маршрутизация: POST /process - обработка документа, GET /health - состояние сервиса"""
+        if method == 'GET' and target == '/health':
+            return 200, {'status': 'ok', 'queue': self.queue.qsize(), **self.stats}
+        if method != 'POST' or target != '/process':
+            return 404, {'error': f'Неизвестный адрес: {method} {target}'}
+        
+        # Тело: {"path": "/путь/к/файлу"} или {"text": "...", "name": "документ.txt"}
+        request = json.loads(body.decode('utf-8'))
+        if 'path' not in request and 'text' not in request:
+            return 400, {'error': 'Нужно передать path или text'}
+        
+        # Обратное давление до чтения документа: не принимаем новые документы, пока заняты
+        # все места в обработке или заполнена очередь NER (иначе задачи копятся в пуле потоков)
+        if self.admission.locked() or self.queue.full():
+            self.stats['rejected'] += 1
+            return 503, {'error': 'Очередь переполнена, повторите запрос позже'}
+        
+        try:
+            async with self.admission:
+                result = await self.process(
+                    request.get('name') or Path(request.get('path', 'document.txt')).name,
+                    path=request.get('path'),
+                    text=request.get('text')
+                )
+        except asyncio.QueueFull:
+            self.stats['rejected'] += 1
+            return 503, {'error': 'Очередь переполнена, повторите запрос позже'}
+        except Exception as e:
+            self.stats['failed'] += 1
+            return 422, {'error': str(e)}
+        
+        if 'error' in result:
+            self.stats['failed'] += 1
+            return 422, result
+        self.stats['processed'] += 1
+        return 200, result
+
+
+async def serve(host: str, port: int, unix_socket: Optional[str], **kwargs):
+    """Запускает сервис на TCP-порту или Unix-сокете"""
+    print("Инициализация пайплайна...")
+    started = time.perf_counter()
+    service = DocumentService(**kwargs)
+    await service.start()
+    print(f"Модели загружены за {time.perf_counter() - started:.1f} с")
+    
+    if unix_socket:
+        server = await asyncio.start_unix_server(service.handle_connection, path=unix_socket)
+        print(f"Сервис слушает Unix-сокет: {unix_socket}")
+    else:
+        server = await asyncio.start_server(service.handle_connection, host, port)
+        print(f"Сервис слушает: http://{host}:{port}")
+    
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Сервис обработки документов с микробатчингом NER')
+    parser.add_argument('--host', type=str, default=SERVICE_HOST, help='Адрес для прослушивания')
+    parser.add_argument('--port', type=int, default=SERVICE_PORT, help='Порт для прослушивания')
+    parser.add_argument('--unix', type=str, help='Путь к Unix-сокету (вместо TCP)')
+    parser.add_argument('--queue-size', type=int, default=SERVICE_QUEUE_SIZE,
+                        help='Максимум документов в очереди NER, сверх него - ответ 503')
+    parser.add_argument('--max-in-flight', type=int, default=SERVICE_MAX_IN_FLIGHT,
+                        help='Максимум документов в обработке, сверх него - ответ 503')
+    parser.add_argument('--batch-window-ms', type=float, default=SERVICE_BATCH_WINDOW_MS,
+                        help='Максимальное ожидание для набора батча NER, мс')
+    args = parser.parse_args()
+    
+    try:
+        asyncio.run(serve(args.host, args.port, args.unix,
+                          queue_size=args.queue_size, batch_window_ms=args.batch_window_ms,
+                          max_in_flight=args.max_in_flight))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -80,12 +80,889 @@ def test_text_extraction():
             print(f"  ОШИБКА: {str(e)}")
 
 
+def test_ner_batch():
+    """Тестирует батчевый NER: пустые тексты и совпадение с извлечением по одному тексту"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ: Батчевый NER")
+    print("=" * 60)
+    
+    from ner_extractor import NERExtractor
+    
+    ner = NERExtractor()
+    texts = ["   ", "ООО «Ромашка» заключило договор с Ивановым Петром Сергеевичем в Москве.", "",
+             "Поставщик АО «Вектор» находится в Казани."]
+    batch = ner.extract_batch(texts)
+    print(f"  Сущностей по текстам: {[len(entities) for entities in batch]}")
+    
+    assert ner.extract_batch(["   "]) == [[]] and ner.extract("   ") == []
+    assert len(batch) == len(texts) and batch[0] == [] and batch[2] == []
+    for text, entities in zip(texts, batch):
+        single = ner.extract(text)
+        assert [(e.text, e.type, e.start, e.end) for e in entities] == [(e.text, e.type, e.start, e.end) for e in single]
+    assert {e.type for e in batch[1]} == {'ORG', 'PER', 'LOC'}
+    
+    # Разметка добавляется для каждого текста, в том числе пустого
+    annotations = []
+    ner.extract_batch(texts, annotations)
+    assert len(annotations) == len(texts)
+
+
+def test_keyword_matcher():
+    """Тестирует поиск ключевых слов автоматом Ахо–Корасик"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ: Поиск ключевых слов за один проход")
+    print("=" * 60)
+    
+    from keyword_matcher import KeywordMatcher
+    
+    matcher = KeywordMatcher(['закупк', 'купк', 'договор', 'договоров', 'склад'])
+    text = 'закупка по договору; закупки и реестр договоров'
+    counts = matcher.count(text)
+    print(f"  Найдено: {counts}")
+    
+    assert counts == {'закупк': 2, 'купк': 2, 'договор': 2, 'договоров': 1}
+    
+    # Все вхождения с позициями, включая перекрывающиеся и вложенные с общим началом
+    found = [(start, matcher.keywords[index]) for start, index in matcher.finditer(text)]
+    expected = sorted(
+        ((start, word) for word in matcher.keywords for start in range(len(text)) if text.startswith(word, start)),
+        key=lambda item: (item[0], len(item[1]))
+    )
+    assert found == expected
+
+
+def test_stage_metrics():
+    """Тестирует замер этапов и выгрузку метрик"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ: Метрики этапов обработки")
+    print("=" * 60)
+    
+    from metrics import DocumentMetrics, MetricsAggregator, NULL_METRICS
+    
+    metrics = DocumentMetrics()
+    with metrics.stage('read', 100) as stage:
+        stage.items = 80
+    laps = metrics.laps()
+    laps.lap('dedup', 10, 4)
+    laps.lap('chains', 4, 2)
+    for _ in metrics.iterate('chunk', ['абв', 'где']):
+        pass
+    stages = metrics.to_dict()
+    print(f"  Этапы: {stages}")
+    
+    assert stages['read']['size'] == 100 and stages['read']['items'] == 80
+    assert stages['dedup']['items'] == 4 and stages['chains']['items'] == 2
+    assert stages['chunk']['items'] == 6
+    
+    # Выключенный замер ничего не записывает
+    with NULL_METRICS.stage('read', 100) as stage:
+        stage.items = 80
+    assert not NULL_METRICS.enabled
+    
+    aggregator = MetricsAggregator()
+    aggregator.add_result({'document': 'a.txt', 'statistics': {'stages': stages}})
+    aggregator.add_result({'document': 'b.txt', 'statistics': {'stages': stages}})
+    aggregator.add_result({'document': 'c.txt', 'statistics': {}})
+    prometheus = aggregator.to_prometheus()
+    
+    assert 'pipeline_documents_total 2' in prometheus
+    assert 'pipeline_stage_input_size_total{stage="read"} 200' in prometheus
+    assert len(aggregator.to_json_lines().splitlines()) == 3
+
+
+def test_lazy_ner_load():
+    """Тестирует ленивую загрузку: пайплайн создается без импорта NER, модели грузятся при первом извлечении"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ: Ленивая загрузка моделей")
+    print("=" * 60)
+    
+    import subprocess
+    import sys
+    
+    # Отдельный процесс: в процессе тестов natasha уже импортирована другими тестами
+    code = (
+        "import sys\n"
+        "from pipeline import DocumentPipeline\n"
+        "pipeline = DocumentPipeline(use_cache=False)\n"
+        "print(sorted(name for name in ('natasha', 'spacy', 'docx', 'pdfplumber') if name in sys.modules))\n"
+        "pipeline.ner_extractor.extract_batch(['ООО «Ромашка» заключило договор в Москве.'])\n"
+        "print('natasha' in sys.modules, sorted(pipeline.ner_extractor.load_timings))\n"
+    )
+    output = subprocess.run([sys.executable, '-c', code], cwd=Path(__file__).parent,
+                            capture_output=True, text=True, check=True).stdout.splitlines()
+    print(f"  {output}")
+    assert output[0] == '[]'
+    assert output[1] == "True ['NewsEmbedding', 'NewsMorphTagger', 'NewsNERTagger', 'import natasha']"
+
+
+def test_sentence_chunks(monkeypatch):
+    """Тестирует чанкинг по границам предложений: перекрытие, длинные предложения, покрытие текста"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ: Чанкинг по предложениям")
+    print("=" * 60)
+    
+    import random
+    import pipeline as pipeline_module
+    
+    monkeypatch.setattr(pipeline_module, 'CHUNK_SIZE', 120)
+    monkeypatch.setattr(pipeline_module, 'CHUNK_OVERLAP', 40)
+    monkeypatch.setattr(pipeline_module, 'MAX_TEXT_LENGTH', 200)
+    monkeypatch.setattr(pipeline_module, 'STREAM_WINDOW_CHUNKS', 3)
+    
+    rng = random.Random(7)
+    words = ['договор', 'поставка', 'ООО', '«Ромашка»', 'оплата', 'срок', 'Москва', 'товар']
+    sentences = [' '.join(rng.choices(words, k=rng.randint(2, 8))) + rng.choice(['. ', '! ', '.\n'])
+                 for _ in range(60)]
+    # Предложение длиннее чанка режется по пробелам
+    sentences.insert(20, ' '.join(rng.choices(words, k=60)) + '. ')
+    text = ''.join(sentences)
+    
+    pipeline = DocumentPipeline(use_cache=False)
+    assert pipeline._chunk_spans(text[:150]) == [(0, 150)]
+    chunks = pipeline._chunk_spans(text)
+    print(f"  Символов: {len(text)}, чанков: {len(chunks)}")
+    
+    assert chunks[0][0] == 0 and chunks[-1][1] == len(text)
+    sentence_starts = {0} | {match.end() for match in pipeline_module.SENTENCE_END_RE.finditer(text)}
+    overlaps = []
+    for (start, end), (next_start, next_end) in zip(chunks, chunks[1:]):
+        assert end - start <= 120 and start < next_start <= end < next_end
+        overlaps.append(end - next_start)
+        assert end - next_start <= 40
+        # Перекрытие состоит из целых предложений; без перекрытия чанк может начинаться с разреза по пробелу
+        assert next_start in sentence_starts or (next_start == end and text[next_start - 1] == ' ')
+    assert max(overlaps) > 0
+    assert any(text[start - 1] == ' ' and start not in sentence_starts for start, _ in chunks[1:])
+    
+    # Потоковый чанкинг дает те же границы
+    segments = [text[i:i + 37] for i in range(0, len(text), 37)]
+    streamed = [(start, end) for start, end, _ in pipeline._iter_chunk_spans(segments, [])]
+    assert streamed == chunks
+
+
+def test_result_cache(tmp_path, monkeypatch):
+    """Тестирует ключ кэша результатов (содержимое, настройки, версии компонентов) и LRU-вытеснение"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ: Кэш результатов")
+    print("=" * 60)
+    
+    import config
+    from result_cache import NON_RESULT_SETTINGS, ResultCache, config_fingerprint
+    
+    class Component:
+        VERSION = "1.0"
+    
+    # Исключения из отпечатка - существующие настройки (опечатка молча включила бы настройку в ключ)
+    assert NON_RESULT_SETTINGS <= {name for name in dir(config) if name.isupper()}
+    
+    fingerprint = config_fingerprint([Component()])
+    monkeypatch.setattr(config, 'NER_BATCH_SIZE', config.NER_BATCH_SIZE + 1)
+    assert config_fingerprint([Component()]) == fingerprint
+    monkeypatch.setattr(config, 'CHUNK_SIZE', config.CHUNK_SIZE + 1)
+    changed_setting = config_fingerprint([Component()])
+    monkeypatch.undo()
+    monkeypatch.setattr(Component, 'VERSION', "1.1")
+    changed_version = config_fingerprint([Component()])
+    monkeypatch.undo()
+    assert len({fingerprint, changed_setting, changed_version}) == 3
+    
+    # Ключ зависит от содержимого файла, а не от его пути
+    first, copy, other = tmp_path / "a.txt", tmp_path / "b.txt", tmp_path / "c.txt"
+    first.write_text("Договор поставки", encoding='utf-8')
+    copy.write_text("Договор поставки", encoding='utf-8')
+    other.write_text("Договор аренды", encoding='utf-8')
+    cache = ResultCache(tmp_path / "cache.sqlite", fingerprint, max_bytes=100)
+    cache.put(cache.make_key(first), {'document': 'a.txt'})
+    assert cache.get(cache.make_key(copy)) == {'document': 'a.txt'}
+    assert cache.get(cache.make_key(other)) is None
+    reconfigured = ResultCache(tmp_path / "cache.sqlite", changed_setting)
+    assert reconfigured.get(reconfigured.make_key(first)) is None
+    reconfigured.close()
+    
+    # Общий размер ведется без пересчета таблицы; при превышении лимита уходят давно не читанные записи
+    cache.put('b', {'text': 'x' * 30})
+    cache.put('b', {'text': 'x' * 40})
+    cache.get(cache.make_key(first))
+    cache.put('c', {'text': 'y' * 40})
+    assert cache.get('b') is None and cache.get(cache.make_key(first)) is not None
+    assert cache.total_bytes == cache.conn.execute('SELECT SUM(size) FROM results').fetchone()[0] <= 100
+    cache.close()
+
+
+def test_tfidf_classifier(tmp_path):
+    """Тестирует классификацию по матрице TF-IDF и ее перестроение при смене файла процессов"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ: Классификация TF-IDF")
+    print("=" * 60)
+    
+    from business_process_loader import BusinessProcessLoader
+    from process_classifier import ProcessClassifier
+    
+    processes_file = tmp_path / "processes.txt"
+    processes_file.write_text("Закупки\n1. Проведение тендеров\n2. Контракты с поставщиками\n"
+                              "Персонал\n3. Подбор персонала\n", encoding='utf-8')
+    loader = BusinessProcessLoader(processes_file)
+    matrix_path = tmp_path / "matrix.npz"
+    classifier = ProcessClassifier(loader, mode="tfidf", top_k=2, matrix_path=matrix_path)
+    
+    texts = ["Подбор персонала в отдел продаж", "Тендер на поставку", "Текст"]
+    results = classifier.classify_batch(texts)
+    print(f"  Процессы: {[r['number'] for r in results]}")
+    assert [r['number'] for r in results] == [3, 1, None]
+    # Результат документа не зависит от того, с какими документами он попал в батч
+    assert results == [classifier.classify(text) for text in texts]
+    assert len(results[1]['alternatives']) <= 1
+    assert matrix_path.exists()
+    
+    # Матрица из кэша дает те же оценки
+    cached = ProcessClassifier(loader, mode="tfidf", top_k=2, matrix_path=matrix_path)
+    assert cached.classify("Подбор персонала")['confidence'] == classifier.classify("Подбор персонала")['confidence']
+    
+    processes_file.write_text("Персонал\n7. Обучение персонала\n", encoding='utf-8')
+    loader.reload()
+    assert classifier.classify("Обучение персонала")['number'] == 7
+
+
+def test_shared_annotation():
+    """Тестирует поиск связей и классификацию по общей разметке с леммами"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ: Связи и классификация по леммам")
+    print("=" * 60)
+    
+    import re
+    from text_annotation import TextAnnotation
+    from relation_extractor import RelationExtractor
+    
+    text = "Ромашка заключили договор с Вектор. Закупками руководит отдел."
+    lemmas = {'заключили': 'заключить', 'закупками': 'закупка'}
+    annotation = TextAnnotation.from_tokens(
+        (m.start(), m.end(), m.group(), lemmas.get(m.group().lower(), m.group()))
+        for m in re.finditer(r'\w+|[^\w\s]', text)
+    )
+    
+    extractor = RelationExtractor()
+    plain = extractor._match_patterns(text)
+    annotated = extractor._match_patterns(text, annotation)
+    print(f"  Без разметки: {sum(plain, [])}, с разметкой: {sum(annotated, [])}")
+    assert not any(plain)
+    assert annotated[0] == [('Ромашка', 'Вектор', 0, len('Ромашка заключили договор с Вектор'))]
+    
+    # Разметка чанков склеивается без повторов слов из перекрытия
+    first = TextAnnotation.from_tokens([(0, 7, 'Ромашка', None), (28, 34, 'Вектор', None)])
+    second = TextAnnotation.from_tokens([(0, 6, 'Вектор', None), (8, 17, 'Закупками', 'закупка')])
+    merged = TextAnnotation.merge([(0, 35), (28, len(text))], [first, second])
+    assert merged.words == ['ромашка', 'вектор', 'закупками']
+    assert merged.spans[-1] == (36, 45) and merged.lemmas[-1] == 'закупка'
+
+
+def test_register_pattern():
+    """Тестирует регистрацию паттерна связи: он находится тем же проходом, что и встроенные"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ: Регистрация паттерна связи")
+    print("=" * 60)
+    
+    from relation_extractor import RelationExtractor
+    
+    extractor = RelationExtractor()
+    supply = next(i for i, (relation, _, _) in enumerate(extractor.relation_patterns) if relation == 'поставить')
+    extractor.register_pattern('арендовать', ['Арендует'], [['у']])
+    # Триггер, общий со встроенным паттерном, не мешает ему
+    extractor.register_pattern('поставить_в', ['поставляет'], [['в']])
+    
+    text = "Ромашка арендует у Вектор склад. Вектор арендует Ромашка. Вектор поставляет в Ромашка трубы."
+    matches = extractor._match_patterns(text)
+    print(f"  Совпадения: {matches[-2:]}")
+    assert matches[-2] == [('Ромашка', 'Вектор', 0, len('Ромашка арендует у Вектор'))]
+    start = text.index('Вектор поставляет')
+    assert matches[-1] == [('Вектор', 'Ромашка', start, start + len('Вектор поставляет в Ромашка'))]
+    assert matches[supply] == [('Вектор', 'в', start, start + len('Вектор поставляет в'))]
+    
+    try:
+        extractor.register_pattern('пустой', [])
+        assert False, "ожидалась ошибка для паттерна без триггеров"
+    except ValueError:
+        pass
+
+
+def test_entity_index():
+    """Тестирует EntityIndex против линейного поиска _find_entity: та же сущность для любого запроса"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ: Индекс сущностей")
+    print("=" * 60)
+    
+    import random
+    from entity_index import EntityIndex
+    from entity_records import Entity
+    from relation_extractor import RelationExtractor
+    
+    rng = random.Random(11)
+    extractor = RelationExtractor()
+    for _ in range(50):
+        # Маленький алфавит: много вложенных и пересекающихся текстов, повторы с разным регистром
+        texts = [''.join(rng.choices('абвАБ «»', k=rng.randint(1, 6))) for _ in range(rng.randint(1, 12))]
+        entities = [Entity(text, 'ORG', i, i + len(text)) for i, text in enumerate(texts)]
+        entity_dict = {e.text: e for e in entities}
+        index = EntityIndex(entities)
+        queries = [''] + [''.join(rng.choices('абвгАБ «»', k=rng.randint(1, 8))) for _ in range(40)]
+        queries += [text[1:] for text in texts] + [f"ООО {text}" for text in texts]
+        for query in queries:
+            assert index.find(query) is extractor._find_entity(query, entity_dict), (texts, query)
+    print("  Результаты совпадают с линейным поиском")
+
+
+def test_watch_manifest(tmp_path):
+    """Тестирует манифест режима наблюдения: обрабатываются только новые и измененные файлы"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ: Манифест режима наблюдения")
+    print("=" * 60)
+    
+    import os
+    from watcher import Manifest
+    
+    document = tmp_path / "contract.txt"
+    document.write_text("Договор поставки", encoding='utf-8')
+    manifest = Manifest(tmp_path / "manifest.json")
+    
+    digest = manifest.changed_hash(document)
+    assert digest is not None
+    manifest.record(document, digest)
+    manifest.save()
+    
+    # Новый mtime при прежнем содержимом не считается изменением
+    reloaded = Manifest(tmp_path / "manifest.json")
+    os.utime(document, ns=(0, 10 ** 9))
+    assert reloaded.changed_hash(document) is None
+    
+    document.write_text("Договор поставки № 2", encoding='utf-8')
+    assert reloaded.changed_hash(document) is not None
+
+
+def test_relation_chains(monkeypatch):
+    """Тестирует многошаговые цепочки связей с обнаружением циклов и ограничение их числа"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ: Цепочки связей")
+    print("=" * 60)
+    
+    from itertools import islice
+    from entity_records import Relation
+    from relation_graph import RelationGraph
+    
+    graph = RelationGraph([
+        Relation(source, target, relation, 'ORG', 'ORG', 0, 0)
+        for source, relation, target in [('A', 'поставляет', 'B'), ('B', 'оплачивает', 'C'), ('C', 'владеет', 'A')]
+    ])
+    assert list(graph.iter_chains(['A'], max_depth=1)) == [['A', 'поставляет', 'B']]
+    assert list(graph.iter_chains(['A'], max_depth=2)) == [['A', 'поставляет', 'B', 'оплачивает', 'C']]
+    # Цикл обрывается на повторной сущности
+    assert list(graph.iter_chains(['A'], max_depth=5)) == [
+        ['A', 'поставляет', 'B', 'оплачивает', 'C', 'владеет', 'A']
+    ]
+    assert len(list(islice(graph.iter_chains(['A', 'B', 'C'], max_depth=1), 2))) == 2
+    
+    # Полный граф из 12 сущностей: при глубине 6 путей из одной сущности 11*10*9*8*7*6 = 332640,
+    # с ограничением строятся только первые
+    names = [f"E{i}" for i in range(12)]
+    dense = RelationGraph([Relation(a, b, 'связан', 'ORG', 'ORG', 0, 0) for a in names for b in names if a != b])
+    assert len(list(islice(dense.iter_chains(names, max_depth=6), 1000))) == 1000
+    
+    import pipeline as pipeline_module
+    monkeypatch.setattr(pipeline_module, 'CHAIN_MAX_DEPTH', 3)
+    monkeypatch.setattr(pipeline_module, 'CHAIN_MAX_PER_DOCUMENT', None)
+    try:
+        DocumentPipeline(use_cache=False)
+        assert False, "ожидалась ошибка: глубина цепочек больше 1 без ограничения их числа"
+    except ValueError:
+        pass
+
+
+def test_entity_store(tmp_path):
+    """Тестирует поиск по хранилищу сущностей и замену записей при повторной обработке"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ: Хранилище сущностей")
+    print("=" * 60)
+    
+    from entity_store import EntityStore
+    
+    store = EntityStore(tmp_path / "entities.sqlite")
+    result = {
+        'document': 'contract.txt',
+        'entities': [{'id': 0, 'text': 'ООО «Ромашка»', 'type': 'ORG'}, {'id': 1, 'text': 'Москва', 'type': 'LOC'}],
+        'relations': [{'source': 'ООО «Ромашка»', 'target': 'Москва', 'relation': 'находиться', 'context': ''}],
+        'business_process': {'category': 'Закупки', 'subprocess': 'Договоры', 'number': 7, 'confidence': 0.8},
+    }
+    store.add_results([tmp_path / "contract.txt"] * 2, [result, result])
+    
+    assert len(store.documents_with_entity('ооо  «ромашка»', 'ORG')) == 1
+    assert len(store.relations_with_entity('Москва', 'находиться')) == 1
+    assert len(store.documents_in_process(7)) == 1
+    assert store.search_entities('ромаш')[0][0] == 'ооо «ромашка»'
+    assert store.stats() == {'documents': 1, 'entities': 2, 'relations': 1}
+    store.close()
+    
+    # С нормализацией по леммам хранилище индексирует ключи дедупликации и так же приводит запрос
+    from natasha import MorphVocab
+    from entity_normalizer import EntityNormalizer
+    
+    morph_vocab = MorphVocab()
+    store = EntityStore(tmp_path / "lemmas.sqlite", EntityNormalizer(lambda: morph_vocab, 100))
+    assert store.key('ООО «Ромашки»', 'ORG') == store.key('ООО  «Ромашка»', 'ORG') == 'ооо ромашка'
+    store.add_results([tmp_path / "contract.txt"], [result])
+    assert len(store.documents_with_entity('ООО «Ромашки»', 'ORG')) == 1
+    assert len(store.documents_with_entity('ООО «Ромашки»')) == 1
+    assert len(store.relations_with_entity('Москве')) == 1
+    store.close()
+    
+    # Хранилище с ключами по другому правилу не открывается
+    try:
+        EntityStore(tmp_path / "lemmas.sqlite")
+        assert False, "ожидалась ошибка правила ключей"
+    except ValueError:
+        pass
+
+
+def test_near_duplicates(tmp_path):
+    """Тестирует поиск почти-дубликатов по MinHash-сигнатурам в постоянном индексе"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ: Почти-дубликаты")
+    print("=" * 60)
+    
+    from near_duplicates import NearDuplicateIndex
+    
+    words = [f"слово{i}" for i in range(400)]
+    original = ' '.join(words)
+    edited = ' '.join(words[:-2] + ['правка', 'договора'])
+    other = ' '.join(reversed(words))
+    
+    index = NearDuplicateIndex(tmp_path / "index.sqlite", "fingerprint", threshold=0.9)
+    index.add("original.txt", index.signature(original), {'document': 'original.txt'})
+    index.close()
+    
+    index = NearDuplicateIndex(tmp_path / "index.sqlite", "fingerprint", threshold=0.9)
+    document, score, result = index.find(index.signature(edited))
+    print(f"  Похожесть правки: {score:.3f}")
+    assert document == "original.txt" and score >= 0.9 and result == {'document': 'original.txt'}
+    assert index.find(index.signature(other)) is None
+    assert index.find(index.signature(original), exclude="original.txt") is None
+    # Результаты, полученные с другой конфигурацией, не переиспользуются
+    assert NearDuplicateIndex(tmp_path / "index.sqlite", "other").find(index.signature(original)) is None
+
+
+def test_ner_prefilter():
+    """Тестирует отбор предложений-кандидатов и перевод позиций в исходный текст"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ: Отбор предложений перед NER")
+    print("=" * 60)
+    
+    from ner_prefilter import SentencePrefilter
+    
+    text = ("Оплата производится в течение 10 дней. Товар передается по акту. "
+            "Поставка выполняется силами ООО «Ромашка». Все претензии рассматриваются в срок. "
+            "Цена включает доставку.")
+    reduced, offsets = SentencePrefilter(context=0).reduce(text)
+    print(f"  Сокращенный текст: {reduced!r}")
+    assert reduced == "Поставка выполняется силами ООО «Ромашка». "
+    
+    start = reduced.index("ООО «Ромашка»")
+    original = offsets.span(start, start + len("ООО «Ромашка»"))
+    assert text[original[0]:original[1]] == "ООО «Ромашка»"
+    
+    # С контекстом берутся соседние предложения; спан через границу фрагментов отбрасывается
+    prefilter = SentencePrefilter(context=1)
+    assert len(prefilter.select(text)) == 1
+    reduced, offsets = SentencePrefilter(context=0).reduce(text + " Подписано АО «Вектор».")
+    assert offsets.span(0, len(reduced)) is None
+    
+    # NER с отбором: чанк без кандидатов не идет в теггер, позиции остальных - в координатах чанка
+    from ner_extractor import NERExtractor
+    
+    ner = NERExtractor(prefilter=True, prefilter_context=0)
+    chunks = ["1234 5678 9012.", text, "   "]
+    assert SentencePrefilter(context=0).reduce(chunks[0])[0] == ''
+    found = ner.extract_batch(chunks)
+    assert found[0] == [] and found[2] == []
+    assert [(text[e.start:e.end], e.type) for e in found[1]] == [("ООО «Ромашка»", 'ORG')]
+
+
+def test_entity_normalizer(tmp_path):
+    """Тестирует нормализацию словоформ сущностей и сохранение LRU-кэша между запусками"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ: Нормализация сущностей")
+    print("=" * 60)
+    
+    from natasha import MorphVocab
+    from entity_normalizer import EntityNormalizer, LRUCache
+    
+    morph_vocab = MorphVocab()
+    normalizer = EntityNormalizer(lambda: morph_vocab, cache_path=tmp_path / "norm.pkl")
+    key = normalizer.normalize("ООО «Ромашка»", "ORG")
+    print(f"  Ключ: {key!r}")
+    assert normalizer.normalize("ООО «Ромашки»", "ORG") == key == "ооо ромашка"
+    assert normalizer.normalize("Москве", "LOC") == normalizer.normalize("Москва", "LOC")
+    normalizer.normalize("ООО «Ромашка»", "ORG")
+    assert (normalizer.cache.hits, normalizer.cache.misses) == (1, 4)
+    normalizer.save()
+    
+    # Сохраненные ключи доступны без словаря
+    restored = EntityNormalizer(lambda: None, cache_path=tmp_path / "norm.pkl")
+    assert restored.normalize("ООО «Ромашки»", "ORG") == key and restored.cache.hit_rate == 1.0
+    
+    # Два воркера с общим файлом: второй объединяет свои ключи с ключами первого
+    first = EntityNormalizer(lambda: morph_vocab, cache_path=tmp_path / "shared.pkl")
+    second = EntityNormalizer(lambda: morph_vocab, cache_path=tmp_path / "shared.pkl")
+    first.normalize("Москве", "LOC")
+    second.normalize("Ивановым", "PER")
+    first.save()
+    second.save()
+    merged = EntityNormalizer(lambda: None, cache_path=tmp_path / "shared.pkl")
+    assert merged.normalize("Москве", "LOC") == "москва" and merged.normalize("Ивановым", "PER") == "иванов"
+    
+    cache = LRUCache(2)
+    cache.put('a', 1)
+    cache.put('b', 2)
+    cache.get('a')
+    cache.put('c', 3)
+    assert cache.get('b') is None and cache.get('a') == 1 and len(cache) == 2
+    
+    # Общий кэш из нескольких потоков: вытеснение ключа не ломает get в соседнем потоке
+    from concurrent.futures import ThreadPoolExecutor
+    
+    shared = LRUCache(8)
+    
+    def hammer(seed: int):
+        for i in range(20000):
+            key = (seed * 7 + i) % 16
+            if shared.get(key) is None:
+                shared.put(key, i + 1)
+        return len(shared.items())
+    
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        assert all(size <= 8 for size in executor.map(hammer, range(4)))
+
+
+def test_keyword_index():
+    """Тестирует поиск ключевых слов в окнах по индексу позиций против поиска подстроки"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ: Индекс позиций ключевых слов")
+    print("=" * 60)
+    
+    from keyword_index import KeywordIndex
+    
+    text = "Поставщик подписал Договор на поставку, а Заказчик предоставит отчет по работам."
+    groups = {'связка': ['с', 'на', 'по'], 'тип': ['договор', 'отчет', 'предоставить отчет', 'поставка']}
+    index = KeywordIndex(text, groups, offset=100)
+    for start in range(0, len(text), 3):
+        for end in range(start, len(text) + 1, 5):
+            window = text[start:end].lower()
+            for name, words in groups.items():
+                expected = any(word in window for word in words)
+                assert index.contains(name, 100 + start, 100 + end) == expected, (name, window)
+    assert sorted(index.found('тип', 100, 100 + len(text))) == ['договор', 'отчет']
+    print("  Результаты совпадают с поиском подстроки")
+
+
+def _build_pdf(pages) -> bytes:
+    """Минимальный PDF: на каждой странице одна строка текста шрифтом Helvetica"""
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>", None, b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"]
+    kids = []
+    for text in pages:
+        stream = f"BT /F1 12 Tf 72 720 Td ({text}) Tj ET".encode('latin-1')
+        objects.append(b"<< /Length %d >>\nstream\n%s\nendstream" % (len(stream), stream))
+        objects.append(b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+                       b"/Resources << /Font << /F1 3 0 R >> >> >>" % len(objects))
+        kids.append(len(objects))
+    objects[1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (b" ".join(b"%d 0 R" % k for k in kids), len(kids))
+    data = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(data))
+        data += b"%d 0 obj\n%s\nendobj\n" % (number, body)
+    xref = len(data)
+    data += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    data += b"".join(b"%010d 00000 n \n" % offset for offset in offsets)
+    data += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(data)
+
+
+def test_pdf_pages(tmp_path):
+    """Тестирует диапазон страниц, параллельное извлечение и быстрый путь PyPDF2 с откатом на pdfplumber"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ: Чтение страниц PDF")
+    print("=" * 60)
+    
+    from document_reader import DocumentReader, _plain_text_ok
+    
+    # Пустая страница и страница со «склеенными» словами не проходят проверку текстового слоя PyPDF2
+    pages = [f"Contract page {number} supplier Romashka" for number in range(1, 13)]
+    pages[4] = ""
+    pages[7] = "Contractpage8supplierRomashkaDeliveryTerms"
+    assert not _plain_text_ok(pages[4]) and not _plain_text_ok(pages[7]) and _plain_text_ok(pages[0])
+    path = tmp_path / "contract.pdf"
+    path.write_bytes(_build_pdf(pages))
+    
+    sequential = DocumentReader().read_pdf(path)
+    print(f"  Строк текста: {len(sequential.splitlines())}")
+    assert sequential.splitlines() == [page for page in pages if page]
+    assert DocumentReader(pdf_engine='pypdf').read_pdf(path) == sequential
+    
+    # Параллельное извлечение (12 страниц >= PDF_PARALLEL_MIN_PAGES) сохраняет порядок страниц
+    for engine in ('pdfplumber', 'pypdf'):
+        with DocumentReader(pdf_engine=engine) as reader:
+            reader.pdf_workers = 2  # Без ограничения числом ядер машины, на которой идет тест
+            assert reader.read_pdf(path) == sequential
+            executor = reader._pdf_executor
+        assert reader._pdf_executor is None and executor._shutdown_thread
+    
+    trimmed = DocumentReader(pdf_page_range=(2, 3)).read_pdf(path)
+    assert trimmed.splitlines() == pages[1:3]
+    assert DocumentReader(pdf_page_range=(11, 100)).read_pdf(path).splitlines() == pages[10:]
+    for page_range in ((0, 3), (3, 2)):
+        try:
+            DocumentReader(pdf_page_range=page_range)
+            assert False, f"ожидалась ошибка диапазона {page_range}"
+        except ValueError:
+            pass
+
+
+def test_docx_stream():
+    """Тестирует потоковое чтение XML DOCX: абзацы, таблицы, надписи и разрывы"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ: Потоковое чтение DOCX")
+    print("=" * 60)
+    
+    import io
+    from document_reader import iter_docx_part
+    
+    xml = (
+        '<w:document xmlns:w="http://schemas.openxmlformats.org/wordprocessingml/2006/main" '
+        'xmlns:mc="http://schemas.openxmlformats.org/markup-compatibility/2006"><w:body>'
+        '<w:p><w:pPr><w:tabs><w:tab w:val="left" w:pos="720"/></w:tabs></w:pPr>'
+        '<w:r><w:t>Договор</w:t><w:tab/><w:t>№ 1</w:t></w:r>'
+        '<w:hyperlink><w:r><w:t xml:space="preserve"> с ООО «Ромашка»</w:t></w:r></w:hyperlink>'
+        '<w:r><w:br w:type="page"/><w:t>.</w:t><w:br/><w:delText>удалено</w:delText></w:r></w:p>'
+        '<w:tbl><w:tr><w:tc><w:p><w:r><w:t>Поставщик</w:t></w:r></w:p></w:tc>'
+        '<w:tc><w:p><w:r><w:t>АО «Вектор»</w:t></w:r></w:p><w:p><w:r><w:t>г. Казань</w:t></w:r></w:p></w:tc>'
+        '</w:tr></w:tbl>'
+        '<w:p><w:r><mc:AlternateContent><mc:Choice><w:txbxContent><w:p><w:r><w:t>Надпись</w:t></w:r></w:p>'
+        '</w:txbxContent></mc:Choice><mc:Fallback><w:p><w:r><w:t>Надпись</w:t></w:r></w:p></mc:Fallback>'
+        '</mc:AlternateContent></w:r><w:r><w:t>Подписи сторон</w:t></w:r></w:p>'
+        '</w:body></w:document>'
+    )
+    lines = list(iter_docx_part(io.BytesIO(xml.encode('utf-8'))))
+    print(f"  Строки: {lines}")
+    assert lines == [
+        'Договор\t№ 1 с ООО «Ромашка».\n',
+        'Поставщик\tАО «Вектор» г. Казань',
+        'Надпись',
+        'Подписи сторон',
+    ]
+
+
+def test_stream_document(tmp_path, monkeypatch):
+    """Тестирует потоковую обработку больших файлов: тот же результат, что и у пакетной; DOCX - потоковым чтением"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ: Потоковая обработка документа")
+    print("=" * 60)
+    
+    import docx
+    import pipeline as pipeline_module
+    
+    text = ''.join(
+        f"Договор поставки № {i} заключен между ООО «Ромашка» и АО «Вектор» в городе Москва. "
+        f"Директор Иванов Петр Сергеевич подписал акт приемки товара. "
+        for i in range(150)
+    )
+    txt_path = tmp_path / "big.txt"
+    txt_path.write_text(text, encoding='utf-8')
+    
+    pipeline = DocumentPipeline(use_cache=False)
+    expected = pipeline._process_batch([txt_path])[0]
+    monkeypatch.setattr(pipeline_module, 'STREAM_MIN_FILE_SIZE', 0)
+    monkeypatch.setattr(pipeline_module, 'STREAM_WINDOW_CHUNKS', 2)
+    streamed = pipeline.process_document(txt_path)
+    print(f"  Символов: {len(text)}, сущностей: {streamed['statistics']['total_entities']}")
+    for key in ('entities', 'relations', 'relation_chains', 'business_process', 'statistics'):
+        assert streamed[key] == expected[key], key
+    
+    # Большой DOCX читается потоковым разбором: контрагент из таблицы попадает в текст
+    document = docx.Document()
+    document.add_paragraph("Договор поставки заключен в городе Москва.")
+    document.add_table(rows=1, cols=2).rows[0].cells[1].text = "Поставщик ООО «Ромашка»"
+    docx_path = tmp_path / "big.docx"
+    document.save(docx_path)
+    monkeypatch.setattr(pipeline.doc_reader, 'docx_engine', 'python-docx')
+    result = pipeline.process_document(docx_path)
+    assert 'Ромашка' in ' '.join(e['text'] for e in result['entities'])
+
+
+def test_jsonl_sink(tmp_path):
+    """Тестирует запись результатов в JSON Lines: строка на документ, дозапись при повторном запуске"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ: Приемник JSON Lines")
+    print("=" * 60)
+    
+    from output_sink import JsonLinesSink, document_id
+    
+    result = {'document': 'contract.txt', 'entities': [{'id': 0, 'text': 'ООО "Ромашка"', 'type': 'ORG'}]}
+    path = tmp_path / "results.jsonl"
+    for _ in range(2):
+        with JsonLinesSink(path) as sink:
+            sink.write(result, tmp_path / "contract.txt")
+    
+    lines = path.read_text(encoding='utf-8').splitlines()
+    assert len(lines) == 2
+    record = json.loads(lines[0])
+    assert record['document_id'] == document_id(tmp_path / "contract.txt")
+    assert record['entities'] == result['entities']
+
+
+def test_parquet_sink(tmp_path):
+    """Тестирует Parquet: каждая запись - законченная часть, повторный запуск не перезаписывает прежние"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ: Приемник Parquet")
+    print("=" * 60)
+    
+    import pyarrow.parquet as pq
+    from output_sink import ParquetSink
+    
+    result = {
+        'document': 'contract.txt',
+        'entities': [{'id': 0, 'text': 'ООО "Ромашка"', 'type': 'ORG'}],
+        'relations': [],
+        'relation_chains': [['Москва', 'связан_с', 'ООО "Ромашка"']],
+        'business_process': {
+            'category': 'Закупки', 'subprocess': 'Договоры', 'number': 83, 'confidence': 0.8,
+            'alternatives': [{'number': 84, 'category': 'Закупки', 'subprocess': 'Контроль', 'score': 3}],
+        },
+        'statistics': {'total_entities': 1, 'total_relations': 0, 'total_chains': 1, 'text_length': 100},
+    }
+    sink = ParquetSink(tmp_path)
+    sink.write(result, tmp_path / "contract.txt")
+    sink.flush()
+    # После flush часть читается, даже если приемник не закрыт (например, после падения в режиме --watch)
+    assert pq.read_table(tmp_path / "documents").num_rows == 1
+    sink.close()
+    
+    with ParquetSink(tmp_path) as sink:
+        sink.write(result, tmp_path / "contract.txt")
+    
+    documents = pq.read_table(tmp_path / "documents").to_pylist()
+    assert len(documents) == 2
+    assert documents[0]['alternatives'][0]['number'] == 84
+    assert pq.read_table(tmp_path / "chains").to_pylist()[0]['chain'] == result['relation_chains'][0]
+    assert sorted(p.name for p in (tmp_path / "entities").iterdir()) == ['part-00000.parquet', 'part-00001.parquet']
+
+
+def test_empty_document_batch(tmp_path):
+    """Тестирует, что пустой документ в батче сохраняется как ошибка, не мешая остальным"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ: Пустой документ в батче")
+    print("=" * 60)
+    
+    empty = tmp_path / "empty.txt"
+    empty.write_text("", encoding='utf-8')
+    output_path = tmp_path / "empty_result.json"
+    
+    pipeline = DocumentPipeline(use_cache=False, collect_metrics=True)
+    results = pipeline.process_and_save_batch([empty], [output_path])
+    print(f"  Результат: {results[0]}")
+    
+    assert results[0]['error'] == 'Документ пуст или не удалось извлечь текст'
+    assert json.loads(output_path.read_text(encoding='utf-8')) == results[0]
+
+
+def test_group_error_outcomes(tmp_path):
+    """Тестирует, что ошибка документа в main.py становится исходом файла, а не прерывает обработку"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ: Ошибки отдельных файлов")
+    print("=" * 60)
+    
+    from main import _process_group
+    
+    empty = tmp_path / "empty.txt"
+    empty.write_text("  \n", encoding='utf-8')
+    missing = tmp_path / "missing.docx"
+    pipeline = DocumentPipeline(use_cache=False)
+    group = [(empty, tmp_path / "empty_result.json"), (missing, tmp_path / "missing_result.json")]
+    
+    # Как в пуле воркеров: группа целиком, затем по одному файлу при исключении
+    for save in (True, False):
+        outcomes = _process_group(pipeline, group, save)
+        print(f"  Исходы: {[(path.name, error is None) for path, _, _, error in outcomes]}")
+        assert [path for path, _, _, _ in outcomes] == [empty, missing]
+        assert all(result is None and error for _, _, result, error in outcomes)
+        assert outcomes[0][3] == 'Документ пуст или не удалось извлечь текст'
+    
+    # Повтор по одному файлу не учитывает обращения к кэшу результатов из неудавшейся попытки
+    from result_cache import ResultCache
+    
+    good = tmp_path / "good.txt"
+    good.write_text("ООО «Ромашка» заключило договор поставки с АО «Вектор».", encoding='utf-8')
+    broken = tmp_path / "broken.pdf"
+    broken.write_bytes(b"not a pdf")
+    pipeline.result_cache = ResultCache(tmp_path / "cache.sqlite", "test")
+    outcomes = _process_group(pipeline, [(good, tmp_path / "good.json"), (broken, tmp_path / "broken.json")], False)
+    assert outcomes[0][2] is not None and outcomes[1][3]
+    assert (pipeline.result_cache.hits, pipeline.result_cache.misses) == (0, 2)
+
+
+def test_service_backpressure():
+    """Тестирует обратное давление сервиса: сверх max_in_flight документ сразу отклоняется, не начиная чтение"""
+    print("\n" + "=" * 60)
+    print("ТЕСТ: Обратное давление сервиса")
+    print("=" * 60)
+    
+    import asyncio
+    import threading
+    from service import DocumentService
+    
+    service = DocumentService(max_in_flight=1, threads=2)
+    started, release = threading.Event(), threading.Event()
+    prepared = []
+    prepare = service._prepare
+    
+    def blocking_prepare(*args):
+        prepared.append(args[0])
+        started.set()
+        release.wait(10)
+        return prepare(*args)
+    
+    service._prepare = blocking_prepare
+    body = json.dumps({'text': 'ООО «Ромашка» заключило договор поставки.', 'name': 'a.txt'}).encode('utf-8')
+    
+    async def scenario():
+        await service.start()
+        loop = asyncio.get_running_loop()
+        first = asyncio.create_task(service._route('POST', '/process', body))
+        await loop.run_in_executor(None, started.wait, 10)
+        rejected = await service._route('POST', '/process', body)
+        release.set()
+        return await first, rejected
+    
+    try:
+        (status, _), (rejected_status, _) = asyncio.run(scenario())
+    finally:
+        release.set()
+        service.close()
+    print(f"  Статусы: {status}, {rejected_status}")
+    assert (status, rejected_status) == (200, 503)
+    assert prepared == ['a.txt'] and service.stats['rejected'] == 1
+
+
 if __name__ == "__main__":
     print("Запуск тестов пайплайна...\n")
     
     # Тест извлечения текста
     test_text_extraction()
     
+    # Тест поиска ключевых слов
+    test_keyword_matcher()
+    
+    # Тест разметки с леммами
+    test_shared_annotation()
+    
+    # Тест метрик этапов
+    test_stage_metrics()
+    
     # Тест полного пайплайна
     test_single_document()
     
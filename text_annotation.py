@@ -0,0 +1,51 @@
+"""
+Модуль с общей морфологической разметкой текста для этапов пайплайна
+"""
+from typing import List, Tuple
+
+
+class TextAnnotation:
+    """Слова текста с леммами: строится один раз при NER и используется поиском связей и классификацией.
+    
+    spans[i] - (start, end) i-го слова в координатах текста, words[i] и lemmas[i] - слово
+    и его лемма в нижнем регистре (для слов без леммы лемма совпадает со словом).
+    """
+    
+    __slots__ = ('spans', 'words', 'lemmas')
+    
+    def __init__(self, spans: List[Tuple[int, int]], words: List[str], lemmas: List[str]):
+        self.spans = spans
+        self.words = words
+        self.lemmas = lemmas
+    
+    @classmethod
+    def from_tokens(cls, tokens) -> 'TextAnnotation':
+        """Строит разметку из (start, end, слово, лемма); знаки препинания отбрасываются"""
+        spans = []
+        words = []
+        lemmas = []
+        for start, end, word, lemma in tokens:
+            if not any(char.isalnum() for char in word):
+                continue
+            word = word.lower()
+            spans.append((start, end))
+            words.append(word)
+            lemmas.append(lemma.lower() if lemma else word)
+        return cls(spans, words, lemmas)
+    
+    @classmethod
+    def merge(cls, chunks: List[Tuple[int, int]], annotations: List['TextAnnotation']) -> 'TextAnnotation':
+        """Склеивает разметку чанков в разметку документа; слова из перекрытия чанков берутся один раз"""
+        spans = []
+        words = []
+        lemmas = []
+        covered = 0  # Конец последнего взятого слова в координатах документа
+        for (chunk_start, _), annotation in zip(chunks, annotations):
+            for i, (start, end) in enumerate(annotation.spans):
+                if chunk_start + start < covered:
+                    continue
+                spans.append((chunk_start + start, chunk_start + end))
+                words.append(annotation.words[i])
+                lemmas.append(annotation.lemmas[i])
+                covered = chunk_start + end
+        return cls(spans, words, lemmas)
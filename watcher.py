@@ -0,0 +1,195 @@
+"""
+Модуль для отслеживания новых и измененных документов в директории (inotify или опрос)
+"""
+import ctypes
+import ctypes.util
+import json
+import os
+import select
+import struct
+import sys
+import time
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from result_cache import file_hash
+
+
+SUPPORTED_SUFFIXES = ('.docx', '.pdf', '.txt')
+
+# Константы inotify (linux/inotify.h)
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+EVENT_HEADER = struct.Struct('iIII')
+
+
+def is_document(path: Path) -> bool:
+    """Поддерживаемый документ (временные файлы редакторов вида ~$file.docx пропускаются)"""
+    return path.suffix.lower() in SUPPORTED_SUFFIXES and not path.name.startswith(('~$', '.'))
+
+
+def _signature(path: Path) -> Optional[Tuple[int, int]]:
+    """(mtime_ns, размер) файла или None, если файла нет"""
+    try:
+        stat = path.stat()
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class Manifest:
+    """Манифест обработанных файлов: mtime, размер и хэш содержимого каждого файла"""
+    
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.entries: Dict[str, Dict] = {}
+        if self.path.exists():
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+    
+    def changed_hash(self, file_path: Path) -> Optional[str]:
+        """Хэш содержимого, если файл новый или изменился с последней обработки, иначе None.
+        
+        Файлы с прежними mtime и размером не читаются; у файла с новым mtime, но прежним
+        содержимым (например, после touch) обновляется только mtime.
+        """
+        signature = _signature(file_path)
+        if signature is None:
+            return None
+        entry = self.entries.get(str(file_path))
+        if entry is not None and (entry['mtime_ns'], entry['size']) == signature:
+            return None
+        
+        digest = file_hash(file_path)
+        if entry is not None and entry['hash'] == digest:
+            entry['mtime_ns'], entry['size'] = signature
+            return None
+        return digest
+    
+    def record(self, file_path: Path, digest: str):
+        """Отмечает файл обработанным"""
+        signature = _signature(file_path)
+        if signature is not None:
+            self.entries[str(file_path)] = {'mtime_ns': signature[0], 'size': signature[1], 'hash': digest}
+    
+    def save(self):
+        """Сохраняет манифест (атомарно, через временный файл)"""
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = self.path.with_suffix('.tmp')
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, ensure_ascii=False, indent=2)
+        tmp_path.replace(self.path)
+
+
+class _Inotify:
+    """Минимальная обертка над inotify через libc (только Linux)"""
+    
+    def __init__(self, dir_path: Path):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1')
+        mask = IN_CLOSE_WRITE | IN_MOVED_TO | IN_CREATE | IN_MODIFY
+        if libc.inotify_add_watch(self.fd, os.fsencode(dir_path), mask) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, 'inotify_add_watch')
+    
+    def read(self, timeout: float) -> Set[str]:
+        """Имена файлов, по которым пришли события за время ожидания"""
+        names = set()
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return names
+        data = os.read(self.fd, 64 * 1024)
+        offset = 0
+        while offset < len(data):
+            _, _, _, length = EVENT_HEADER.unpack_from(data, offset)
+            offset += EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if name:
+                names.add(os.fsdecode(name))
+        return names
+    
+    def close(self):
+        os.close(self.fd)
+
+
+class DirectoryWatcher:
+    """Отслеживает документы в директории: inotify на Linux, иначе периодический опрос.
+    
+    Файл выдается после того, как его размер и mtime не менялись debounce секунд,
+    поэтому документ, который еще копируется или сохраняется, не обрабатывается наполовину.
+    """
+    
+    def __init__(self, dir_path: Path, debounce: float = 2.0, poll_interval: float = 1.0,
+                 use_inotify: bool = True):
+        self.dir_path = Path(dir_path)
+        self.debounce = debounce
+        self.poll_interval = poll_interval
+        self.inotify = None
+        if use_inotify and sys.platform.startswith('linux'):
+            try:
+                self.inotify = _Inotify(self.dir_path)
+            except (OSError, AttributeError):
+                self.inotify = None
+        self._snapshot = self._scan()
+    
+    @property
+    def mode(self) -> str:
+        return 'inotify' if self.inotify is not None else 'опрос'
+    
+    def _scan(self) -> Dict[Path, Tuple[int, int]]:
+        snapshot = {}
+        for path in self.dir_path.iterdir():
+            if is_document(path):
+                signature = _signature(path)
+                if signature is not None:
+                    snapshot[path] = signature
+        return snapshot
+    
+    def _wait(self, timeout: float) -> Set[Path]:
+        """Файлы, которые могли измениться за время ожидания"""
+        if self.inotify is not None:
+            return {
+                path for path in (self.dir_path / name for name in self.inotify.read(timeout))
+                if is_document(path)
+            }
+        
+        time.sleep(timeout)
+        snapshot = self._scan()
+        changed = {path for path, signature in snapshot.items() if self._snapshot.get(path) != signature}
+        self._snapshot = snapshot
+        return changed
+    
+    def changes(self) -> Iterator[List[Path]]:
+        """Бесконечно выдает группы новых или измененных файлов, запись которых завершилась"""
+        pending = {}  # Путь -> (сигнатура, время последнего изменения)
+        while True:
+            timeout = self.poll_interval if not pending else min(self.poll_interval, self.debounce)
+            changed = self._wait(timeout)
+            now = time.monotonic()
+            for path in changed:
+                pending[path] = (_signature(path), now)
+            
+            ready = []
+            for path, (signature, changed_at) in list(pending.items()):
+                current = _signature(path)
+                if current is None:
+                    del pending[path]
+                elif current != signature:
+                    pending[path] = (current, now)
+                elif now - changed_at >= self.debounce:
+                    ready.append(path)
+                    del pending[path]
+            
+            if ready:
+                yield sorted(ready)
+    
+    def close(self):
+        if self.inotify is not None:
+            self.inotify.close()
+            self.inotify = None